@@ -0,0 +1,72 @@
+# --- SET UP --- #
+"""
+This script backfills historical NBA API team and player game logs
+for any date range, resuming from its state file if interrupted, then
+rebuilds the beat rate analytics.
+
+Usage:
+    python backfill_data.py 2018-10-01 2023-06-30
+"""
+# Load libraries
+import argparse
+import os
+import warnings
+
+from functions.analytics_functions import refresh_nba_beat_rate_analytics
+from functions.archive_functions import compact_archive, configure_archive
+from functions.backfill_functions import run_backfill
+from functions.db_functions import configure_db_pool, run_db_stage
+from functions.http_functions import configure_response_cache
+from functions.nba_api_functions import NBA_HEADER_DATA
+
+warnings.filterwarnings("ignore")
+
+# Parse args
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("date_from", help="Date from, format 'YYYY-MM-DD'")
+parser.add_argument("date_to", help="Date to, format 'YYYY-MM-DD'")
+parser.add_argument("--state-file", default="backfill_state.json")
+parser.add_argument("--workers", type=int, default=4)
+parser.add_argument("--requests-per-second", type=float, default=1.0)
+parser.add_argument("--max-requests-per-second", type=float, default=4.0)
+parser.add_argument("--shard-days", type=int, default=7)
+parser.add_argument("--chunk-size", type=int, default=10000)
+args = parser.parse_args()
+
+# Cache API responses on disk, completed shards are never refetched
+configure_response_cache(
+    os.environ.get("RESPONSE_CACHE_DIR", ".cache/http"),
+    offline=os.environ.get("RESPONSE_CACHE_OFFLINE") == "1",
+)
+
+# Set up SQL connection pool from DATABASE_URL
+configure_db_pool(maxconn=1)
+##
+
+# Archive backfilled game logs to Parquet too when ARCHIVE_DIR is set
+archive_dir = os.environ.get("ARCHIVE_DIR")
+if archive_dir:
+    configure_archive(archive_dir)
+
+# --- BACKFILL DATA --- #
+# A dropped connection resumes from the state file on a new connection
+run_db_stage(
+    run_backfill,
+    NBA_HEADER_DATA,
+    args.date_from,
+    args.date_to,
+    args.state_file,
+    max_workers=args.workers,
+    requests_per_second=args.requests_per_second,
+    shard_days=args.shard_days,
+    chunk_size=args.chunk_size,
+    max_requests_per_second=args.max_requests_per_second,
+)
+
+# Backfilled games are older than the last refresh, so rebuild outcomes
+# and beat rates instead of refreshing incrementally
+run_db_stage(refresh_nba_beat_rate_analytics, full=True)
+
+# Shards add a file per month partition, merge them into one per month
+if archive_dir:
+    compact_archive()
@@ -0,0 +1,206 @@
+"""
+Benchmark reading game logs from the Parquet archive
+
+Archives synthetic player and team game logs for --seasons regular
+seasons in weekly windows like ingestion, compacts them, checks the
+archive matches the rows written, then times loading every season, a
+few columns, and one month. With DATABASE_URL set, the same logs are
+written to Postgres and pd.read_sql of the whole table is timed too.
+
+Usage (from the repo root):
+    python -m dev.bench_archive --seasons 3
+    DATABASE_URL=postgresql://... python -m dev.bench_archive
+"""
+# Import packages
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+import warnings
+from datetime import date
+import pandas as pd
+from functions import archive_functions
+from functions.archive_functions import (
+    archive_game_logs,
+    compact_archive,
+    configure_archive,
+    read_archive,
+)
+from functions.db_functions import configure_db_pool, pooled_connection
+from functions.nba_api_functions import (
+    split_date_range,
+    write_nba_api_game_logs,
+)
+from dev.synthetic_payloads import get_game_log_payload
+
+warnings.filterwarnings("ignore")
+
+# Parse args
+parser = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+)
+parser.add_argument("--seasons", type=int, default=3)
+parser.add_argument("--repeat", type=int, default=5)
+parser.add_argument("--archive-dir", help="Default a temporary directory")
+args = parser.parse_args()
+
+
+# Functions
+def time_read(label, func):
+    """
+    Function to time a read, best of args.repeat runs
+    """
+    timings = []
+    for _ in range(args.repeat):
+        read_start = time.perf_counter()
+        df = func()
+        timings.append(time.perf_counter() - read_start)
+    print(
+        label
+        + ": "
+        + str(len(df))
+        + " rows x "
+        + str(len(df.columns))
+        + " columns in "
+        + str(round(min(timings), 3))
+        + "s"
+    )
+
+
+archive_dir = args.archive_dir or tempfile.mkdtemp()
+configure_archive(archive_dir)
+if "DATABASE_URL" in os.environ:
+    configure_db_pool()
+
+# Regular seasons ending in 2023, 2022, ...
+seasons = [
+    (date(2023 - x, 10, 18), date(2024 - x, 4, 9))
+    for x in range(args.seasons, 0, -1)
+]
+
+# Archive (and write) weekly windows, like ingestion and backfill
+rows = 0
+start_time = time.perf_counter()
+for season_from, season_to in seasons:
+    for window_from, window_to in split_date_range(season_from, season_to):
+        result_sets = {
+            (entity, measure_type): tuple(
+                get_game_log_payload(
+                    entity, measure_type, window_from, window_to
+                )["resultSets"][0][x]
+                for x in ("headers", "rowSet")
+            )
+            for entity in ("team", "player")
+            for measure_type in ("Advanced", "")
+        }
+        for entity in ("team", "player"):
+            rows += archive_game_logs(
+                entity,
+                [result_sets[(entity, "Advanced")]],
+                [result_sets[(entity, "")]],
+            )
+            if "DATABASE_URL" in os.environ:
+                with pooled_connection() as con, contextlib.redirect_stdout(
+                    io.StringIO()
+                ):
+                    write_nba_api_game_logs(
+                        con,
+                        entity,
+                        result_sets[(entity, "Advanced")],
+                        result_sets[(entity, "")],
+                    )
+print(
+    "Archived "
+    + str(rows)
+    + " rows in "
+    + str(round(time.perf_counter() - start_time, 2))
+    + "s"
+)
+
+start_time = time.perf_counter()
+compact_archive()
+print("Compacted in " + str(round(time.perf_counter() - start_time, 2)) + "s")
+
+# Re-archiving a window supersedes its rows rather than duplicating
+# them, compacting on write drops the superseded versions
+player_logs = read_archive("nba_api_player_game_logs")
+archive_functions.ARCHIVE_COMPACT_FILES = 0
+first_window = split_date_range(*seasons[0])[0]
+archive_game_logs(
+    "player",
+    *(
+        [
+            tuple(
+                get_game_log_payload(
+                    "player", measure_type, *first_window
+                )["resultSets"][0][x]
+                for x in ("headers", "rowSet")
+            )
+        ]
+        for measure_type in ("Advanced", "")
+    ),
+)
+assert len(
+    read_archive("nba_api_player_game_logs", latest=False)
+) == len(player_logs)
+assert player_logs["gameId"].nunique() * 26 == len(player_logs)
+print(
+    "Archive size: "
+    + str(
+        round(
+            sum(
+                os.path.getsize(os.path.join(root, x))
+                for root, _, files in os.walk(archive_dir)
+                for x in files
+            )
+            / 1024
+            / 1024,
+            2,
+        )
+    )
+    + " MB"
+)
+
+# Reads
+time_read(
+    "Player logs, every season",
+    lambda: read_archive("nba_api_player_game_logs"),
+)
+time_read(
+    "Player logs, every season, versions kept",
+    lambda: read_archive("nba_api_player_game_logs", latest=False),
+)
+time_read(
+    "Player logs, 4 columns",
+    lambda: read_archive(
+        "nba_api_player_game_logs",
+        ["gameId", "playerId", "gameDate", "min"],
+    ),
+)
+time_read(
+    "Player logs, one month",
+    lambda: read_archive(
+        "nba_api_player_game_logs",
+        date_from=date(seasons[-1][0].year, 12, 1),
+        date_to=date(seasons[-1][0].year, 12, 31),
+    ),
+)
+time_read(
+    "Team logs, every season",
+    lambda: read_archive("nba_api_team_game_logs"),
+)
+
+if "DATABASE_URL" in os.environ:
+
+    def read_sql():
+        """
+        Function to load the whole table like the notebooks do
+        """
+        with pooled_connection() as read_con:
+            return pd.read_sql(
+                "SELECT * FROM nba_api_player_game_logs", read_con
+            )
+
+    time_read("pd.read_sql player logs", read_sql)
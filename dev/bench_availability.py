@@ -0,0 +1,176 @@
+"""
+Benchmark the player availability matrix on a synthetic league-season
+
+Builds 30 teams x 82 games x 17 players of minutes with random absences
+and outcomes, loads them into PlayerAvailability day by day, checks one
+player's split against a plain pandas groupby, then times the queries.
+
+Usage (from the repo root):
+    python -m dev.bench_availability
+"""
+# Import packages
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from functions.availability_functions import PlayerAvailability
+
+# Parse args
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--teams", type=int, default=30)
+parser.add_argument("--games", type=int, default=82)
+parser.add_argument("--players", type=int, default=17)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--player", type=int, default=101, help="Player to check")
+args = parser.parse_args()
+
+
+def get_season(rng): #pylint: disable=too-many-locals
+    """
+    Function to build a season of player minutes and team outcomes
+    """
+    minutes_rows = []
+    outcome_rows = []
+    team_ids = np.arange(1, args.teams + 1)
+    game_number = 0
+    for day in range(args.games * 2):
+        game_date = pd.Timestamp("2022-10-18") + pd.Timedelta(days=day)
+
+        # Half the league plays each day
+        for away, home in rng.permutation(team_ids).reshape(-1, 2)[
+            : args.teams // 4
+        ]:
+            game_number += 1
+            game_id = "00222" + str(game_number).zfill(5)
+            cover = rng.random() < 0.5
+            for team_id, opponent_id, team_cover in (
+                (home, away, cover),
+                (away, home, not cover),
+            ):
+                # Players 0-9 are rotation, each sits ~10% of games
+                for player in range(args.players):
+                    base_minutes = 34 - 2 * player if player < 10 else 6
+                    if rng.random() < (0.1 if player < 10 else 0.4):
+                        continue
+                    minutes_rows.append(
+                        (
+                            game_id,
+                            team_id,
+                            opponent_id,
+                            game_date.date(),
+                            team_id * 100 + player,
+                            max(1.0, base_minutes + rng.normal(0, 4)),
+                        )
+                    )
+                outcome_rows.append(
+                    (game_id, team_id, float(team_cover), np.nan, 1.0)
+                )
+
+    minutes_df = pd.DataFrame(
+        minutes_rows,
+        columns=[
+            "gameId",
+            "teamId",
+            "opponentTeamId",
+            "gameDate",
+            "playerId",
+            "min",
+        ],
+    )
+    outcomes_df = pd.DataFrame(
+        outcome_rows,
+        columns=["gameId", "teamId", "atsCover", "overHit", "moneylineWin"],
+    )
+
+    return minutes_df, outcomes_df
+
+
+season_minutes_df, season_outcomes_df = get_season(
+    np.random.default_rng(args.seed)
+)
+
+# Build incrementally, one game date at a time like daily ingestion
+availability = PlayerAvailability()
+start_time = time.perf_counter()
+for _, day_df in season_minutes_df.groupby("gameDate"):
+    availability.add_player_minutes(day_df)
+build_time = time.perf_counter() - start_time
+availability.add_outcomes(season_outcomes_df)
+print(
+    "Built "
+    + str(availability.minutes.shape)
+    + " matrix ("
+    + str(round(availability.minutes.nbytes / 1024 / 1024, 2))
+    + " MB) from "
+    + str(len(season_minutes_df))
+    + " logs in "
+    + str(round(build_time, 3))
+    + "s"
+)
+
+# Check one player against pandas: team-games they missed between their
+# first and last game, joined to outcomes
+player_games = season_minutes_df[season_minutes_df["playerId"] == args.player]
+team_games = season_minutes_df[
+    season_minutes_df["teamId"] == args.player // 100
+].drop_duplicates("gameId")
+team_games = team_games[
+    team_games["gameDate"].between(
+        player_games["gameDate"].min(), player_games["gameDate"].max()
+    )
+]
+missed = team_games[~team_games["gameId"].isin(player_games["gameId"])]
+expected = missed.merge(season_outcomes_df, on=["gameId", "teamId"])[
+    "atsCover"
+].mean()
+rate, games = availability.get_beat_rate(
+    availability.get_player_out_rows(args.player)
+)
+print(
+    "Player "
+    + str(args.player)
+    + " out: "
+    + str(games)
+    + " games, cover "
+    + str(round(rate, 4))
+    + " (pandas "
+    + str(round(expected, 4))
+    + ")"
+)
+assert np.isclose(rate, expected)
+
+
+def time_query(label, func, repeat=100):
+    """
+    Function to time a query, best of repeat runs
+    """
+    timings = []
+    for _ in range(repeat):
+        query_start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - query_start)
+    print(label + ": " + str(round(min(timings) * 1000, 3)) + " ms")
+
+
+# Rotation is cached after the first query, time it cold too
+availability.rotation_cache = {}
+time_query("Rotation matrix (cold)", availability.get_rotation, repeat=1)
+time_query(
+    "One player out",
+    lambda: availability.get_beat_rate(
+        availability.get_player_out_rows(args.player)
+    ),
+)
+time_query(
+    "Opponent's player out",
+    lambda: availability.get_beat_rate(
+        availability.get_opponent_rows(
+            availability.get_player_out_rows(args.player)
+        )
+    ),
+)
+time_query(
+    "Every player out/in",
+    availability.get_beat_rates_when_out,
+    repeat=10,
+)
@@ -0,0 +1,359 @@
+"""
+Benchmark backtesting a grid of strategy variants over several seasons
+
+Builds --seasons synthetic NBA seasons of team-game lines at open and
+close, final scores and players out, then backtests every market, entry
+and filter combination of a grid (~8,000 strategies) in this process and
+across --processes worker processes, and checks --check-strategies of
+them against backtesting one bet at a time in Python.
+
+Usage (from the repo root):
+    python -m dev.bench_backtest --seasons 3
+"""
+# Import packages
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+from functions.backtest_functions import (
+    BACKTEST_MARKETS,
+    BACKTEST_OPERATORS,
+    BACKTEST_PRICE_COLUMNS,
+    Backtest,
+    get_strategy_grid,
+    sweep_strategies,
+)
+from functions.odds_functions import (
+    add_fair_odds,
+    american_to_decimal,
+    prob_to_american,
+)
+
+# Parse args
+parser = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+)
+parser.add_argument("--seasons", type=int, default=3)
+parser.add_argument("--processes", type=int, default=os.cpu_count())
+parser.add_argument("--check-strategies", type=int, default=40)
+args = parser.parse_args()
+
+# Filter options swept for every market and entry
+FILTER_GRID = {
+    "teamType": [None, ("==", "Home"), ("==", "Away")],
+    "spreadLine": [
+        None,
+        (">", 3),
+        (">", 5),
+        (">", 7),
+        ("<", -3),
+        ("<", -5),
+        ("<", -7),
+    ],
+    "opponentTopPlayersOut": [None, (">=", 1)],
+    "topPlayersOut": [None, ("==", 0)],
+    "season": [None] + [("==", 2021 + x) for x in range(args.seasons)],
+    "totalPointsLine": [None, (">", 230), ("<", 220)],
+}
+
+
+# Functions
+def get_prices(rng, fair_prob, hold: float = 0.045):
+    """
+    Function to price both sides of two-way markets with hold and noise
+    Returns:
+    odds_a (array): American odds of the side with fair_prob
+    odds_b (array): American odds of the other side
+    """
+    fair_prob = np.clip(
+        fair_prob + rng.normal(0, 0.02, len(fair_prob)), 0.03, 0.97
+    )
+    return (
+        np.round(prob_to_american(fair_prob * (1 + hold))),
+        np.round(prob_to_american((1 - fair_prob) * (1 + hold))),
+    )
+
+
+def get_lines(rng, home_spread, total):
+    """
+    Function to get both team rows' lines and prices of each game
+    Returns:
+    lines (dict): column -> (home values, away values)
+    """
+    home_win_prob = 1 / (1 + np.exp(home_spread * 0.15))
+    home_moneyline, away_moneyline = get_prices(rng, home_win_prob)
+    home_spread_odds, away_spread_odds = get_prices(
+        rng, np.full_like(home_spread, 0.5)
+    )
+    over, under = get_prices(rng, np.full_like(total, 0.5))
+
+    return {
+        "oddsMoneyline": (home_moneyline, away_moneyline),
+        "oddsSpread": (home_spread_odds, away_spread_odds),
+        "spreadLine": (home_spread, -home_spread),
+        "totalPointsLine": (total, total),
+        "oddsOver": (over, over),
+        "oddsUnder": (under, under),
+    }
+
+
+def get_synthetic_backtest_df( #pylint: disable=too-many-locals
+    n_seasons: int, seed: int = 0
+):
+    """
+    Function to get BACKTEST_QUERY-like rows plus players out for
+    n_seasons of 1,230 games, starting with 2021-22
+    """
+    rng = np.random.default_rng(seed)
+    n_games = 1230 * n_seasons
+    season_days = rng.integers(0, 170, n_games)
+    game_dates = (
+        np.datetime64("2021-10-19")
+        + np.repeat(np.arange(n_seasons) * 365, 1230)
+        + season_days
+    ).astype("datetime64[D]")
+    home_team = rng.integers(0, 30, n_games)
+    away_team = (home_team + rng.integers(1, 30, n_games)) % 30
+
+    # Closing lines, opening lines a few half points away
+    home_spread = np.round(rng.normal(-2.5, 6.5, n_games) * 2) / 2
+    total = np.round(rng.normal(226, 8, n_games) * 2) / 2
+    moves = [-1, -0.5, 0, 0.5, 1]
+    move_probs = [0.1, 0.2, 0.4, 0.2, 0.1]
+    close = get_lines(rng, home_spread, total)
+    opening = get_lines(
+        rng,
+        home_spread + rng.choice(moves, n_games, p=move_probs),
+        total + rng.choice(moves, n_games, p=move_probs),
+    )
+
+    # Scores around the closing lines
+    margin = np.round(-home_spread + rng.normal(0, 12, n_games))
+    points = np.round(total + rng.normal(0, 18, n_games))
+    home_pts = np.ceil((points + margin) / 2)
+    away_pts = home_pts - margin
+
+    # Players out, opponent's from the other team's row
+    players_out = rng.poisson(1.0, (2, n_games))
+    top_out = (rng.random((2, n_games)) < 0.1).astype(int)
+
+    frames = []
+    for side, team_type in enumerate(("Home", "Away")):
+        teams = (home_team, away_team)
+        points_for = (home_pts, away_pts)
+        frames.append(
+            pd.DataFrame(
+                {
+                    "eventId": np.arange(n_games),
+                    "teamType": team_type,
+                    "gameId": ["00" + str(x) for x in range(n_games)],
+                    "gameDate": game_dates,
+                    "teamId": teams[side],
+                    "opponentTeamId": teams[1 - side],
+                    "pts": points_for[side],
+                    "opponentPts": points_for[1 - side],
+                    "hasHistory": rng.random(n_games) < 0.85,
+                    "playersOut": players_out[side],
+                    "topPlayersOut": top_out[side],
+                    "opponentPlayersOut": players_out[1 - side],
+                    "opponentTopPlayersOut": top_out[1 - side],
+                    **{col: x[side] for col, x in close.items()},
+                    **{
+                        "open" + col[0].upper() + col[1:]: x[side]
+                        for col, x in opening.items()
+                    },
+                }
+            )
+        )
+    backtest_df = pd.concat(frames, ignore_index=True)
+
+    # Fair odds at close and open
+    fair_cols = [x for x in BACKTEST_PRICE_COLUMNS if x not in close]
+    backtest_df[fair_cols] = add_fair_odds(backtest_df)[fair_cols]
+    open_cols = ["open" + x[0].upper() + x[1:] for x in close]
+    backtest_df[["open" + x[0].upper() + x[1:] for x in fair_cols]] = (
+        add_fair_odds(
+            backtest_df.drop(columns=list(close)).rename(
+                columns=dict(zip(open_cols, close))
+            )
+        )[fair_cols]
+    )
+
+    return backtest_df
+
+
+def backtest_one( #pylint: disable=too-many-locals
+    team_games: list, strategy: dict
+):
+    """
+    Function to backtest one strategy one bet at a time
+    Args:
+    team_games (list): team-game dicts, in game date order
+    strategy (dict): strategy dict
+    Returns:
+    metrics (dict): bets, wins, pushes, profit, clv and maxDrawdown
+    """
+    entry = strategy["entry"]
+    market = strategy["market"]
+
+    def get(record, col):
+        if entry == "open" and col in BACKTEST_PRICE_COLUMNS:
+            col = "open" + col[0].upper() + col[1:]
+        return record[col]
+
+    bets = wins = pushes = clv_bets = 0
+    profit = peak = max_drawdown = clv_total = 0.0
+    for record in team_games:
+        if not all(
+            BACKTEST_OPERATORS[op](get(record, col), value)
+            for col, op, value in strategy["filters"]
+        ):
+            continue
+        if market in ("over", "under") and record["teamType"] != "Home":
+            continue
+
+        margin = record["pts"] - record["opponentPts"]
+        if market == "moneyline":
+            odds, result = get(record, "oddsMoneyline"), margin
+            fair, push_prob, line_col = record["fairMoneyline"], 0, None
+        elif market == "spread":
+            odds = get(record, "oddsSpread")
+            result = margin + get(record, "spreadLine")
+            fair, push_prob = record["fairSpread"], record["pushSpread"]
+            line_col = "spreadLine"
+        else:
+            odds = get(record, "odds" + market.title())
+            result = (
+                record["pts"]
+                + record["opponentPts"]
+                - get(record, "totalPointsLine")
+            ) * (1 if market == "over" else -1)
+            push_prob = record["pushTotal"]
+            fair = (
+                record["fairOver"]
+                if market == "over"
+                else 1 - record["fairOver"] - push_prob
+            )
+            line_col = "totalPointsLine"
+        if np.isnan(odds):
+            continue
+
+        decimal = float(american_to_decimal(odds))
+        bets += 1
+        if result > 0:
+            wins += 1
+            profit += decimal - 1
+        elif result == 0:
+            pushes += 1
+        else:
+            profit -= 1
+        peak = max(peak, profit)
+        max_drawdown = max(max_drawdown, peak - profit)
+
+        if (
+            record["hasHistory"]
+            and not np.isnan(fair)
+            and (line_col is None or get(record, line_col) == record[line_col])
+        ):
+            clv_bets += 1
+            clv_total += fair * decimal + push_prob - 1
+
+    return {
+        "bets": bets,
+        "wins": wins,
+        "pushes": pushes,
+        "profit": profit,
+        "clv": clv_total / clv_bets if clv_bets else np.nan,
+        "maxDrawdown": max_drawdown,
+    }
+
+
+# Team-games and strategies
+load_start = time.perf_counter()
+synthetic_df = get_synthetic_backtest_df(args.seasons)
+backtest = Backtest(synthetic_df)
+load_seconds = time.perf_counter() - load_start
+strategies = [
+    x
+    for market in BACKTEST_MARKETS
+    for entry in ("open", "close")
+    for x in get_strategy_grid(market, FILTER_GRID, entry)
+]
+
+# In this process, caches cold
+evaluate_start = time.perf_counter()
+metrics_df = backtest.evaluate(strategies)
+evaluate_seconds = time.perf_counter() - evaluate_start
+
+# Across processes
+sweep_start = time.perf_counter()
+sweep_df = sweep_strategies(
+    backtest,
+    strategies,
+    processes=args.processes,
+    chunk_size=len(strategies) // args.processes + 1,
+)
+sweep_seconds = time.perf_counter() - sweep_start
+pd.testing.assert_frame_equal(sweep_df, metrics_df)
+
+# Same metrics one bet at a time, for a spread of strategies
+records = (
+    synthetic_df.assign(
+        season=lambda x: x["gameDate"].dt.year
+        - (x["gameDate"].dt.month < 8)
+    )
+    .sort_values(["gameDate", "eventId", "teamType"], kind="stable")
+    .to_dict("records")
+)
+loop_start = time.perf_counter()
+check_rows = np.linspace(
+    0, len(strategies) - 1, args.check_strategies
+).astype(int)
+for row in check_rows:
+    expected = backtest_one(records, strategies[row])
+    for metric, value in expected.items():
+        assert np.isclose(
+            metrics_df[metric].iloc[row], value, equal_nan=True
+        ), (strategies[row], metric, metrics_df[metric].iloc[row], value)
+loop_seconds = (time.perf_counter() - loop_start) / len(check_rows)
+
+print(
+    str(len(backtest))
+    + " team-games over "
+    + str(args.seasons)
+    + " seasons built in "
+    + str(round(load_seconds, 2))
+    + "s"
+)
+print(
+    str(len(strategies))
+    + " strategies: "
+    + str(round(evaluate_seconds, 2))
+    + "s in process, "
+    + str(round(sweep_seconds, 2))
+    + "s across "
+    + str(args.processes)
+    + " processes, one bet at a time est. "
+    + str(round(loop_seconds * len(strategies), 1))
+    + "s ("
+    + str(round(loop_seconds * len(strategies) / evaluate_seconds))
+    + "x)"
+)
+
+# Home dogs of more than 5 points with the opponent's top player out
+print(
+    backtest.evaluate(
+        [
+            {
+                "name": "home dogs > +5, opponent's top player out",
+                "market": "spread",
+                "filters": [
+                    ("teamType", "==", "Home"),
+                    ("spreadLine", ">", 5),
+                    ("opponentTopPlayersOut", ">=", 1),
+                ],
+            }
+        ]
+    ).to_string(index=False)
+)
@@ -0,0 +1,294 @@
+"""
+Benchmark a multi-book refresh and the best price / arbitrage / middles
+scan
+
+Starts one local fixture server per book, each serving synthetic
+DraftKings-format eventgroups for every league with the book's own
+prices and some lines moved half a point, and refreshes --books
+adapters concurrently into a BookOddsAggregator like the ingest
+pipeline does. Then scans --scale-books books x --scale-events events
+of the same kind, best of --repeat, and checks the scan against
+per-game Python. With DATABASE_URL set, the fixture refresh is also
+written to book_team_odds.
+
+Usage (from the repo root):
+    python -m dev.bench_book_scan
+    DATABASE_URL=postgresql://... python -m dev.bench_book_scan --books 6
+"""
+# Import packages
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import random
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from functions import book_functions
+from functions.book_functions import (
+    BookOddsAggregator,
+    DraftKingsAdapter,
+    create_book_odds_df,
+    scan_book_odds,
+    update_book_odds,
+)
+from functions.db_functions import configure_db_pool, pooled_connection
+from functions.dk_api_functions import (
+    DK_LEAGUES,
+    create_nba_team_odds_wide_df,
+    parse_team_odds,
+)
+from functions.odds_functions import american_to_decimal, decimal_to_american
+from dev.replay_server import start_replay_server
+from dev.synthetic_payloads import (
+    format_american,
+    get_dk_eventgroup_payload,
+    get_spread_label,
+)
+
+warnings.filterwarnings("ignore")
+
+# Parse args
+parser = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+)
+parser.add_argument("--books", type=int, default=4)
+parser.add_argument("--scale-books", type=int, default=10)
+parser.add_argument("--scale-events", type=int, default=1000)
+parser.add_argument("--repeat", type=int, default=5)
+args = parser.parse_args()
+
+
+# Functions
+def get_book_payload(league: str, n_events: int, seed: int):
+    """
+    Function to get a league's eventgroup as one book prices it: every
+    price moved up to ~3% and a fifth of spreads and totals moved half a
+    point
+    """
+    config = DK_LEAGUES[league]
+    payload = get_dk_eventgroup_payload(
+        n_events,
+        eventgroup_id=config["eventgroup_id"],
+        subcategory_id=config["subcategory_ids"][0],
+        spread_label=get_spread_label(config),
+    )
+    payload = copy.deepcopy(payload)
+    rng = random.Random(seed)
+    offer_subcategory = payload["eventGroup"]["offerCategories"][0][
+        "offerSubcategoryDescriptors"
+    ][0]["offerSubcategory"]
+    for event_offers in offer_subcategory["offers"]:
+        for offer in event_offers:
+            shift = rng.choice([-0.5, 0, 0, 0, 0.5])
+            for side, outcome in enumerate(offer["outcomes"]):
+                price = american_to_decimal(
+                    float(outcome["oddsAmerican"])
+                ) * rng.uniform(0.97, 1.03)
+                outcome["oddsAmerican"] = format_american(
+                    int(round(float(decimal_to_american(price))))
+                )
+                # Spreads stay mirrored, totals move together
+                if "line" in outcome:
+                    outcome["line"] += (
+                        shift
+                        if offer["label"] == "Total" or side == 1
+                        else -shift
+                    )
+
+    return payload
+
+
+def get_scale_odds(n_books: int, n_events: int):
+    """
+    Function to get n_books books' odds for one n_events NBA slate,
+    without fetching
+    """
+    frames = []
+    for book in range(n_books):
+        payload = get_book_payload("NBA", n_events, book)["eventGroup"]
+        events = [
+            x for x in payload["events"] if x["teamName1"] != x["teamName2"]
+        ]
+        game_df = pd.DataFrame(
+            {
+                "eventId": [int(x["eventId"]) for x in events],
+                "startDate": pd.Timestamp("2023-01-01", tz="UTC"),
+                "leagueSlug": "NBA",
+                "awayTeamName": [x["teamName1"] for x in events],
+                "homeTeamName": [x["teamName2"] for x in events],
+                # Distinct games per event in the scaled slate
+                "awayTeamSlug": ["A" + str(i) for i in range(len(events))],
+                "homeTeamSlug": ["H" + str(i) for i in range(len(events))],
+            }
+        )
+        team_odds_df = create_nba_team_odds_wide_df(
+            game_df,
+            parse_team_odds(
+                payload["offerCategories"][0]["offerSubcategoryDescriptors"][
+                    0
+                ],
+                DK_LEAGUES["NBA"]["offer_labels"],
+            ),
+        )
+        frames.append(
+            create_book_odds_df("book" + str(book), game_df, team_odds_df)
+        )
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def scan_per_game(book_odds_df):
+    """
+    Function to find the best moneylines and moneyline arbitrage one game
+    and book at a time
+    Returns:
+    best (dict): (homeTeamSlug, teamType) -> best decimal moneyline
+    arbitrage (set): homeTeamSlug of games with moneyline arbitrage
+    """
+    best = {}
+    for row in book_odds_df.itertuples():
+        if np.isnan(row.oddsMoneyline):
+            continue
+        key = (row.homeTeamSlug, row.teamType)
+        price = float(american_to_decimal(row.oddsMoneyline))
+        if key not in best or price > best[key]:
+            best[key] = price
+
+    arbitrage = {
+        home
+        for home, team_type in best
+        if team_type == "Home"
+        and (home, "Away") in best
+        and 1 / best[(home, "Home")] + 1 / best[(home, "Away")] < 1
+    }
+
+    return best, arbitrage
+
+
+# One fixture server per book, each serving every league
+books = {}
+for book_number in range(args.books):
+    book_payloads = {
+        str(config["eventgroup_id"]): json.dumps(
+            get_book_payload(league, 15, book_number)
+        ).encode()
+        for league, config in DK_LEAGUES.items()
+    }
+    _, base_url = start_replay_server(
+        lambda path, query, p=book_payloads: next(
+            (v for k, v in p.items() if path.endswith("/" + k)), None
+        )
+    )
+    book_slug = "book" + str(book_number)
+    books[book_slug] = DraftKingsAdapter(book_slug, base_url + "eventgroups/")
+book_functions.BOOK_ADAPTERS = books
+
+# Refresh every book and league at once, then scan
+aggregator = BookOddsAggregator()
+for refresh in range(2):
+    refresh_start = time.perf_counter()
+    with ThreadPoolExecutor(
+        max_workers=len(books) * len(DK_LEAGUES)
+    ) as executor, contextlib.redirect_stdout(io.StringIO()):
+        futures = {
+            (book_slug, league): executor.submit(
+                adapter.get_team_odds, league, 0
+            )
+            for book_slug, adapter in books.items()
+            for league in adapter.leagues
+        }
+        fixture_odds = [
+            create_book_odds_df(book_slug, *future.result())
+            for (book_slug, _), future in futures.items()
+        ]
+    fetch_seconds = time.perf_counter() - refresh_start
+    aggregator.update(pd.concat(fixture_odds, ignore_index=True))
+    scan = aggregator.scan(max_age=60)
+    print(
+        "Refresh "
+        + str(refresh + 1)
+        + ": "
+        + str(len(books))
+        + " books x "
+        + str(len(DK_LEAGUES))
+        + " leagues fetched and parsed in "
+        + str(round(fetch_seconds, 3))
+        + "s, scanned in "
+        + str(round(time.perf_counter() - refresh_start - fetch_seconds, 3))
+        + "s: "
+        + str(len(scan["best"]))
+        + " best prices, "
+        + str(len(scan["arbitrage"]))
+        + " arbitrage, "
+        + str(len(scan["middles"]))
+        + " middles"
+    )
+
+# Every book's rows are written, keyed on the game
+if "DATABASE_URL" in os.environ:
+    configure_db_pool()
+    with pooled_connection() as db_con:
+        written = update_book_odds(
+            db_con,
+            {
+                book_slug: {
+                    league: adapter.get_team_odds(league)
+                    for league in adapter.leagues
+                }
+                for book_slug, adapter in books.items()
+            },
+        )
+        with db_con.cursor() as db_cursor:
+            db_cursor.execute("SELECT COUNT(*) FROM book_team_odds")
+            assert db_cursor.fetchone()[0] == len(written)
+    print("Wrote " + str(len(written)) + " rows to book_team_odds")
+
+# Scan a large slate, same best moneylines and arbitrage as per game,
+# compared as decimals since +100 and -100 are the same price
+scale_odds = get_scale_odds(args.scale_books, args.scale_events)
+scan_timings = []
+for _ in range(args.repeat):
+    scan_start = time.perf_counter()
+    scan = scan_book_odds(scale_odds)
+    scan_timings.append(time.perf_counter() - scan_start)
+
+loop_start = time.perf_counter()
+best_moneylines, moneyline_arbitrage = scan_per_game(scale_odds)
+loop_seconds = time.perf_counter() - loop_start
+moneylines = scan["best"][scan["best"]["market"] == "moneyline"]
+assert dict(
+    zip(
+        zip(moneylines["homeTeamSlug"], moneylines["side"]),
+        moneylines["decimal"],
+    )
+) == best_moneylines
+assert (
+    set(
+        scan["arbitrage"].loc[
+            scan["arbitrage"]["market"] == "moneyline", "homeTeamSlug"
+        ]
+    )
+    == moneyline_arbitrage
+)
+
+print(
+    str(args.scale_books)
+    + " books x "
+    + str(args.scale_events)
+    + " events ("
+    + str(len(scale_odds))
+    + " rows) scanned in "
+    + str(round(min(scan_timings), 3))
+    + "s: "
+    + str(len(scan["arbitrage"]))
+    + " arbitrage, "
+    + str(len(scan["middles"]))
+    + " middles. Moneylines alone one row at a time took "
+    + str(round(loop_seconds, 3))
+    + "s"
+)
@@ -0,0 +1,72 @@
+"""
+Benchmark the single-pass DraftKings offers parser
+
+Compares parse_nba_team_odds against concatenating
+create_nba_team_odds_df for every offer index, on synthetic 15-game and
+1,000-event payloads, and checks both return the same odds.
+
+Usage (from the repo root):
+    python -m dev.bench_dk_parse
+"""
+# Import packages
+import timeit
+import pandas as pd
+from functions.dk_api_functions import (
+    create_nba_team_odds_df,
+    parse_nba_team_odds,
+)
+from dev.synthetic_payloads import get_dk_eventgroup_payload
+
+
+# Functions
+def parse_per_event(nba_team_game_lines):
+    """
+    Function to parse offers the way ingest_data.py used to
+    Args:
+    nba_team_game_lines (dict): Game Lines subcategory descriptor
+    Returns:
+    nba_team_odds_df (df): dataframe of available odds for all events
+    """
+    return pd.concat(
+        [
+            create_nba_team_odds_df(nba_team_game_lines, game)
+            for game in range(
+                len(nba_team_game_lines["offerSubcategory"]["offers"])
+            )
+        ],
+        axis=0,
+    )
+
+
+for n_events, repeat in ((15, 20), (1000, 3)):
+    # Game Lines subcategory from a synthetic payload
+    game_lines = get_dk_eventgroup_payload(n_events)["eventGroup"][
+        "offerCategories"
+    ][0]["offerSubcategoryDescriptors"][0]
+
+    # Same odds either way
+    pd.testing.assert_frame_equal(
+        parse_per_event(game_lines).reset_index(drop=True),
+        parse_nba_team_odds(game_lines),
+    )
+
+    # Best of repeat runs
+    per_event_time = min(
+        timeit.repeat(lambda g=game_lines: parse_per_event(g), number=1,
+                      repeat=repeat)
+    )
+    single_pass_time = min(
+        timeit.repeat(lambda g=game_lines: parse_nba_team_odds(g),
+                      number=1, repeat=repeat)
+    )
+
+    print(
+        str(n_events)
+        + " events: per event "
+        + str(round(per_event_time * 1000, 2))
+        + "ms, single pass "
+        + str(round(single_pass_time * 1000, 2))
+        + "ms ("
+        + str(round(per_event_time / single_pass_time, 1))
+        + "x)"
+    )
@@ -0,0 +1,175 @@
+"""
+Benchmark player prop and alternate line parsing and writes
+
+Parses synthetic prop subcategories (every market in DK_NBA_PROP_MARKETS)
+at 1x and 10x the lines per player to check the parser stays linear in
+payload size, fetches the alternate line subcategories (every market in
+DK_NBA_ALT_LINE_MARKETS) from a local server and checks each event has
+--alt-lines lines per market on top of its main line, then, if
+DATABASE_URL is set, writes them with update_nba_props() twice (insert,
+then unchanged rerun).
+
+Usage (from the repo root):
+    python -m dev.bench_dk_props
+    DATABASE_URL=postgresql://... python -m dev.bench_dk_props
+"""
+# Import packages
+import argparse
+import os
+import time
+import warnings
+from itertools import chain
+from functions.db_functions import configure_db_pool, run_db_stage
+from functions.dk_api_functions import get_team_game_lines
+from functions.dk_props_functions import (
+    DK_NBA_ALT_LINE_MARKETS,
+    DK_NBA_PROP_MARKETS,
+    get_alt_line_offers,
+    iter_alt_line_rows,
+    iter_player_prop_rows,
+    update_nba_props,
+)
+from functions import dk_api_functions
+from dev.replay_server import start_replay_server
+from dev.synthetic_payloads import (
+    get_dk_alt_lines_payload,
+    get_dk_eventgroup_payload,
+    get_dk_props_payload,
+)
+
+warnings.filterwarnings("ignore")
+
+# Parse args
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--events", type=int, default=15)
+parser.add_argument("--lines", type=int, default=5)
+parser.add_argument("--alt-lines", type=int, default=10)
+args = parser.parse_args()
+
+
+def get_market_offers(lines_per_player):
+    """
+    Function to build prop offers for every market
+    """
+    return {
+        market: get_dk_props_payload(
+            category_id,
+            subcategory_id,
+            market,
+            n_events=args.events,
+            lines_per_player=lines_per_player,
+        )["eventGroup"]["offerCategories"][0]["offerSubcategoryDescriptors"][
+            0
+        ]["offerSubcategory"]["offers"]
+        for market, (category_id, subcategory_id) in (
+            DK_NBA_PROP_MARKETS.items()
+        )
+    }
+
+
+def time_parse(offers):
+    """
+    Function to time parsing every market, returns rows and seconds
+    """
+    parse_start = time.perf_counter()
+    rows = sum(
+        sum(1 for _ in iter_player_prop_rows(market, prop_offers))
+        for market, prop_offers in offers.items()
+    )
+    return rows, time.perf_counter() - parse_start
+
+
+# Parser scaling, rows/sec should hold as the payload grows
+small_offers = get_market_offers(args.lines)
+large_offers = get_market_offers(args.lines * 10)
+for label, market_offers in (("1x", small_offers), ("10x", large_offers)):
+    row_count, parse_time = time_parse(market_offers)
+    print(
+        "Parse "
+        + label
+        + ": "
+        + str(row_count)
+        + " rows in "
+        + str(round(parse_time, 3))
+        + "s ("
+        + str(round(row_count / parse_time))
+        + " rows/s)"
+    )
+
+# Main lines through get_team_game_lines() for a real game_df, alternate
+# lines from their own subcategories
+alt_payloads = {
+    str(subcategory_id): get_dk_alt_lines_payload(
+        category_id,
+        subcategory_id,
+        market,
+        n_events=args.events,
+        lines_per_event=args.alt_lines,
+    )
+    for market, (category_id, subcategory_id) in (
+        DK_NBA_ALT_LINE_MARKETS.items()
+    )
+}
+server, base_url = start_replay_server(
+    lambda path, query: alt_payloads.get(
+        path.split("/")[-1], get_dk_eventgroup_payload(n_events=args.events)
+    ),
+    0,
+)
+dk_api_functions.DK_API_URL = base_url + "eventgroups/"
+nba_team_game_lines, nba_game_df, _ = get_team_game_lines("NBA", ttl=0)
+alt_line_offers = {
+    market: get_alt_line_offers(market, ttl=0)
+    for market in DK_NBA_ALT_LINE_MARKETS
+}
+server.shutdown()
+
+# Main line plus every alternate line, per event, market and side
+alt_line_rows = list(
+    iter_alt_line_rows(
+        chain(
+            nba_team_game_lines["offerSubcategory"]["offers"],
+            *alt_line_offers.values(),
+        ),
+        nba_game_df,
+    )
+)
+lines_per_side = {}
+for event_id, alt_market, side, alt_line, _ in alt_line_rows:
+    lines_per_side.setdefault((event_id, alt_market, side), set()).add(
+        alt_line
+    )
+assert len(lines_per_side) == args.events * 4, len(lines_per_side)
+assert all(
+    len(x) == args.alt_lines + 1 for x in lines_per_side.values()
+), lines_per_side
+print(
+    "Alt lines: "
+    + str(len(alt_line_rows))
+    + " rows, "
+    + str(args.alt_lines + 1)
+    + " lines per event, market and side"
+)
+
+# Bulk write, second run should change no rows
+if os.environ.get("DATABASE_URL"):
+    configure_db_pool()
+    for run in ("insert", "unchanged"):
+        start_time = time.perf_counter()
+        row_counts = run_db_stage(
+            update_nba_props,
+            large_offers,
+            nba_team_game_lines,
+            nba_game_df,
+            alt_line_offers=alt_line_offers,
+        )
+        write_time = time.perf_counter() - start_time
+        print(
+            "Write "
+            + run
+            + ": "
+            + str(row_counts)
+            + " in "
+            + str(round(write_time, 3))
+            + "s"
+        )
@@ -0,0 +1,172 @@
+"""
+Benchmark peak memory of streaming vs whole eventgroup parsing
+
+Serves a large eventgroup response (a recorded file, or a synthetic one
+with Game Lines plus every player prop category) from a local server and
+fetches NBA game lines with get_team_game_lines(stream=False) and
+get_team_game_lines(stream=True), then streaming through the response
+cache on a miss (parsed while written to the cache) and on a hit (parsed
+from the cache file), each in a fresh process, reporting peak RSS
+growth, peak Python allocations and wall clock.
+
+Usage (from the repo root):
+    python -m dev.bench_dk_stream
+    python -m dev.bench_dk_stream --payload dev/fixtures/42648.json
+"""
+# Import packages
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# Parse args
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--payload", default=None, help="Recorded eventgroup")
+parser.add_argument("--lines", type=int, default=20)
+parser.add_argument(
+    "--mode",
+    choices=["whole", "stream", "cache-miss", "cache-hit"],
+    default=None,
+)
+args = parser.parse_args()
+
+
+def get_max_rss():
+    """
+    Function to get this process's peak RSS in MB
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_synthetic_payload(path):
+    """
+    Function to write a synthetic eventgroup with Game Lines and every
+    player prop category, most of which get_team_game_lines() discards
+    """
+    # pylint: disable=import-outside-toplevel
+    from functions.dk_props_functions import DK_NBA_PROP_MARKETS
+    from dev.synthetic_payloads import (
+        get_dk_eventgroup_payload,
+        get_dk_props_payload,
+    )
+
+    payload = get_dk_eventgroup_payload()
+    for market, (category_id, subcategory_id) in DK_NBA_PROP_MARKETS.items():
+        payload["eventGroup"]["offerCategories"] += get_dk_props_payload(
+            category_id, subcategory_id, market, lines_per_player=args.lines
+        )["eventGroup"]["offerCategories"]
+
+    with open(path, "w", encoding="utf-8") as payload_file:
+        json.dump(payload, payload_file)
+
+
+def run_mode(path, mode): #pylint: disable=too-many-locals
+    """
+    Function to fetch game lines once in this process and print results
+    """
+    # pylint: disable=import-outside-toplevel
+    from functions import dk_api_functions
+    from functions.http_functions import configure_response_cache
+    from dev.replay_server import start_replay_server
+
+    with open(path, "rb") as payload_file:
+        body = payload_file.read()
+    server, base_url = start_replay_server(lambda path, query: body, 0)
+    dk_api_functions.DK_API_URL = base_url + "eventgroups/"
+
+    def fetch():
+        # Misses start from an empty cache, hits are served from the
+        # cache primed below
+        if mode == "cache-miss":
+            configure_response_cache(tempfile.mkdtemp())
+        return dk_api_functions.get_team_game_lines(
+            "NBA",
+            ttl=None if mode == "cache-hit" else 0,
+            stream=mode != "whole",
+        )
+
+    if mode == "cache-hit":
+        configure_response_cache(tempfile.mkdtemp())
+        dk_api_functions.get_team_game_lines("NBA", ttl=0, stream=True)
+
+    # Baseline after imports and the body held by the server
+    rss_start = get_max_rss()
+    start_time = time.perf_counter()
+    _, _, offer_length = fetch()
+    fetch_time = time.perf_counter() - start_time
+    rss_peak = get_max_rss()
+
+    # Again with tracemalloc, which slows the parse too much to time
+    tracemalloc.start()
+    fetch()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    server.shutdown()
+
+    print(
+        json.dumps(
+            {
+                "mode": mode,
+                "offers": offer_length,
+                "rss_mb": round(rss_peak - rss_start, 1),
+                "alloc_mb": round(peak_bytes / 1024 / 1024, 1),
+                "seconds": round(fetch_time, 3),
+            }
+        )
+    )
+
+
+# Child process, one mode
+if args.mode is not None:
+    run_mode(args.payload, args.mode)
+    sys.exit()
+
+# Use the recorded payload or write a synthetic one
+payload_path = args.payload
+if payload_path is None:
+    payload_path = os.path.join(tempfile.mkdtemp(), "42648.json")
+    write_synthetic_payload(payload_path)
+print(
+    "Payload "
+    + str(round(os.path.getsize(payload_path) / 1024 / 1024, 1))
+    + " MB"
+)
+
+# Each mode in a fresh process, so peak RSS isn't shared
+for bench_mode in ("whole", "stream", "cache-miss", "cache-hit"):
+    result = json.loads(
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "dev.bench_dk_stream",
+                "--payload",
+                payload_path,
+                "--mode",
+                bench_mode,
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.splitlines()[-1]
+    )
+    print(
+        result["mode"]
+        + ": "
+        + str(result["offers"])
+        + " offers, peak RSS +"
+        + str(result["rss_mb"])
+        + " MB, peak allocations "
+        + str(result["alloc_mb"])
+        + " MB, "
+        + str(result["seconds"])
+        + "s"
+    )
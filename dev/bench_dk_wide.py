@@ -0,0 +1,174 @@
+"""
+Benchmark reshaping DraftKings odds to one row per event and team type
+
+Compares create_nba_team_odds_wide_df() against the pivot_table and
+merge reshape it replaced, on synthetic 15-game and 1,000-event slates,
+and checks both return the same rows on full slates, MLB labels and a
+ragged slate with missing offers, odds and events.
+
+Usage (from the repo root):
+    python -m dev.bench_dk_wide
+"""
+# Import packages
+import timeit
+import numpy as np
+import pandas as pd
+from functions.dk_api_functions import (
+    DK_LEAGUES,
+    create_nba_team_odds_wide_df,
+    parse_team_odds,
+)
+from functions.odds_functions import add_fair_odds
+from dev.synthetic_payloads import (
+    get_dk_eventgroup_payload,
+    get_spread_label,
+)
+
+
+# Functions
+def create_wide_df_pivot(nba_game_df, nba_team_odds_df, league="NBA"):
+    """
+    Function to reshape odds the way create_nba_team_odds_wide_df() used
+    to, with a merge, pivot_table and three more merges
+    """
+    nba_team_odds_df = nba_team_odds_df.copy()
+    nba_team_odds_df["eventId"] = nba_team_odds_df["eventId"].astype(int)
+    nba_team_odds_df = nba_team_odds_df.merge(
+        nba_game_df[["eventId", "awayTeamName", "homeTeamName"]],
+        on="eventId",
+        how="inner",
+    )
+    nba_team_odds_df["teamType"] = np.where(
+        nba_team_odds_df["label"] == nba_team_odds_df["homeTeamName"],
+        "Home",
+        "Away",
+    )
+    over_under_lines = nba_team_odds_df[
+        nba_team_odds_df["label"].isin(["Over"])
+    ][["eventId", "line", "oddsAmerican"]].rename(
+        columns={"line": "totalPointsLine", "oddsAmerican": "oddsOver"}
+    )
+    over_under_lines = over_under_lines.merge(
+        nba_team_odds_df[nba_team_odds_df["label"].isin(["Under"])][
+            ["eventId", "oddsAmerican"]
+        ].rename(columns={"oddsAmerican": "oddsUnder"}),
+        on="eventId",
+        how="left",
+    )
+    spread_lines = nba_team_odds_df[nba_team_odds_df["oddType"] == "Spread"][
+        ["eventId", "line", "teamType"]
+    ].rename(columns={"line": "spreadLine"})
+    nba_team_odds_df = nba_team_odds_df[
+        ~nba_team_odds_df["label"].isin(["Over", "Under"])
+    ].pivot_table(
+        index=["eventId", "teamType"],
+        columns=["oddType"],
+        values=["oddsAmerican"],
+        aggfunc="first",
+    )
+    nba_team_odds_df.columns = [
+        "".join(col) for col in nba_team_odds_df.columns
+    ]
+    nba_team_odds_df = (
+        nba_team_odds_df.reset_index()
+        .merge(spread_lines, on=["eventId", "teamType"], how="left")
+        .merge(over_under_lines, on="eventId", how="left")
+    )
+    nba_team_odds_df.columns = nba_team_odds_df.columns.str.replace(
+        "American", ""
+    )
+    float_cols = [
+        "spreadLine",
+        "oddsSpread",
+        "totalPointsLine",
+        "oddsMoneyline",
+        "oddsOver",
+        "oddsUnder",
+    ]
+    nba_team_odds_df[float_cols] = nba_team_odds_df[float_cols].astype(float)
+
+    return add_fair_odds(nba_team_odds_df, league)
+
+
+def get_slate(n_events, league="NBA", ragged=False):
+    """
+    Function to get a synthetic slate's events and long odds
+    Args:
+    n_events (int): number of events
+    league (str): key of DK_LEAGUES, sets offer labels
+    ragged (bool): drop some offers, odds and events
+    Returns:
+    game_df (df): eventId, awayTeamName and homeTeamName per event
+    team_odds_df (df): parse_team_odds() output
+    """
+    config = DK_LEAGUES[league]
+    payload = get_dk_eventgroup_payload(
+        n_events,
+        eventgroup_id=config["eventgroup_id"],
+        spread_label=get_spread_label(config),
+    )["eventGroup"]
+    offers = payload["offerCategories"][0]["offerSubcategoryDescriptors"][0][
+        "offerSubcategory"
+    ]["offers"]
+    # Large slates rotate a team into playing itself, which the pivot
+    # reshape returned as duplicate rows
+    events = [x for x in payload["events"] if x["teamName1"] != x["teamName2"]]
+
+    if ragged:
+        for event, event_offers in enumerate(offers):
+            # Offers are Spread, Total, Moneyline
+            if event % 3 == 0:
+                del event_offers[2]
+            if event % 5 == 0:
+                del event_offers[1]
+            if event % 4 == 0:
+                del event_offers[0]["outcomes"][1]["oddsAmerican"]
+            if event % 7 == 0:
+                event_offers.clear()
+        events = [x for i, x in enumerate(events) if i % 11 != 1]
+
+    game_df = pd.DataFrame(
+        {
+            "eventId": [int(x["eventId"]) for x in events],
+            "awayTeamName": [x["teamName1"] for x in events],
+            "homeTeamName": [x["teamName2"] for x in events],
+        }
+    )
+    team_odds_df = parse_team_odds(
+        {"offerSubcategory": {"offers": offers}}, config["offer_labels"]
+    )
+
+    return game_df, team_odds_df
+
+
+# Same rows either way
+for slate_args in ((15, "NBA"), (1000, "NBA"), (15, "MLB"), (200, "NBA", True)):
+    slate = get_slate(*slate_args)
+    pd.testing.assert_frame_equal(
+        create_nba_team_odds_wide_df(*slate, slate_args[1]),
+        create_wide_df_pivot(*slate, slate_args[1]),
+    )
+
+for slate_events, repeat in ((15, 20), (1000, 5)):
+    slate = get_slate(slate_events)
+
+    # Best of repeat runs
+    pivot_time = min(
+        timeit.repeat(lambda s=slate: create_wide_df_pivot(*s), number=1,
+                      repeat=repeat)
+    )
+    direct_time = min(
+        timeit.repeat(lambda s=slate: create_nba_team_odds_wide_df(*s),
+                      number=1, repeat=repeat)
+    )
+
+    print(
+        str(slate_events)
+        + " events: pivot "
+        + str(round(pivot_time * 1000, 2))
+        + "ms, keyed "
+        + str(round(direct_time * 1000, 2))
+        + "ms ("
+        + str(round(pivot_time / direct_time, 1))
+        + "x)"
+    )
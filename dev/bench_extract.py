@@ -0,0 +1,176 @@
+"""
+Benchmark loading game logs with extract_table() against pd.read_sql
+
+Loads --seasons synthetic regular seasons of team and player game logs
+(and their nba_api_events) into DATABASE_URL if nba_api_player_game_logs
+is empty, then loads nba_api_player_game_logs with each method in a
+fresh process, reporting best of --repeat seconds and the peak memory
+added by the first load:
+
+    read_sql          pd.read_sql('SELECT * FROM nba_api_player_game_logs')
+    extract           extract_table(), every column
+    extract_columns   extract_table(), 6 columns
+    extract_season    extract_table(), every column of the last season,
+                      filtered in the database on the event date
+
+Usage (from the repo root):
+    DATABASE_URL=postgresql://... python -m dev.bench_extract
+"""
+# Import packages
+import argparse
+import contextlib
+import io
+import json
+import resource
+import subprocess
+import sys
+import time
+import warnings
+from datetime import date
+import pandas as pd
+import psutil
+from functions.db_functions import (
+    bulk_upsert,
+    pooled_connection,
+    transaction,
+)
+from functions.extract_functions import extract_table
+from functions.nba_api_functions import (
+    NBA_API_EVENTS_COLUMNS,
+    split_date_range,
+    write_nba_api_game_logs,
+)
+from dev.synthetic_payloads import get_game_log_payload, get_schedule
+
+warnings.filterwarnings("ignore")
+
+# Regular seasons, oldest first
+SEASONS = [(date(x, 10, 18), date(x + 1, 4, 9)) for x in range(2015, 2023)]
+
+# Methods to compare, called with a connection
+METHODS = {
+    "read_sql": lambda con: pd.read_sql(
+        "SELECT * FROM nba_api_player_game_logs", con
+    ),
+    "extract": lambda con: extract_table(con, "nba_api_player_game_logs"),
+    "extract_columns": lambda con: extract_table(
+        con,
+        "nba_api_player_game_logs",
+        ["gameId", "playerId", "teamId", "min", "pts", "poss"],
+    ),
+    "extract_season": lambda con: extract_table(
+        con, "nba_api_player_game_logs", date_from=SEASONS[-1][0]
+    ),
+}
+
+# Parse args
+parser = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+)
+parser.add_argument("--seasons", type=int, default=1)
+parser.add_argument("--repeat", type=int, default=5)
+parser.add_argument("--method", help="Run one method, in a child process")
+args = parser.parse_args()
+
+
+# Functions
+def load_seasons(con, seasons):
+    """
+    Function to load synthetic game logs and events for seasons
+    """
+    for season_from, season_to in seasons:
+        # Events, so game logs can be filtered on the game date
+        schedule = pd.DataFrame(
+            get_schedule(season_from, season_to),
+            columns=["gameId", "gameEt", "awayTeamId", "homeTeamId"],
+        )
+        schedule["gameEt"] = pd.to_datetime(schedule["gameEt"], utc=True)
+        for side in ("away", "home"):
+            schedule[side + "TeamSlug"] = "X"
+            schedule[side + "TeamName"] = "X"
+        with transaction(con) as cursor:
+            bulk_upsert(
+                cursor,
+                "nba_api_events",
+                schedule[list(NBA_API_EVENTS_COLUMNS)],
+                NBA_API_EVENTS_COLUMNS,
+                ["gameId"],
+            )
+
+        for window in split_date_range(season_from, season_to):
+            for entity in ("team", "player"):
+                write_nba_api_game_logs(
+                    con,
+                    entity,
+                    *(
+                        tuple(
+                            get_game_log_payload(
+                                entity, measure_type, *window
+                            )["resultSets"][0][x]
+                            for x in ("headers", "rowSet")
+                        )
+                        for measure_type in ("Advanced", "")
+                    ),
+                )
+
+
+def run_method(method: str):
+    """
+    Function to time a method and measure the memory its first load adds
+    Returns:
+    result (dict): rows, columns, seconds and peak_mb
+    """
+    with pooled_connection() as con:
+        # Memory before the first load, its peak is measured after
+        baseline = psutil.Process().memory_info().rss
+        df = METHODS[method](con)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+        timings = []
+        for _ in range(args.repeat):
+            start_time = time.perf_counter()
+            METHODS[method](con)
+            timings.append(time.perf_counter() - start_time)
+
+    return {
+        "method": method,
+        "rows": len(df),
+        "columns": len(df.columns),
+        "seconds": round(min(timings), 4),
+        "peak_mb": round((peak - baseline) / 1024 / 1024, 1),
+        "df_mb": round(df.memory_usage(deep=True).sum() / 1024 / 1024, 1),
+    }
+
+
+# Child process, one method so peak memory isn't shared between methods
+if args.method:
+    print(json.dumps(run_method(args.method)))
+    sys.exit()
+
+with pooled_connection() as db_con:
+    with db_con.cursor() as db_cursor:
+        db_cursor.execute("SELECT COUNT(*) FROM nba_api_player_game_logs")
+        if db_cursor.fetchone()[0] == 0:
+            print("Loading " + str(args.seasons) + " seasons")
+            with contextlib.redirect_stdout(io.StringIO()):
+                load_seasons(db_con, SEASONS[-args.seasons:])
+
+report = pd.DataFrame(
+    [
+        json.loads(
+            subprocess.run(
+                [
+                    sys.executable, "-m", "dev.bench_extract",
+                    "--method", name, "--repeat", str(args.repeat),
+                ],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip().splitlines()[-1]
+        )
+        for name in METHODS
+    ]
+)
+report["speedup"] = (
+    report.loc[report["method"] == "read_sql", "seconds"].iloc[0]
+    / report["seconds"]
+).round(1)
+print(report.to_string(index=False))
@@ -0,0 +1,148 @@
+"""
+Benchmark the ingestion pipeline run serially vs concurrently
+
+Replays synthetic DraftKings (every league in DK_LEAGUES plus NBA player
+props and alternate lines) and NBA API responses from a local server
+with artificial latency, then runs the ingest_data.py stages one at a
+time and all at once, and reports wall clock against the slowest fetch.
+Each league's last event has only a moneyline, and is checked to be
+written with null spreads and totals alongside every other event.
+
+Needs a database with SQL/table_create_schema applied.
+
+Usage (from the repo root):
+    DATABASE_URL=postgresql://... python -m dev.bench_ingest_pipeline
+"""
+# Import packages
+import argparse
+import json
+import time
+import warnings
+from functions import dk_api_functions, nba_api_functions
+from functions.db_functions import configure_db_pool, pooled_connection
+from functions.dk_props_functions import (
+    DK_NBA_ALT_LINE_MARKETS,
+    DK_NBA_PROP_MARKETS,
+)
+from functions.http_functions import RetryingClient
+from functions.pipeline_functions import get_ingest_stages, run_pipeline
+from dev.replay_server import start_replay_server
+from dev.synthetic_payloads import (
+    get_dk_alt_lines_payload,
+    get_dk_eventgroup_payload,
+    get_dk_props_payload,
+    get_spread_label,
+    nba_api_resolver,
+)
+
+warnings.filterwarnings("ignore")
+
+# Parse args
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--latency", type=float, default=0.5)
+args = parser.parse_args()
+
+# DraftKings eventgroup response per league, encoded once, the last
+# event with its spread and total pulled
+dk_payloads = {
+    str(config["eventgroup_id"]): json.dumps(
+        get_dk_eventgroup_payload(
+            eventgroup_id=config["eventgroup_id"],
+            subcategory_id=config["subcategory_ids"][0],
+            spread_label=get_spread_label(config),
+            moneyline_only_events=1,
+        )
+    ).encode()
+    for config in dk_api_functions.DK_LEAGUES.values()
+}
+
+
+# DraftKings player prop response per subcategory, encoded once
+dk_payloads.update(
+    {
+        str(subcategory_id): json.dumps(
+            get_dk_props_payload(category_id, subcategory_id, market)
+        ).encode()
+        for market, (category_id, subcategory_id) in (
+            DK_NBA_PROP_MARKETS.items()
+        )
+    }
+)
+
+# DraftKings alternate line response per subcategory, encoded once
+dk_payloads.update(
+    {
+        str(subcategory_id): json.dumps(
+            get_dk_alt_lines_payload(category_id, subcategory_id, market)
+        ).encode()
+        for market, (category_id, subcategory_id) in (
+            DK_NBA_ALT_LINE_MARKETS.items()
+        )
+    }
+)
+
+
+def resolver(path, query):
+    """
+    Function to answer DraftKings and NBA API requests
+    """
+    if "eventgroups" in path:
+        return dk_payloads.get(path.split("/")[-1])
+    return nba_api_resolver(path, query)
+
+
+# Point both APIs at the replay server
+server, base_url = start_replay_server(resolver, args.latency)
+dk_api_functions.DK_API_URL = base_url + "eventgroups/"
+nba_api_functions.NBA_API_URL = base_url
+
+# The replay server doesn't throttle, so don't rate limit requests to it
+nba_api_functions.NBA_API_CLIENT = RetryingClient(rate=1000, burst=1000)
+
+configure_db_pool()
+stages = get_ingest_stages({})
+
+# Warm up, so both timed runs write the same (unchanged) rows
+run_pipeline(stages)
+
+# One stage at a time, same as the old top to bottom script
+start_time = time.perf_counter()
+run_pipeline(stages, max_workers=1)
+serial_time = time.perf_counter() - start_time
+
+# Independent stages at once
+start_time = time.perf_counter()
+_, timings = run_pipeline(stages)
+concurrent_time = time.perf_counter() - start_time
+server.shutdown()
+
+# Moneyline-only events are written with null lines, and don't stop
+# the rest of the slate being written
+with pooled_connection() as db_con, db_con.cursor() as db_cursor:
+    db_cursor.execute(
+        "SELECT leagueSlug, COUNT(*) FROM dk_events GROUP BY leagueSlug"
+    )
+    assert dict(db_cursor.fetchall()) == {
+        league: 15 for league in dk_api_functions.DK_LEAGUES
+    }
+    for odds_table in ("dk_nba_team_odds", "dk_team_odds"):
+        db_cursor.execute(
+            "SELECT COUNT(*) FROM "
+            + odds_table
+            + " WHERE spreadLine IS NULL AND totalPointsLine IS NULL"
+            + " AND oddsMoneyline IS NOT NULL"
+        )
+        assert db_cursor.fetchone()[0] > 0, odds_table
+
+print(timings.to_string(index=False))
+print(
+    "Serial "
+    + str(round(serial_time, 2))
+    + "s, concurrent "
+    + str(round(concurrent_time, 2))
+    + "s ("
+    + str(round(serial_time / concurrent_time, 1))
+    + "x), slowest single stage "
+    + str(round(timings["seconds"].max(), 2))
+    + "s"
+)
@@ -0,0 +1,75 @@
+"""
+Benchmark serial vs concurrent NBA API game log fetches
+
+Replays synthetic game log responses from a local server with artificial
+latency and reports wall-clock for the four game log fetch stages of the
+ingest pipeline run one after another against run_pipeline(), both
+through the rate limited NBA_API_CLIENT.
+
+Usage (from the repo root):
+    python -m dev.bench_nba_api_fetch --latency 0.5
+"""
+# Import packages
+import argparse
+import time
+from datetime import date
+from functools import partial
+from functions import nba_api_functions
+from functions.http_functions import RetryingClient
+from functions.pipeline_functions import fetch_game_logs_stage, run_pipeline
+from dev.replay_server import start_replay_server
+from dev.synthetic_payloads import nba_api_resolver
+
+# Parse args
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--latency", type=float, default=0.5)
+parser.add_argument("--date-from", default="2023-01-01")
+parser.add_argument("--date-to", default="2023-01-07")
+args = parser.parse_args()
+
+# Point the NBA API functions at the replay server
+server, nba_api_functions.NBA_API_URL = start_replay_server(
+    nba_api_resolver, args.latency
+)
+
+# The replay server doesn't throttle, so don't rate limit requests to it
+nba_api_functions.NBA_API_CLIENT = RetryingClient(rate=1000, burst=1000)
+
+# Same stages as get_ingest_stages(), one per endpoint
+sync_dates = (
+    date.fromisoformat(args.date_from),
+    date.fromisoformat(args.date_to),
+)
+stages = {
+    entity + "_logs_" + (measure_type or "Base").lower(): (
+        partial(fetch_game_logs_stage, {}, entity, measure_type, sync_dates),
+        [],
+    )
+    for entity in ("team", "player")
+    for measure_type in ("Advanced", "")
+}
+
+# Serial path
+start_time = time.perf_counter()
+serial_results = {name: func() for name, (func, _) in stages.items()}
+serial_time = time.perf_counter() - start_time
+
+# Concurrent path
+start_time = time.perf_counter()
+results, _ = run_pipeline(stages)
+concurrent_time = time.perf_counter() - start_time
+server.shutdown()
+
+# Same output either way
+assert results == serial_results
+
+print(
+    "Fetched "
+    + str(sum(len(x[1]) for y in results.values() for x in y))
+    + " game log rows with "
+    + str(args.latency)
+    + "s latency"
+)
+print("Serial:     " + str(round(serial_time, 3)) + "s")
+print("Concurrent: " + str(round(concurrent_time, 3)) + "s")
+print("Speedup:    " + str(round(serial_time / concurrent_time, 2)) + "x")
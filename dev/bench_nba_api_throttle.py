@@ -0,0 +1,134 @@
+"""
+Benchmark backfill fetches against a throttling NBA API stub
+
+Serves synthetic game logs from a local server that answers requests past
+--limit per second with 429s, bans clients that keep going (403s) and
+fails a share of requests with 503s, then fetches a season of backfill
+shards with parallel workers through:
+
+    fixed_fast    a fixed rate over the limit without retries, like the
+                  old RateLimiter + requests.get backfill
+    fixed_safe    a fixed rate well under the limit, with retries
+    adaptive      RetryingClient probing up from --start-rate
+
+and reports wall clock, successful requests/sec against the limit, and
+the 429s, bans and 503s each one ran into.
+
+Usage (from the repo root):
+    python -m dev.bench_nba_api_throttle --limit 10 --workers 8
+"""
+# Import packages
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from functions import nba_api_functions
+from functions.backfill_functions import (
+    fetch_backfill_shard,
+    get_backfill_shards,
+)
+from functions.http_functions import RetryingClient
+from dev.replay_server import Throttle, cached_resolver, start_replay_server
+from dev.synthetic_payloads import nba_api_resolver
+
+# Parse args
+parser = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+)
+parser.add_argument("--limit", type=float, default=10.0)
+parser.add_argument("--ban-after", type=int, default=30)
+parser.add_argument("--failure-rate", type=float, default=0.02)
+parser.add_argument("--workers", type=int, default=8)
+parser.add_argument("--start-rate", type=float, default=2.0)
+parser.add_argument("--shard-days", type=int, default=3)
+parser.add_argument("--date-from", default="2022-10-18")
+parser.add_argument("--date-to", default="2023-04-09")
+args = parser.parse_args()
+
+# Responses built once, shared by every server
+resolver = cached_resolver(nba_api_resolver)
+shards = get_backfill_shards(args.date_from, args.date_to, args.shard_days)
+
+
+# Functions
+def run_backfill_fetch(client, throttle=None):
+    """
+    Function to fetch every shard with parallel workers from a fresh
+    server
+    Args:
+    client (RetryingClient): client shared by the workers
+    throttle (Throttle): server rate limit, None to not throttle
+    Returns:
+    seconds (float): wall clock
+    error (str): first error raised, empty if every shard was fetched
+    """
+    server, nba_api_functions.NBA_API_URL = start_replay_server(
+        resolver, throttle=throttle
+    )
+    start_time = time.perf_counter()
+    error = ""
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            for _ in executor.map(
+                lambda shard: fetch_backfill_shard({}, shard, client), shards
+            ):
+                pass
+    except Exception as fetch_error: #pylint: disable=broad-exception-caught
+        error = repr(fetch_error)[:60]
+    seconds = time.perf_counter() - start_time
+    server.shutdown()
+
+    return seconds, error
+
+
+# Build every response once, unthrottled
+run_backfill_fetch(RetryingClient(rate=1000, burst=1000))
+
+clients = {
+    "fixed_fast": RetryingClient(
+        rate=args.limit * 2, burst=args.workers, retries=0
+    ),
+    "fixed_safe": RetryingClient(
+        rate=args.limit / 2, burst=1, pool_maxsize=args.workers
+    ),
+    "adaptive": RetryingClient(
+        rate=args.start_rate,
+        burst=args.workers,
+        max_rate=args.limit * 3,
+        pool_maxsize=args.workers,
+    ),
+}
+
+report = []
+for name, bench_client in clients.items():
+    bench_throttle = Throttle(
+        args.limit,
+        ban_after=args.ban_after,
+        ban_seconds=60,
+        failure_rate=args.failure_rate,
+    )
+    run_seconds, run_error = run_backfill_fetch(bench_client, bench_throttle)
+    report.append(
+        {
+            "client": name,
+            "seconds": round(run_seconds, 2),
+            "ok_per_sec": round(bench_throttle.counts["ok"] / run_seconds, 2),
+            "of_limit": format(
+                bench_throttle.counts["ok"] / run_seconds / args.limit, ".0%"
+            ),
+            "ok": bench_throttle.counts["ok"],
+            "429": bench_throttle.counts["throttled"],
+            "403": bench_throttle.counts["banned"],
+            "503": bench_throttle.counts["failed"],
+            "final_rate": round(bench_client.rate_limiter.rate, 2),
+            "error": run_error,
+        }
+    )
+
+print(
+    str(len(shards) * 4)
+    + " requests, server limit "
+    + str(args.limit)
+    + " requests/sec"
+)
+print(pd.DataFrame(report).to_string(index=False))
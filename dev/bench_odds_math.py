@@ -0,0 +1,158 @@
+"""
+Benchmark the vectorized odds math over a long history of two-way
+markets
+
+Draws --rows random two-way markets, checks remove_vig() against
+per-row Python (Shin against solving for z by bisection), then times
+each method vectorized against a per-row loop over the first
+--loop-rows markets, and add_fair_odds() over --rows wide rows.
+
+Usage (from the repo root):
+    python -m dev.bench_odds_math --rows 2000000
+"""
+# Import packages
+import argparse
+import math
+import time
+import numpy as np
+import pandas as pd
+from functions.odds_functions import (
+    add_fair_odds,
+    american_to_prob,
+    decimal_to_american,
+    american_to_decimal,
+    remove_vig,
+)
+
+# Parse args
+parser = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+)
+parser.add_argument("--rows", type=int, default=2000000)
+parser.add_argument("--loop-rows", type=int, default=100000)
+args = parser.parse_args()
+
+
+# Functions
+def american_to_prob_row(odds: float):
+    """
+    Function to convert one American price to implied probability
+    """
+    return 100 / (odds + 100) if odds > 0 else -odds / (100 - odds)
+
+
+def shin_row(prob_a: float, prob_b: float):
+    """
+    Function to remove the vig from one market with Shin's method, z
+    found by bisection so the fair probabilities sum to 1
+    """
+    overround = prob_a + prob_b
+
+    def fair(x, z):
+        return (math.sqrt(z**2 + 4 * (1 - z) * x**2 / overround) - z) / (
+            2 * (1 - z)
+        )
+
+    low, high = 0.0, 0.5
+    for _ in range(60):
+        z = (low + high) / 2
+        if fair(prob_a, z) + fair(prob_b, z) > 1:
+            low = z
+        else:
+            high = z
+
+    return fair(prob_a, z), fair(prob_b, z)
+
+
+# Per-row Python, one function per method
+ROW_METHODS = {
+    "multiplicative": lambda a, b: (a / (a + b), b / (a + b)),
+    "additive": lambda a, b: (a - (a + b - 1) / 2, b - (a + b - 1) / 2),
+    "shin": shin_row,
+}
+
+
+def time_call(func):
+    """
+    Function to time one call
+    Returns:
+    seconds (float): seconds taken
+    result: what func returned
+    """
+    start_time = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start_time, result
+
+
+# Random two-way markets: a fair price, then 2-8% hold on top
+rng = np.random.default_rng(0)
+fair_prob = rng.uniform(0.1, 0.9, args.rows)
+hold = 1 + rng.uniform(0.02, 0.08, args.rows)
+odds_a = np.round(decimal_to_american(1 / (fair_prob * hold)))
+odds_b = np.round(decimal_to_american(1 / ((1 - fair_prob) * hold)))
+
+# Conversions round trip, -100 and +100 are the same price
+assert np.allclose(
+    american_to_decimal(decimal_to_american(american_to_decimal(odds_a))),
+    american_to_decimal(odds_a),
+)
+
+loop_a = odds_a[: args.loop_rows].tolist()
+loop_b = odds_b[: args.loop_rows].tolist()
+for method, row_method in ROW_METHODS.items():
+    vector_time, (fair_a, fair_b) = time_call(
+        lambda m=method: remove_vig(
+            american_to_prob(odds_a), american_to_prob(odds_b), m
+        )
+    )
+    loop_time, loop_fair = time_call(
+        lambda f=row_method: [
+            f(american_to_prob_row(a), american_to_prob_row(b))
+            for a, b in zip(loop_a, loop_b)
+        ]
+    )
+
+    # Same probabilities, and fair probabilities sum to 1
+    assert np.allclose(fair_a[: args.loop_rows], [x[0] for x in loop_fair])
+    assert np.allclose(fair_b[: args.loop_rows], [x[1] for x in loop_fair])
+    assert np.allclose(fair_a + fair_b, 1)
+
+    print(
+        method
+        + ": "
+        + str(args.rows)
+        + " markets in "
+        + str(round(vector_time, 3))
+        + "s, per row loop "
+        + str(round(loop_time / args.loop_rows * args.rows, 1))
+        + "s est. ("
+        + str(round(loop_time / args.loop_rows * args.rows / vector_time))
+        + "x)"
+    )
+
+# Wide rows, home and away of each event paired on eventId
+wide_df = pd.DataFrame(
+    {
+        "eventId": np.arange(args.rows) // 2,
+        "teamType": np.tile(["Home", "Away"], args.rows // 2 + 1)[
+            : args.rows
+        ],
+        "oddsMoneyline": np.where(
+            np.arange(args.rows) % 2 == 0, odds_a, np.roll(odds_b, 1)
+        ),
+        "oddsSpread": -110.0,
+        "spreadLine": rng.integers(-30, 30, args.rows) / 2,
+        "totalPointsLine": rng.integers(400, 480, args.rows) / 2,
+        "oddsOver": -110.0,
+        "oddsUnder": -110.0,
+    }
+)
+fair_time, fair_df = time_call(lambda: add_fair_odds(wide_df))
+assert np.allclose(fair_df.groupby("eventId")["fairMoneyline"].sum(), 1)
+print(
+    "add_fair_odds: "
+    + str(args.rows)
+    + " rows in "
+    + str(round(fair_time, 3))
+    + "s"
+)
@@ -0,0 +1,382 @@
+"""
+Benchmark suite for the ingest pipeline, stage by stage
+
+Replays DraftKings and NBA API payloads from a local server and times the
+fetch, parse and write stages of each scenario separately:
+
+    dk_one_game      NBA eventgroup with 1 event
+    dk_full_slate    NBA eventgroup with 15 events
+    dk_1000_events   NBA eventgroup with 1,000 events
+    nba_season_logs  a full regular season of team and player game logs
+
+With --fixtures, responses captured with dev/replay_server.py are replayed
+too: dk_fixture (the recorded NBA eventgroup), dk_fixture_1000_events (the
+recording scaled up synthetically) and nba_fixture_logs (recorded game
+log endpoints, one window each).
+
+Every stage reports best of --repeat seconds, rows/sec and peak traced
+memory, measured in one more run since tracemalloc slows everything
+down. Results are appended to --results with the git commit, then
+compared to the latest run of --baseline (default the last other commit
+in the file), so throughput and memory can be tracked across commits.
+
+Write stages need a database with SQL/table_create_schema applied and
+are skipped without DATABASE_URL. Every stage runs once before it is
+timed, so writes time a re-poll of rows already stored.
+
+Usage (from the repo root):
+    DATABASE_URL=postgresql://... python -m dev.bench_suite
+    python -m dev.bench_suite --scenarios dk_full_slate --repeat 5
+"""
+# Import packages
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import time
+import tracemalloc
+import warnings
+from datetime import date, datetime, timezone
+import pandas as pd
+from functions import dk_api_functions, nba_api_functions
+from functions.db_functions import configure_db_pool, run_db_stage
+from functions.dk_api_functions import (
+    get_team_game_lines,
+    parse_league_team_odds,
+    update_team_odds,
+)
+from functions.http_functions import RetryingClient
+from functions.nba_api_functions import (
+    NBA_API_PLAYER_GAME_LOGS_COLUMNS,
+    NBA_API_TEAM_GAME_LOGS_COLUMNS,
+    get_nba_api_game_log_result_sets,
+    select_row_set_columns,
+    write_nba_api_game_logs,
+)
+from dev.replay_server import (
+    cached_resolver,
+    fixture_dir_resolver,
+    fixture_name,
+    start_replay_server,
+)
+from dev.synthetic_payloads import (
+    get_dk_eventgroup_payload,
+    nba_api_resolver,
+    scale_eventgroup_payload,
+)
+
+warnings.filterwarnings("ignore")
+
+# NBA eventgroup id, the only one requested by the DK scenarios
+NBA_EVENTGROUP_ID = dk_api_functions.DK_LEAGUES["NBA"]["eventgroup_id"]
+
+# 2022-23 regular season, for nba_season_logs
+SEASON_DATES = (date(2022, 10, 18), date(2023, 4, 9))
+
+# Columns staged from each game log endpoint, same as
+# write_nba_api_game_logs()
+GAME_LOG_STAGE_COLUMNS = {
+    (entity, measure_type): (
+        [x for x in table_columns if x != "poss"]
+        if measure_type == ""
+        else join_keys + ["poss"]
+    )
+    for entity, table_columns, join_keys in (
+        ("player", NBA_API_PLAYER_GAME_LOGS_COLUMNS,
+         ["gameId", "teamId", "playerId"]),
+        ("team", NBA_API_TEAM_GAME_LOGS_COLUMNS, ["gameId", "teamId"]),
+    )
+    for measure_type in ("Advanced", "")
+}
+
+# Parse args
+parser = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+)
+parser.add_argument("--scenarios", nargs="+", help="Default every scenario")
+parser.add_argument("--repeat", type=int, default=3)
+parser.add_argument("--fixtures", help="Directory of recorded responses")
+parser.add_argument("--results", default="bench_results.jsonl")
+parser.add_argument("--baseline", help="Commit to compare to")
+args = parser.parse_args()
+
+# Responses served for the current scenario, set by its fetch stage
+serving = {"dk": None, "nba": nba_api_resolver}
+
+
+# Functions
+def resolver(path, query):
+    """
+    Function to answer DraftKings and NBA API requests for the current
+    scenario
+    """
+    if "eventgroups" in path:
+        return serving["dk"]
+    return serving["nba"](path, query)
+
+
+def get_dk_stages(payload):
+    """
+    Function to build the stages of an NBA eventgroup scenario
+    Args:
+    payload (dict or bytes): eventgroup response to serve
+    Returns:
+    stages (list): (stage, function returning rows handled)
+    """
+    if isinstance(payload, dict):
+        payload = json.dumps(payload).encode()
+    results = {}
+
+    # Download and stream-parse events and game line offers
+    def fetch():
+        serving["dk"] = payload
+        results["fetch"] = get_team_game_lines("NBA", ttl=0)
+        return len(results["fetch"][1])
+
+    # Reshape offers to one row per event and team type
+    def parse():
+        results["parse"] = parse_league_team_odds("NBA", results["fetch"])
+        return len(results["parse"][1])
+
+    # Upsert events and odds in one transaction
+    def write():
+        run_db_stage(update_team_odds, {"NBA": results["parse"]})
+        return len(results["parse"][0]) + len(results["parse"][1])
+
+    return [("fetch", fetch), ("parse", parse), ("write", write)]
+
+
+def get_game_log_stages(nba_resolver, date_from: date, date_to: date):
+    """
+    Function to build the stages of a game log scenario
+    Args:
+    nba_resolver (function): resolver answering game log requests
+    date_from (date): first game date
+    date_to (date): last game date
+    Returns:
+    stages (list): (stage, function returning rows handled)
+    """
+    results = {}
+
+    # Download every weekly window of the four endpoints
+    def fetch():
+        serving["nba"] = nba_resolver
+        results["fetch"] = {
+            endpoint: get_nba_api_game_log_result_sets(
+                {}, *endpoint, date_from, date_to
+            )
+            for endpoint in GAME_LOG_STAGE_COLUMNS
+        }
+        return sum(
+            len(row_set)
+            for result_sets in results["fetch"].values()
+            for _, row_set in result_sets
+        )
+
+    # Select the staged columns of every row, done lazily while copying
+    # in the write stage
+    def parse():
+        rows = 0
+        for endpoint, result_sets in results["fetch"].items():
+            for headers, row_set in result_sets:
+                for _ in select_row_set_columns(
+                    headers, row_set, GAME_LOG_STAGE_COLUMNS[endpoint]
+                ):
+                    rows += 1
+        return rows
+
+    # Copy and merge each window, one transaction per window
+    def write():
+        rows = 0
+        for entity in ("team", "player"):
+            for adv, base in zip(
+                results["fetch"][(entity, "Advanced")],
+                results["fetch"][(entity, "")],
+            ):
+                run_db_stage(write_nba_api_game_logs, entity, adv, base)
+                rows += len(base[1])
+        return rows
+
+    return [("fetch", fetch), ("parse", parse), ("write", write)]
+
+
+def get_scenarios():
+    """
+    Function to build every scenario available
+    Returns:
+    scenarios (dict): scenario -> stages
+    """
+    scenarios = {
+        "dk_one_game": get_dk_stages(get_dk_eventgroup_payload(1)),
+        "dk_full_slate": get_dk_stages(get_dk_eventgroup_payload(15)),
+        "dk_1000_events": get_dk_stages(get_dk_eventgroup_payload(1000)),
+        "nba_season_logs": get_game_log_stages(
+            cached_resolver(nba_api_resolver), *SEASON_DATES
+        ),
+    }
+    if not args.fixtures:
+        return scenarios
+
+    # Recorded NBA eventgroup, as captured and scaled up
+    fixture_resolver = fixture_dir_resolver(args.fixtures)
+    dk_fixture = fixture_resolver("/eventgroups/" + str(NBA_EVENTGROUP_ID), {})
+    if dk_fixture is not None:
+        scenarios["dk_fixture"] = get_dk_stages(dk_fixture)
+        scenarios["dk_fixture_1000_events"] = get_dk_stages(
+            scale_eventgroup_payload(json.loads(dk_fixture), 1000)
+        )
+
+    # Recorded game logs, the same response is served for every window
+    # so fetch a single one
+    if os.path.exists(
+        os.path.join(args.fixtures, fixture_name("/playergamelogs", {}))
+    ):
+        scenarios["nba_fixture_logs"] = get_game_log_stages(
+            fixture_resolver, SEASON_DATES[0], SEASON_DATES[0]
+        )
+
+    return scenarios
+
+
+def run_stage(stage):
+    """
+    Function to time a stage, best of args.repeat runs after a warm-up,
+    then trace its peak memory in one more run
+    Args:
+    stage (function): function returning rows handled
+    Returns:
+    rows (int): rows handled
+    seconds (float): fastest run
+    peak_mb (float): peak traced memory of the traced run
+    """
+    # Stage functions print progress, keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        stage()
+        timings = []
+        for _ in range(args.repeat):
+            start_time = time.perf_counter()
+            rows = stage()
+            timings.append(time.perf_counter() - start_time)
+
+        tracemalloc.start()
+        stage()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return rows, min(timings), peak / 1024 / 1024
+
+
+def get_commit():
+    """
+    Function to get the short hash of HEAD, marked -dirty if tracked
+    files have changed
+    """
+    commit = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"],
+        capture_output=True, text=True, check=True,
+    ).stdout.strip()
+    if subprocess.run(
+        ["git", "status", "--porcelain", "--untracked-files=no"],
+        capture_output=True, text=True, check=True,
+    ).stdout.strip():
+        commit = commit + "-dirty"
+
+    return commit
+
+
+def format_change(change: float):
+    """
+    Function to format a relative change, blank if the baseline didn't
+    run the stage
+    """
+    return "" if pd.isna(change) else format(change, "+.1%")
+
+
+# Point both APIs at the replay server
+server, base_url = start_replay_server(resolver)
+dk_api_functions.DK_API_URL = base_url + "eventgroups/"
+nba_api_functions.NBA_API_URL = base_url
+
+# The replay server doesn't throttle, so don't rate limit requests to it
+nba_api_functions.NBA_API_CLIENT = RetryingClient(rate=1000, burst=1000)
+
+if "DATABASE_URL" in os.environ:
+    configure_db_pool()
+else:
+    print("DATABASE_URL not set, skipping write stages")
+
+current_commit = get_commit()
+run_time = datetime.now(timezone.utc).isoformat(timespec="seconds")
+all_scenarios = get_scenarios()
+records = []
+for scenario in args.scenarios or all_scenarios:
+    for stage_name, stage_func in all_scenarios[scenario]:
+        if stage_name == "write" and "DATABASE_URL" not in os.environ:
+            continue
+        stage_rows, stage_seconds, stage_peak_mb = run_stage(stage_func)
+        records.append(
+            {
+                "commit": current_commit,
+                "time": run_time,
+                "scenario": scenario,
+                "stage": stage_name,
+                "rows": stage_rows,
+                "seconds": round(stage_seconds, 6),
+                "rows_per_sec": round(stage_rows / stage_seconds, 1),
+                "peak_mb": round(stage_peak_mb, 3),
+            }
+        )
+        print(
+            scenario
+            + " "
+            + stage_name
+            + ": "
+            + str(stage_rows)
+            + " rows in "
+            + str(round(stage_seconds, 4))
+            + "s"
+        )
+server.shutdown()
+
+# Earlier runs, to compare against
+history = pd.DataFrame()
+if os.path.exists(args.results):
+    history = pd.read_json(args.results, lines=True, dtype={"commit": str})
+
+# Append this run
+with open(args.results, "a", encoding="utf-8") as results_file:
+    for record in records:
+        results_file.write(json.dumps(record) + "\n")
+
+report = pd.DataFrame(records)
+baseline_commit = args.baseline
+if baseline_commit is None and len(history) > 0:
+    other_commits = history[history["commit"] != current_commit]["commit"]
+    if len(other_commits) > 0:
+        baseline_commit = other_commits.iloc[-1]
+
+# Latest run of the baseline commit, per scenario and stage
+if baseline_commit is not None and len(history) > 0:
+    baseline = (
+        history[history["commit"] == baseline_commit]
+        .drop_duplicates(["scenario", "stage"], keep="last")
+        .set_index(["scenario", "stage"])
+    )
+    report = report.join(
+        baseline[["rows_per_sec", "peak_mb"]],
+        on=["scenario", "stage"],
+        rsuffix="_base",
+    )
+    report["rows_per_sec_change"] = (
+        report["rows_per_sec"] / report["rows_per_sec_base"] - 1
+    ).map(format_change)
+    report["peak_mb_change"] = (
+        report["peak_mb"] / report["peak_mb_base"] - 1
+    ).map(format_change)
+    report = report.drop(columns=["rows_per_sec_base", "peak_mb_base"])
+    print("Compared to " + baseline_commit)
+
+print(report.drop(columns=["commit", "time"]).to_string(index=False))
+print("Appended " + str(len(records)) + " results to " + args.results)
@@ -0,0 +1,168 @@
+"""
+Run the odds poller against a replayed sequence of DraftKings payloads
+
+Serves a scripted sequence of synthetic eventgroup payloads (new slate,
+unchanged, one line moved, every line moved), a restart seeded from
+dk_nba_team_odds_history, then a soak of polls that each move one line.
+Checks the rows appended to dk_nba_team_odds_history and reports poll
+time and memory growth.
+
+Needs a database with SQL/table_create_schema applied and no history for
+the synthetic events yet, poll_odds.py writes to the same tables.
+
+Usage (from the repo root):
+    DATABASE_URL=postgresql://... python -m dev.replay_odds_poller
+"""
+# Import packages
+import argparse
+import copy
+import json
+import os
+import time
+import warnings
+import psutil
+import psycopg2
+import pandas as pd
+from functions import dk_api_functions
+from functions.poller_functions import (
+    get_last_team_lines,
+    poll_nba_team_odds_once,
+)
+from dev.replay_server import sequence_resolver, start_replay_server
+from dev.synthetic_payloads import get_dk_eventgroup_payload
+
+warnings.filterwarnings("ignore")
+
+
+# Functions
+def move_moneyline(payload: dict, event_ind: int, step: int):
+    """
+    Function to copy a payload with one event's moneyline moved
+    Args:
+    payload (dict): payload from get_dk_eventgroup_payload()
+    event_ind (int): index of event to move
+    step (int): amount to move the away moneyline by
+    Returns:
+    payload (dict): moved copy of payload
+    """
+    payload = copy.deepcopy(payload)
+    moneyline = payload["eventGroup"]["offerCategories"][0][
+        "offerSubcategoryDescriptors"
+    ][0]["offerSubcategory"]["offers"][event_ind][2]["outcomes"][0]
+    moneyline["oddsAmerican"] = str(
+        int(moneyline["oddsAmerican"]) - step
+    )
+
+    return payload
+
+
+def count_history_rows(db_con):
+    """
+    Function to count rows in dk_nba_team_odds_history
+    Args:
+    db_con (connection): connection to SQL database
+    Returns:
+    row_count (int): number of history rows
+    """
+    with db_con.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM dk_nba_team_odds_history")
+        return cursor.fetchone()[0]
+
+
+if __name__ == "__main__":
+    # Parse args
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=15)
+    parser.add_argument("--soak-polls", type=int, default=200)
+    cli_args = parser.parse_args()
+
+    # Slate tipping off in an hour
+    start_date = (
+        pd.Timestamp.now(tz="UTC") + pd.Timedelta(hours=1)
+    ).strftime("%Y-%m-%dT%H:%M:%SZ")
+    slate = get_dk_eventgroup_payload(cli_args.events, start_date, seed=0)
+
+    # Scripted polls -> team rows expected to change, moving an away
+    # moneyline only changes the away row
+    script = [
+        (slate, 2 * cli_args.events),
+        (slate, 0),
+        (move_moneyline(slate, 0, 5), 1),
+        (
+            get_dk_eventgroup_payload(cli_args.events, start_date, seed=1),
+            2 * cli_args.events,
+        ),
+    ]
+
+    # Soak polls, each moving one line
+    soak = [
+        move_moneyline(slate, poll % cli_args.events, poll % 50 + 1)
+        for poll in range(cli_args.soak_polls)
+    ]
+    # Last scripted payload again after the restart
+    payloads = (
+        [json.dumps(x[0]).encode() for x in script]
+        + [json.dumps(script[-1][0]).encode()]
+        + [json.dumps(x).encode() for x in soak]
+    )
+
+    # Point the DK client at the replay server
+    server, base_url = start_replay_server(sequence_resolver(payloads))
+    dk_api_functions.DK_API_URL = base_url + "eventgroups/"
+
+    con = psycopg2.connect(os.environ["DATABASE_URL"])
+    con.autocommit = True
+
+    # Scripted polls change exactly the expected team rows
+    last_offer_hashes = {}
+    last_team_lines = get_last_team_lines(con)
+    history_rows = count_history_rows(con)
+    for poll, (_, expected_count) in enumerate(script):
+        _, changed_count = poll_nba_team_odds_once(
+            con, last_offer_hashes, last_team_lines
+        )
+        new_history_rows = count_history_rows(con) - history_rows
+        history_rows += new_history_rows
+        assert changed_count == expected_count, (poll, changed_count)
+        assert new_history_rows == expected_count, (poll, new_history_rows)
+        print(
+            "Poll "
+            + str(poll + 1)
+            + ": "
+            + str(new_history_rows)
+            + " history rows appended"
+        )
+
+    # Restart with empty hashes, unchanged lines aren't appended again
+    last_offer_hashes = {}
+    last_team_lines = get_last_team_lines(con)
+    assert len(last_team_lines) == 2 * cli_args.events, len(last_team_lines)
+    poll_nba_team_odds_once(con, last_offer_hashes, last_team_lines)
+    assert count_history_rows(con) == history_rows
+    print("Restart: 0 history rows appended")
+
+    # Soak, memory should stay flat
+    process = psutil.Process()
+    poll_times = []
+    start_rss = process.memory_info().rss
+    for _ in soak:
+        start_time = time.perf_counter()
+        poll_nba_team_odds_once(con, last_offer_hashes, last_team_lines)
+        poll_times.append(time.perf_counter() - start_time)
+    end_rss = process.memory_info().rss
+
+    print(
+        str(cli_args.soak_polls)
+        + " soak polls: median "
+        + str(round(sorted(poll_times)[len(poll_times) // 2] * 1000, 1))
+        + "ms, max "
+        + str(round(max(poll_times) * 1000, 1))
+        + "ms per poll, RSS "
+        + str(round(start_rss / 1e6, 1))
+        + "MB -> "
+        + str(round(end_rss / 1e6, 1))
+        + "MB"
+    )
+
+    con.close()
+    server.shutdown()
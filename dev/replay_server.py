@@ -0,0 +1,320 @@
+"""
+Local HTTP server that replays recorded or synthetic API responses
+
+Responses are resolved from the request path + query by a resolver
+function, so the same server can replay files captured from DraftKings /
+stats.nba.com or payloads generated by dev/synthetic_payloads.py, or
+step through a sequence of payloads one request at a time. An
+artificial latency can be added to every response to mimic a slow host,
+and a Throttle can rate limit, ban and fail requests the way
+stats.nba.com does.
+
+Usage (from the repo root):
+    python -m dev.replay_server --fixtures dev/fixtures --latency 0.5
+"""
+# Import packages
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import requests
+
+
+# Classes
+class Throttle: #pylint: disable=too-many-instance-attributes,too-few-public-methods
+    """
+    Server side rate limit: requests past `rate` per second are answered
+    429 (optionally after hanging), clients that get ban_after 429s
+    within 10 seconds are banned with 403s for ban_seconds, and a
+    failure_rate share of requests get a 503
+    """
+
+    def __init__( #pylint: disable=too-many-arguments
+        self,
+        rate: float,
+        ban_after: int = None,
+        ban_seconds: float = 60.0,
+        failure_rate: float = 0.0,
+        hang_seconds: float = 0.0,
+    ):
+        """
+        Args:
+        rate (float): requests answered per second
+        ban_after (int): 429s within 10 seconds that get the client
+            banned, None never bans
+        ban_seconds (float): seconds a ban lasts
+        failure_rate (float): share of requests answered 503
+        hang_seconds (float): seconds throttled requests hang before
+            the 429, so clients with shorter timeouts see a timeout
+        """
+        self.rate = rate
+        self.ban_after = ban_after
+        self.ban_seconds = ban_seconds
+        self.failure_rate = failure_rate
+        self.hang_seconds = hang_seconds
+        self.answered = deque()
+        self.throttled = deque()
+        self.banned_until = 0.0
+        self.counts = {"ok": 0, "throttled": 0, "banned": 0, "failed": 0}
+        self.lock = threading.Lock()
+
+    def check(self):
+        """
+        Function to decide how to answer a request
+        Returns:
+        status (int): 429, 403 or 503, None to answer normally
+        """
+        with self.lock:
+            now = time.monotonic()
+            if now < self.banned_until:
+                self.counts["banned"] += 1
+                return 403
+
+            # Requests answered in the last second
+            while self.answered and now - self.answered[0] >= 1:
+                self.answered.popleft()
+            if len(self.answered) >= self.rate:
+                # 429s in the last 10 seconds, too many -> ban
+                self.throttled.append(now)
+                while self.throttled and now - self.throttled[0] >= 10:
+                    self.throttled.popleft()
+                if self.ban_after and len(self.throttled) >= self.ban_after:
+                    self.banned_until = now + self.ban_seconds
+                self.counts["throttled"] += 1
+                return 429
+
+            self.answered.append(now)
+            if random.random() < self.failure_rate:
+                self.counts["failed"] += 1
+                return 503
+
+            self.counts["ok"] += 1
+            return None
+
+
+# Functions
+def fixture_name(path: str, query: dict):
+    """
+    Function to get the fixture file name for a request
+    Args:
+    path (str): request path, e.g. /stats/playergamelogs
+    query (dict): parsed query string
+    Returns:
+    name (str): e.g. playergamelogs_Advanced.json
+    """
+    # Last path component identifies the endpoint
+    name = [x for x in path.split("/") if x][-1]
+
+    # Game log endpoints are split by MeasureType
+    measure_type = query.get("MeasureType", [""])[0]
+    if measure_type:
+        name = name + "_" + measure_type
+
+    return name + ".json"
+
+
+def fixture_dir_resolver(fixture_dir: str):
+    """
+    Function to create a resolver that serves files from a directory
+    Args:
+    fixture_dir (str): directory of recorded responses
+    Returns:
+    resolver (function): (path, query) -> response bytes or None
+    """
+
+    def resolver(path, query):
+        fixture_path = os.path.join(fixture_dir, fixture_name(path, query))
+        if not os.path.exists(fixture_path):
+            return None
+        with open(fixture_path, "rb") as fixture:
+            return fixture.read()
+
+    return resolver
+
+
+def sequence_resolver(payloads: list):
+    """
+    Function to create a resolver that serves payloads in order, one per
+    request, repeating the last one once the sequence is used up
+    Args:
+    payloads (list): response bodies, bytes or JSON-able
+    Returns:
+    resolver (function): (path, query) -> next payload
+    """
+    lock = threading.Lock()
+    position = [0]
+
+    def resolver(path, query): #pylint: disable=unused-argument
+        with lock:
+            payload = payloads[min(position[0], len(payloads) - 1)]
+            position[0] += 1
+        return payload
+
+    return resolver
+
+
+def record_fixture(url: str, headers: dict, fixture_dir: str):
+    """
+    Function to capture a live response into a fixture directory
+    Args:
+    url (str): live url to request
+    headers (dict): headers for request
+    fixture_dir (str): directory of recorded responses
+    Returns:
+    fixture_path (str): path of the recorded file
+    """
+    # Get live response
+    request = requests.get(url, headers=headers, timeout=60)
+
+    # Save body under the name the replay server will look up
+    split_url = urlsplit(url)
+    fixture_path = os.path.join(
+        fixture_dir,
+        fixture_name(split_url.path, parse_qs(split_url.query)),
+    )
+    os.makedirs(fixture_dir, exist_ok=True)
+    with open(fixture_path, "wb") as fixture:
+        fixture.write(request.content)
+
+    return fixture_path
+
+
+def cached_resolver(resolver):
+    """
+    Function to wrap a resolver so every response is built and encoded
+    once, e.g. so synthetic payloads aren't rebuilt inside timed runs
+    Args:
+    resolver (function): (path, query) -> response bytes, dict or None
+    Returns:
+    resolver (function): same responses, built on first request
+    """
+    responses = {}
+
+    def cached(path, query):
+        key = path + json.dumps(query, sort_keys=True)
+        if key not in responses:
+            body = resolver(path, query)
+            if isinstance(body, (dict, list)):
+                body = json.dumps(body).encode()
+            responses[key] = body
+        return responses[key]
+
+    return cached
+
+
+def start_replay_server(
+    resolver, latency: float = 0.0, port: int = 0, throttle=None
+):
+    """
+    Function to start a replay server on a background thread
+    Args:
+    resolver (function): (path, query) -> response bytes, dict or None
+    latency (float): seconds to sleep before every response
+    port (int): port to listen on, 0 picks a free port
+    throttle (Throttle): rate limit applied before resolving, optional
+    Returns:
+    server (ThreadingHTTPServer): running server, call shutdown() to stop
+    base_url (str): url of the server, e.g. http://127.0.0.1:8000/
+    """
+
+    class ReplayHandler(BaseHTTPRequestHandler):
+        """
+        Handler that answers GET requests from the resolver
+        """
+
+        # Keep-alive so clients can reuse connections
+        protocol_version = "HTTP/1.1"
+
+        # Headers and body are written separately, without this small
+        # responses wait on the client's delayed ACK (~40ms)
+        disable_nagle_algorithm = True
+
+        def do_GET(self): #pylint: disable=invalid-name
+            """
+            Function to answer a GET request
+            """
+            # Throttled, banned or failed -> empty error response
+            status = throttle.check() if throttle is not None else None
+            if status is not None:
+                if status == 429:
+                    time.sleep(throttle.hang_seconds)
+                self.send_response(status)
+                if status == 429:
+                    self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            # Resolve response body
+            split_url = urlsplit(self.path)
+            body = resolver(split_url.path, parse_qs(split_url.query))
+            if isinstance(body, (dict, list)):
+                body = json.dumps(body).encode()
+
+            # Mimic a slow host
+            time.sleep(latency)
+
+            if body is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            # Answer conditional requests like a caching server would
+            etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args): #pylint: disable=redefined-builtin
+            """
+            Function to silence per request logging
+            """
+
+    # Start server on a daemon thread
+    server = ThreadingHTTPServer(("127.0.0.1", port), ReplayHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, "http://127.0.0.1:" + str(server.server_address[1]) + "/"
+
+
+if __name__ == "__main__":
+    # Parse args
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fixtures", default="dev/fixtures")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--rate-limit", type=float, default=None, help="Requests per second"
+    )
+    cli_args = parser.parse_args()
+
+    # Serve until interrupted
+    replay_server, replay_url = start_replay_server(
+        fixture_dir_resolver(cli_args.fixtures),
+        cli_args.latency,
+        cli_args.port,
+        Throttle(cli_args.rate_limit) if cli_args.rate_limit else None,
+    )
+    print("Replaying " + cli_args.fixtures + " at " + replay_url)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        replay_server.shutdown()
@@ -0,0 +1,601 @@
+"""
+Synthetic API payloads shaped like stats.nba.com and DraftKings responses
+"""
+# Import packages
+import copy
+import random
+from datetime import date, timedelta
+
+# Column headers returned by the game log endpoints
+PLAYER_BASE_HEADERS = [
+    "SEASON_YEAR", "PLAYER_ID", "PLAYER_NAME", "NICKNAME", "TEAM_ID",
+    "TEAM_ABBREVIATION", "TEAM_NAME", "GAME_ID", "GAME_DATE", "MATCHUP",
+    "WL", "MIN", "FGM", "FGA", "FG_PCT", "FG3M", "FG3A", "FG3_PCT", "FTM",
+    "FTA", "FT_PCT", "OREB", "DREB", "REB", "AST", "TOV", "STL", "BLK",
+    "BLKA", "PF", "PFD", "PTS", "PLUS_MINUS",
+]
+PLAYER_ADV_HEADERS = [
+    "SEASON_YEAR", "PLAYER_ID", "PLAYER_NAME", "TEAM_ID", "TEAM_ABBREVIATION",
+    "GAME_ID", "GAME_DATE", "MATCHUP", "WL", "MIN", "OFF_RATING",
+    "DEF_RATING", "PACE", "POSS",
+]
+TEAM_BASE_HEADERS = [
+    x for x in PLAYER_BASE_HEADERS
+    if x not in ("PLAYER_ID", "PLAYER_NAME", "NICKNAME")
+]
+TEAM_ADV_HEADERS = [
+    x for x in PLAYER_ADV_HEADERS if x not in ("PLAYER_ID", "PLAYER_NAME")
+]
+
+# First NBA API team id, the league's 30 ids are consecutive
+FIRST_TEAM_ID = 1610612737
+
+
+# Functions
+def get_schedule(date_from: date, date_to: date, games_per_day: int = 8):
+    """
+    Function to create a deterministic schedule for a date range
+    Args:
+    date_from (date): first game date
+    date_to (date): last game date
+    games_per_day (int): games played each day, max 15
+    Returns:
+    schedule (list): (game_id, game_date, away_team_id, home_team_id)
+    """
+    schedule = []
+    day = date_from
+    while day <= date_to:
+        # Rotate matchups by day so teams meet different opponents
+        offset = day.toordinal() % 30
+        for game in range(games_per_day):
+            away = FIRST_TEAM_ID + (offset + 2 * game) % 30
+            home = FIRST_TEAM_ID + (offset + 2 * game + 1) % 30
+            game_id = "00" + str(
+                22000000 + day.toordinal() % 100000 * 20 + game
+            )
+            schedule.append((game_id, day, away, home))
+        day = day + timedelta(days=1)
+
+    return schedule
+
+
+def get_game_log_payload( #pylint: disable=too-many-locals
+    entity: str,
+    measure_type: str,
+    date_from: date,
+    date_to: date,
+    players_per_team: int = 13,
+):
+    """
+    Function to create a playergamelogs/teamgamelogs style response
+    Args:
+    entity (str): one of 'player', 'team'
+    measure_type (str): '' for Base or 'Advanced'
+    date_from (date): first game date
+    date_to (date): last game date
+    players_per_team (int): players logged per team-game
+    Returns:
+    resp (dict): response with one resultSet
+    """
+    # Pick headers for endpoint
+    headers = {
+        ("player", ""): PLAYER_BASE_HEADERS,
+        ("player", "Advanced"): PLAYER_ADV_HEADERS,
+        ("team", ""): TEAM_BASE_HEADERS,
+        ("team", "Advanced"): TEAM_ADV_HEADERS,
+    }[(entity, measure_type)]
+
+    row_set = []
+    for game_id, game_date, away, home in get_schedule(date_from, date_to):
+        for team_id in (away, home):
+            # One row per team, or one per player on the team
+            if entity == "player":
+                player_ids = [
+                    (team_id - FIRST_TEAM_ID) * 100 + x
+                    for x in range(players_per_team)
+                ]
+            else:
+                player_ids = [None]
+
+            for player_id in player_ids:
+                # Same ids always produce the same stats
+                rng = random.Random(game_id + str(team_id) + str(player_id))
+                values = {
+                    "PLAYER_ID": player_id,
+                    "TEAM_ID": team_id,
+                    "GAME_ID": game_id,
+                    "GAME_DATE": game_date.isoformat() + "T00:00:00",
+                    "WL": "W" if (team_id == home) == (rng.random() > 0.4)
+                    else "L",
+                    "MIN": 240 if entity == "team" else round(
+                        rng.uniform(0, 40), 2
+                    ),
+                }
+                row = []
+                for header in headers:
+                    if header in values:
+                        row.append(values[header])
+                    elif header in (
+                        "SEASON_YEAR", "PLAYER_NAME", "NICKNAME",
+                        "TEAM_ABBREVIATION", "TEAM_NAME", "MATCHUP",
+                    ):
+                        row.append("X")
+                    elif "PCT" in header or "RATING" in header or header in (
+                        "PACE", "PLUS_MINUS",
+                    ):
+                        row.append(round(rng.random(), 3))
+                    else:
+                        row.append(
+                            rng.randint(0, 120 if entity == "team" else 15)
+                        )
+                row_set.append(row)
+
+    return {
+        "resource": entity + "gamelogs",
+        "resultSets": [
+            {"name": entity.title() + "GameLogs", "headers": headers,
+             "rowSet": row_set}
+        ],
+    }
+
+
+def get_scoreboard_payload(day: date):
+    """
+    Function to create a scoreboardv3 style response
+    Args:
+    day (date): game date
+    Returns:
+    resp (dict): response with the day's games from get_schedule()
+    """
+    games = []
+    for game_id, game_date, away, home in get_schedule(day, day):
+        # gameEt is Eastern wall clock time labelled UTC, like the API
+        games.append(
+            {
+                "gameId": game_id,
+                "gameEt": game_date.isoformat() + "T19:00:00Z",
+                "awayTeam": {
+                    "teamId": away,
+                    "teamTricode": "T" + str(away % 100).zfill(2),
+                    "teamName": "Team " + str(away),
+                },
+                "homeTeam": {
+                    "teamId": home,
+                    "teamTricode": "T" + str(home % 100).zfill(2),
+                    "teamName": "Team " + str(home),
+                },
+            }
+        )
+
+    return {"scoreboard": {"gameDate": day.isoformat(), "games": games}}
+
+
+def nba_api_resolver(path: str, query: dict):
+    """
+    Function to answer scoreboard and game log requests for the replay
+    server
+    Args:
+    path (str): request path, e.g. /playergamelogs
+    query (dict): parsed query string
+    Returns:
+    resp (dict): synthetic response, None if endpoint is unknown
+    """
+    # Parse M/D/YYYY dates
+    def parse_date(value):
+        month, day, year = [int(x) for x in value.split("/")]
+        return date(year, month, day)
+
+    # Today's games
+    if path.endswith("scoreboardv3"):
+        return get_scoreboard_payload(
+            date.fromisoformat(query["GameDate"][0])
+        )
+
+    for entity in ("player", "team"):
+        if path.endswith(entity + "gamelogs"):
+            return get_game_log_payload(
+                entity,
+                query.get("MeasureType", [""])[0],
+                parse_date(query["DateFrom"][0]),
+                parse_date(query["DateTo"][0]),
+            )
+
+    return None
+
+
+# DraftKings team names/slugs used for synthetic events
+DK_TEAMS = [
+    ("ATL", "ATL Hawks"), ("BOS", "BOS Celtics"), ("BKN", "BKN Nets"),
+    ("CHA", "CHA Hornets"), ("CHI", "CHI Bulls"), ("CLE", "CLE Cavaliers"),
+    ("DAL", "DAL Mavericks"), ("DEN", "DEN Nuggets"), ("DET", "DET Pistons"),
+    ("GS", "GS Warriors"), ("HOU", "HOU Rockets"), ("IND", "IND Pacers"),
+    ("LAC", "LA Clippers"), ("LAL", "LA Lakers"), ("MEM", "MEM Grizzlies"),
+    ("MIA", "MIA Heat"), ("MIL", "MIL Bucks"), ("MIN", "MIN Timberwolves"),
+    ("NO", "NO Pelicans"), ("NY", "NY Knicks"), ("OKC", "OKC Thunder"),
+    ("ORL", "ORL Magic"), ("PHI", "PHI 76ers"), ("PHO", "PHO Suns"),
+    ("POR", "POR Trail Blazers"), ("SAC", "SAC Kings"), ("SA", "SA Spurs"),
+    ("TOR", "TOR Raptors"), ("UTA", "UTA Jazz"), ("WAS", "WAS Wizards"),
+]
+
+
+def format_american(odds: int):
+    """
+    Function to format American odds the way DraftKings does
+    Args:
+    odds (int): American odds
+    Returns:
+    odds (str): e.g. '+150' or '-110'
+    """
+    return ("+" if odds > 0 else "-") + str(abs(odds))
+
+
+def get_spread_label(config: dict):
+    """
+    Function to get a league's spread offer label
+    Args:
+    config (dict): league config from DK_LEAGUES
+    Returns:
+    spread_label (str): e.g. 'Spread', or 'Run Line' for MLB
+    """
+    return [
+        label
+        for label, odd_type in config["offer_labels"].items()
+        if odd_type == "Spread"
+    ][0]
+
+
+def get_event_lines(rng):
+    """
+    Function to draw an event's main lines, in the same order for every
+    payload so payloads with the same seed agree
+    Args:
+    rng (Random): random number generator
+    Returns:
+    spread (float): home spread
+    total (float): total points line
+    favorite (int): away moneyline
+    """
+    spread = rng.choice([1.5, 2.5, 3, 4.5, 5.5, 6, 7.5, 9.5, 11])
+    total = rng.choice([212.5, 218, 221.5, 225.5, 230, 234.5])
+    favorite = rng.randint(-400, -105)
+
+    return spread, total, favorite
+
+
+def get_dk_eventgroup_payload( #pylint: disable=too-many-arguments, too-many-locals
+    n_events: int = 15,
+    start_date: str = "2023-01-01T00:30:00Z",
+    seed=0,
+    eventgroup_id: int = 42648,
+    subcategory_id: int = 4511,
+    spread_label: str = "Spread",
+    moneyline_only_events: int = 0,
+):
+    """
+    Function to create a DraftKings eventgroup style response
+    Args:
+    n_events (int): number of events with game lines
+    start_date (str): startDate for every event
+    seed (int): seed for odds and lines
+    eventgroup_id (int): eventgroup id, also offsets event ids
+    subcategory_id (int): Game Lines subcategory id
+    spread_label (str): spread offer label, e.g. 'Run Line' for MLB
+    moneyline_only_events (int): number of last events with their Spread
+        and Total offers pulled
+    Returns:
+    resp (dict): response with events and Game Lines offers
+    """
+    rng = random.Random(seed)
+    events = []
+    offers = []
+    for event in range(n_events):
+        # Rotate matchups through the league
+        away_slug, away_name = DK_TEAMS[(2 * event) % 30]
+        home_slug, home_name = DK_TEAMS[(2 * event + 1 + event // 15) % 30]
+        event_id = 28000000 + eventgroup_id % 1000 * 10000 + event
+
+        events.append(
+            {
+                "eventId": event_id,
+                "name": away_name + " @ " + home_name,
+                "nameIdentifier": away_name + " @ " + home_name,
+                "startDate": start_date,
+                "teamName1": away_name,
+                "teamName2": home_name,
+                "teamShortName1": away_slug,
+                "teamShortName2": home_slug,
+                "eventStatus": {"state": "NOT_STARTED"},
+            }
+        )
+
+        # Spread, Total and Moneyline offers for the event
+        spread, total, favorite = get_event_lines(rng)
+        offers.append(
+            [
+                {
+                    "providerOfferId": str(event_id) + "1",
+                    "eventId": str(event_id),
+                    "label": spread_label,
+                    "outcomes": [
+                        {"label": away_name, "oddsAmerican": "-110",
+                         "line": -spread},
+                        {"label": home_name, "oddsAmerican": "-110",
+                         "line": spread},
+                    ],
+                },
+                {
+                    "providerOfferId": str(event_id) + "2",
+                    "eventId": str(event_id),
+                    "label": "Total",
+                    "outcomes": [
+                        {"label": "Over", "oddsAmerican": "-105",
+                         "line": total},
+                        {"label": "Under", "oddsAmerican": "-115",
+                         "line": total},
+                    ],
+                },
+                {
+                    "providerOfferId": str(event_id) + "3",
+                    "eventId": str(event_id),
+                    "label": "Moneyline",
+                    "outcomes": [
+                        {"label": away_name,
+                         "oddsAmerican": format_american(favorite)},
+                        {"label": home_name,
+                         "oddsAmerican": format_american(-favorite - 20)},
+                    ],
+                },
+            ]
+        )
+
+        # Spread and Total pulled, e.g. around injury news
+        if event >= n_events - moneyline_only_events:
+            offers[-1] = [x for x in offers[-1] if x["label"] == "Moneyline"]
+
+    return {
+        "eventGroup": {
+            "eventGroupId": eventgroup_id,
+            "name": "NBA",
+            "events": events,
+            "offerCategories": [
+                {
+                    "offerCategoryId": 487,
+                    "name": "Game Lines",
+                    "offerSubcategoryDescriptors": [
+                        {
+                            "subcategoryId": subcategory_id,
+                            "name": "Game",
+                            "offerSubcategory": {
+                                "name": "Game",
+                                "subcategoryId": subcategory_id,
+                                "offers": offers,
+                            },
+                        }
+                    ],
+                }
+            ],
+        }
+    }
+
+
+def get_dk_props_payload( #pylint: disable=too-many-arguments, too-many-locals
+    category_id: int,
+    subcategory_id: int,
+    market_name: str,
+    n_events: int = 15,
+    players_per_team: int = 13,
+    lines_per_player: int = 1,
+    seed=0,
+):
+    """
+    Function to create a DraftKings player prop subcategory style response
+    Args:
+    category_id (int): offer category id, e.g. 1215
+    subcategory_id (int): offer subcategory id, e.g. 12488
+    market_name (str): subcategory name, e.g. 'Points'
+    n_events (int): number of events, same ids as get_dk_eventgroup_payload()
+    players_per_team (int): players with a prop per team
+    lines_per_player (int): Over/Under lines offered per player
+    seed (int): seed for odds and lines
+    Returns:
+    resp (dict): response with one player prop subcategory
+    """
+    rng = random.Random(seed)
+    offers = []
+    for event in range(n_events):
+        event_id = 28000000 + 42648 % 1000 * 10000 + event
+        away_slug = DK_TEAMS[(2 * event) % 30][0]
+        home_slug = DK_TEAMS[(2 * event + 1 + event // 15) % 30][0]
+
+        event_offers = []
+        for team_slug in (away_slug, home_slug):
+            for player in range(players_per_team):
+                player_name = team_slug + " Player " + str(player)
+                base_line = rng.randint(2, 30) + 0.5
+                for line in range(lines_per_player):
+                    odds = rng.randint(-130, 110)
+                    event_offers.append(
+                        {
+                            "eventId": str(event_id),
+                            "label": player_name + " " + market_name,
+                            "outcomes": [
+                                {"label": "Over", "line": base_line + line,
+                                 "participant": player_name,
+                                 "oddsAmerican": format_american(
+                                     odds if abs(odds) >= 100 else -105
+                                 )},
+                                {"label": "Under", "line": base_line + line,
+                                 "participant": player_name,
+                                 "oddsAmerican": "-115"},
+                            ],
+                        }
+                    )
+        offers.append(event_offers)
+
+    return {
+        "eventGroup": {
+            "eventGroupId": 42648,
+            "name": "NBA",
+            "offerCategories": [
+                {
+                    "offerCategoryId": category_id,
+                    "name": "Player " + market_name,
+                    "offerSubcategoryDescriptors": [
+                        {
+                            "subcategoryId": subcategory_id,
+                            "name": market_name,
+                            "offerSubcategory": {
+                                "name": market_name,
+                                "subcategoryId": subcategory_id,
+                                "offers": offers,
+                            },
+                        }
+                    ],
+                }
+            ],
+        }
+    }
+
+
+def get_dk_alt_lines_payload( #pylint: disable=too-many-arguments, too-many-locals
+    category_id: int,
+    subcategory_id: int,
+    market: str,
+    n_events: int = 15,
+    lines_per_event: int = 10,
+    seed=0,
+):
+    """
+    Function to create a DraftKings alternate line subcategory style
+    response, lines half a point apart around the main lines of
+    get_dk_eventgroup_payload() with the same seed
+    Args:
+    category_id (int): offer category id, e.g. 487
+    subcategory_id (int): offer subcategory id, e.g. 4606
+    market (str): 'Spread' or 'Total'
+    n_events (int): number of events, same ids as get_dk_eventgroup_payload()
+    lines_per_event (int): alternate lines offered per event
+    seed (int): seed of the get_dk_eventgroup_payload() lines
+    Returns:
+    resp (dict): response with one alternate line subcategory
+    """
+    rng = random.Random(seed)
+    offers = []
+    for event in range(n_events):
+        away_name = DK_TEAMS[(2 * event) % 30][1]
+        home_name = DK_TEAMS[(2 * event + 1 + event // 15) % 30][1]
+        event_id = 28000000 + 42648 % 1000 * 10000 + event
+        spread, total, _ = get_event_lines(rng)
+
+        # Lines alternating either side of the main line, away/over
+        # priced longer where its line is harder to beat
+        event_offers = []
+        for alt in range(lines_per_event):
+            step = (alt // 2 + 1) * (1 if alt % 2 == 0 else -1)
+            longer = format_american(100 + 20 * abs(step))
+            shorter = format_american(-120 - 20 * abs(step))
+            price, other_price = (
+                (longer, shorter) if step > 0 else (shorter, longer)
+            )
+            if market == "Spread":
+                outcomes = [
+                    {"label": away_name, "oddsAmerican": price,
+                     "line": -spread - step / 2},
+                    {"label": home_name, "oddsAmerican": other_price,
+                     "line": spread + step / 2},
+                ]
+            else:
+                outcomes = [
+                    {"label": "Over", "oddsAmerican": price,
+                     "line": total + step / 2},
+                    {"label": "Under", "oddsAmerican": other_price,
+                     "line": total + step / 2},
+                ]
+            event_offers.append(
+                {
+                    "eventId": str(event_id),
+                    "label": "Alternate " + market,
+                    "outcomes": outcomes,
+                }
+            )
+        offers.append(event_offers)
+
+    return {
+        "eventGroup": {
+            "eventGroupId": 42648,
+            "name": "NBA",
+            "offerCategories": [
+                {
+                    "offerCategoryId": category_id,
+                    "name": "Game Lines",
+                    "offerSubcategoryDescriptors": [
+                        {
+                            "subcategoryId": subcategory_id,
+                            "name": "Alternate " + market,
+                            "offerSubcategory": {
+                                "name": "Alternate " + market,
+                                "subcategoryId": subcategory_id,
+                                "offers": offers,
+                            },
+                        }
+                    ],
+                }
+            ],
+        }
+    }
+
+
+def scale_eventgroup_payload(payload: dict, n_events: int): #pylint: disable=too-many-locals
+    """
+    Function to scale a recorded DraftKings eventgroup response up to
+    n_events by repeating its events and offers under new event ids
+    Args:
+    payload (dict): eventgroup response, e.g. a replay fixture
+    n_events (int): number of events in the scaled response
+    Returns:
+    resp (dict): response with n_events events and their offers
+    """
+    event_group = payload["eventGroup"]
+    recorded_events = event_group["events"]
+    scaled = copy.deepcopy(payload)
+    scaled["eventGroup"]["events"] = []
+
+    # Offer lists of every subcategory, rebuilt with the scaled events
+    subcategories = [
+        (recorded["offerSubcategory"], scaled_descriptor["offerSubcategory"])
+        for category, scaled_category in zip(
+            event_group["offerCategories"],
+            scaled["eventGroup"]["offerCategories"],
+        )
+        for recorded, scaled_descriptor in zip(
+            category.get("offerSubcategoryDescriptors", []),
+            scaled_category.get("offerSubcategoryDescriptors", []),
+        )
+        if "offerSubcategory" in recorded
+    ]
+    for _, scaled_subcategory in subcategories:
+        scaled_subcategory["offers"] = []
+
+    for event in range(n_events):
+        # Copy n of a recorded event gets its id shifted by n * 10^6,
+        # offers keep the id type (int or str) they were recorded with
+        copy_number, recorded = divmod(event, len(recorded_events))
+        recorded_id = int(recorded_events[recorded]["eventId"])
+        event_id = recorded_id + copy_number * 1000000
+
+        scaled_event = copy.deepcopy(recorded_events[recorded])
+        scaled_event["eventId"] = type(scaled_event["eventId"])(event_id)
+        scaled["eventGroup"]["events"].append(scaled_event)
+
+        for recorded_subcategory, scaled_subcategory in subcategories:
+            for event_offers in recorded_subcategory["offers"]:
+                if not event_offers or (
+                    int(event_offers[0]["eventId"]) != recorded_id
+                ):
+                    continue
+                event_offers = copy.deepcopy(event_offers)
+                for offer in event_offers:
+                    offer["eventId"] = type(offer["eventId"])(event_id)
+                scaled_subcategory["offers"].append(event_offers)
+
+    return scaled
@@ -0,0 +1,265 @@
+"""
+Functions to materialize NBA team odds outcomes and beat rates
+"""
+# Import packages
+from functions.db_functions import (
+    execute_prepared,
+    transaction,
+    upsert_from_query,
+)
+
+# Columns of nba_team_odds_outcomes, in select order
+NBA_TEAM_ODDS_OUTCOMES_COLUMNS = [
+    "eventId",
+    "teamType",
+    "gameId",
+    "gameDate",
+    "teamSlug",
+    "opponentSlug",
+    "oddsMoneyline",
+    "oddsSpread",
+    "spreadLine",
+    "totalPointsLine",
+    "pts",
+    "opponentPts",
+    "atsCover",
+    "overHit",
+    "moneylineWin",
+]
+
+# Columns of nba_team_beat_rates, in select order
+NBA_TEAM_BEAT_RATES_COLUMNS = [
+    "teamSlug",
+    "eventId",
+    "windowGames",
+    "gameDate",
+    "games",
+    "atsCoverPct",
+    "overPct",
+    "moneylineWinPct",
+]
+
+# Rolling windows, in games, beat rates are kept for
+BEAT_RATE_WINDOWS = (10, 20, 82)
+
+# Outcome of every mapped DK NBA team line whose game has both team game
+# logs, pushes are left null
+NBA_TEAM_ODDS_OUTCOMES_QUERY = """
+    SELECT
+        o.eventId,
+        o.teamType,
+        m.gameId,
+        m.gameDate,
+        CASE WHEN o.teamType = 'Home'
+            THEN m.homeTeamSlug ELSE m.awayTeamSlug END,
+        CASE WHEN o.teamType = 'Home'
+            THEN m.awayTeamSlug ELSE m.homeTeamSlug END,
+        o.oddsMoneyline,
+        o.oddsSpread,
+        o.spreadLine,
+        o.totalPointsLine,
+        t.pts,
+        opp.pts,
+        CASE WHEN t.pts + o.spreadLine <> opp.pts
+            THEN t.pts + o.spreadLine > opp.pts END,
+        CASE WHEN t.pts + opp.pts <> o.totalPointsLine
+            THEN t.pts + opp.pts > o.totalPointsLine END,
+        t.pts > opp.pts
+    FROM dk_nba_event_map m
+    INNER JOIN dk_nba_team_odds o ON o.eventId = m.eventId
+    INNER JOIN nba_api_events e ON e.gameId = m.gameId
+    INNER JOIN nba_api_team_game_logs t
+        ON t.gameId = m.gameId
+        AND t.teamId = CASE WHEN o.teamType = 'Home'
+            THEN e.homeTeamId ELSE e.awayTeamId END
+    INNER JOIN nba_api_team_game_logs opp
+        ON opp.gameId = m.gameId
+        AND opp.teamId = CASE WHEN o.teamType = 'Home'
+            THEN e.awayTeamId ELSE e.homeTeamId END
+"""
+
+# Only games on or after the last materialized game date, the last day
+# is redone in case some of its games completed after the last refresh,
+# plus older lines with no outcome yet, e.g. games whose logs or mapping
+# arrived late
+NBA_TEAM_ODDS_OUTCOMES_SINCE_FILTER = """
+    WHERE m.gameDate >= (
+        SELECT COALESCE(MAX(gameDate), '-infinity'::date)
+        FROM nba_team_odds_outcomes
+    )
+    OR NOT EXISTS (
+        SELECT 1
+        FROM nba_team_odds_outcomes x
+        WHERE x.eventId = o.eventId
+        AND x.teamType = o.teamType
+    )
+"""
+
+
+# Functions
+def get_nba_team_beat_rates_query(window_games: int, full=False):
+    """
+    Function to build the rolling beat rate query for one window size,
+    over each team's games from its earliest outcome on or after the
+    last refreshed game date or without a beat rate yet
+    Args:
+    window_games (int): games in the rolling window
+    full (bool): recompute every team and game
+    Returns:
+    beat_rates_query (str): query returning NBA_TEAM_BEAT_RATES_COLUMNS
+    """
+    # Last refreshed game date for this window
+    watermark = (
+        "(SELECT COALESCE(MAX(gameDate), '-infinity'::date)"
+        + " FROM nba_team_beat_rates WHERE windowGames = "
+        + str(window_games)
+        + ")"
+    )
+    if full:
+        watermark = "'-infinity'::date"
+
+    # Each changed team's first game to recompute, later games' windows
+    # include it, so a late older game recomputes everything after it
+    return (
+        """
+        WITH teams AS (
+            SELECT o.teamSlug, MIN(o.gameDate) AS startDate
+            FROM nba_team_odds_outcomes o
+            WHERE o.gameDate >= """
+        + watermark
+        + """
+            OR NOT EXISTS (
+                SELECT 1
+                FROM nba_team_beat_rates b
+                WHERE b.teamSlug = o.teamSlug
+                AND b.eventId = o.eventId
+                AND b.windowGames = """
+        + str(window_games)
+        + """
+            )
+            GROUP BY o.teamSlug
+        ), history AS (
+            SELECT h.*
+            FROM teams
+            CROSS JOIN LATERAL (
+                (
+                    SELECT teamSlug, eventId, gameDate, atsCover, overHit,
+                        moneylineWin
+                    FROM nba_team_odds_outcomes
+                    WHERE teamSlug = teams.teamSlug
+                    AND gameDate < teams.startDate
+                    ORDER BY gameDate DESC, eventId DESC
+                    LIMIT """
+        + str(window_games - 1)
+        + """
+                )
+                UNION ALL
+                SELECT teamSlug, eventId, gameDate, atsCover, overHit,
+                    moneylineWin
+                FROM nba_team_odds_outcomes
+                WHERE teamSlug = teams.teamSlug
+                AND gameDate >= teams.startDate
+            ) h
+        )
+        SELECT r.teamSlug, eventId, """
+        + str(window_games)
+        + """, gameDate, games, atsCoverPct, overPct, moneylineWinPct
+        FROM (
+            SELECT
+                teamSlug,
+                eventId,
+                gameDate,
+                COUNT(*) OVER w AS games,
+                AVG(atsCover::int) OVER w AS atsCoverPct,
+                AVG(overHit::int) OVER w AS overPct,
+                AVG(moneylineWin::int) OVER w AS moneylineWinPct
+            FROM history
+            WINDOW w AS (
+                PARTITION BY teamSlug
+                ORDER BY gameDate, eventId
+                ROWS BETWEEN """
+        + str(window_games - 1)
+        + """ PRECEDING AND CURRENT ROW
+            )
+        ) r
+        INNER JOIN teams ON teams.teamSlug = r.teamSlug
+        WHERE r.gameDate >= teams.startDate"""
+    )
+
+
+def refresh_nba_team_odds_outcomes(cursor, full=False):
+    """
+    Function to upsert outcomes of games completed since the last refresh
+    and of older lines without one
+    Args:
+    cursor (cursor): cursor inside an open transaction
+    full (bool): recompute every game
+    Returns:
+    row_count (int): number of rows inserted or changed
+    """
+    select_query = NBA_TEAM_ODDS_OUTCOMES_QUERY
+    if not full:
+        select_query += NBA_TEAM_ODDS_OUTCOMES_SINCE_FILTER
+
+    return upsert_from_query(
+        cursor,
+        "nba_team_odds_outcomes",
+        NBA_TEAM_ODDS_OUTCOMES_COLUMNS,
+        select_query,
+        ["eventId", "teamType"],
+        skip_unchanged=True,
+    )
+
+
+def refresh_nba_team_beat_rates(cursor, window_games: int, full=False):
+    """
+    Function to upsert rolling beat rates of games since the last refresh
+    Args:
+    cursor (cursor): cursor inside an open transaction
+    window_games (int): games in the rolling window
+    full (bool): recompute every team and game
+    Returns:
+    row_count (int): number of rows inserted or changed
+    """
+    return upsert_from_query(
+        cursor,
+        "nba_team_beat_rates",
+        NBA_TEAM_BEAT_RATES_COLUMNS,
+        get_nba_team_beat_rates_query(window_games, full),
+        ["teamSlug", "eventId", "windowGames"],
+        skip_unchanged=True,
+    )
+
+
+def refresh_nba_beat_rate_analytics(con, full=False):
+    """
+    Function to refresh outcomes, then rolling beat rates, in one
+    transaction
+    Args:
+    con (connection): connection to SQL database
+    full (bool): recompute every game, e.g. after lines or game logs
+        were removed or corrected
+    Returns:
+    row_counts (dict): table -> number of rows inserted or changed
+    """
+    with transaction(con) as cursor:
+        # Rebuild from scratch, so rows whose lines or logs were removed
+        # don't linger
+        if full:
+            execute_prepared(cursor, "DELETE FROM nba_team_beat_rates")
+            execute_prepared(cursor, "DELETE FROM nba_team_odds_outcomes")
+
+        row_counts = {
+            "nba_team_odds_outcomes": refresh_nba_team_odds_outcomes(
+                cursor, full
+            ),
+            "nba_team_beat_rates": sum(
+                refresh_nba_team_beat_rates(cursor, window_games, full)
+                for window_games in BEAT_RATE_WINDOWS
+            ),
+        }
+
+    for table, row_count in row_counts.items():
+        print("Inserted/Updated " + str(row_count) + " rows in " + table)
+
+    return row_counts
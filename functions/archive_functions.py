@@ -0,0 +1,602 @@
+"""
+Functions to archive parsed ingest DataFrames to partitioned Parquet
+files, and to read them back for analysis without Postgres
+"""
+# Import packages
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from functions.dk_api_functions import (
+    DK_EVENTS_COLUMNS,
+    DK_LEAGUES,
+    DK_NBA_TEAM_ODDS_COLUMNS,
+)
+from functions.nba_api_functions import (
+    NBA_API_EVENTS_COLUMNS,
+    NBA_API_PLAYER_GAME_LOGS_COLUMNS,
+    NBA_API_TEAM_GAME_LOGS_COLUMNS,
+    convert_camel_case,
+)
+
+# Directory the archive is written to, None disables archiving, set by
+# configure_archive()
+ARCHIVE_DIR = None
+
+# Files a partition can hold before the next write compacts it into one,
+# each ingest run adds one file per partition it touches
+ARCHIVE_COMPACT_FILES = 48
+
+# Columns every archived row gets, besides its dataset's columns
+ARCHIVE_COLUMNS = {"archivedAt": "TIMESTAMP WITH TIME ZONE"}
+
+# Datasets: column types, the date column partitions are derived from,
+# and the key columns of a row, where the latest archived row wins.
+# Odds have no key columns, every snapshot is kept as line history
+ARCHIVE_DATASETS = {
+    "dk_events": {
+        "columns": DK_EVENTS_COLUMNS,
+        "date_column": "startDate",
+        "key_columns": ["eventId"],
+    },
+    "dk_team_odds": {
+        "columns": {
+            **DK_NBA_TEAM_ODDS_COLUMNS,
+            "startDate": "TIMESTAMP WITH TIME ZONE",
+        },
+        "date_column": "startDate",
+        "key_columns": None,
+    },
+    "nba_api_events": {
+        "columns": NBA_API_EVENTS_COLUMNS,
+        "date_column": "gameEt",
+        "key_columns": ["gameId"],
+    },
+    "nba_api_team_game_logs": {
+        "columns": {
+            **NBA_API_TEAM_GAME_LOGS_COLUMNS,
+            "gameDate": "DATE",
+            "seasonYear": "VARCHAR(7)",
+        },
+        "date_column": "gameDate",
+        "key_columns": ["gameId", "teamId"],
+    },
+    "nba_api_player_game_logs": {
+        "columns": {
+            **NBA_API_PLAYER_GAME_LOGS_COLUMNS,
+            "gameDate": "DATE",
+            "seasonYear": "VARCHAR(7)",
+        },
+        "date_column": "gameDate",
+        "key_columns": ["gameId", "playerId"],
+    },
+}
+
+# SQL column types -> Parquet column types, VARCHAR(n) is a string
+ARCHIVE_TYPES = {
+    "INT": pa.int64(),
+    "FLOAT": pa.float64(),
+    "DOUBLE PRECISION": pa.float64(),
+    "DATE": pa.date32(),
+    "TIMESTAMP WITH TIME ZONE": pa.timestamp("us", tz="UTC"),
+}
+
+# Columns read from partition directory names
+ARCHIVE_PARTITION_FIELDS = [
+    pa.field("league", pa.string()),
+    pa.field("month", pa.string()),
+]
+
+
+# Functions
+def configure_archive(archive_dir: str):
+    """
+    Function to enable archiving parsed DataFrames to Parquet
+    Args:
+    archive_dir (str): directory to write the archive to
+    Returns:
+    archive_dir (str): directory now archived to
+    """
+    global ARCHIVE_DIR #pylint: disable=global-statement
+    ARCHIVE_DIR = archive_dir
+    os.makedirs(archive_dir, exist_ok=True)
+
+    return ARCHIVE_DIR
+
+
+def get_archive_schema(dataset: str):
+    """
+    Function to get the Parquet schema of a dataset's files
+    Args:
+    dataset (str): key of ARCHIVE_DATASETS
+    Returns:
+    schema (Schema): dataset columns then ARCHIVE_COLUMNS
+    """
+    columns = {**ARCHIVE_DATASETS[dataset]["columns"], **ARCHIVE_COLUMNS}
+
+    return pa.schema(
+        [
+            (
+                col,
+                pa.string()
+                if typ.startswith("VARCHAR")
+                else ARCHIVE_TYPES[typ],
+            )
+            for col, typ in columns.items()
+        ]
+    )
+
+
+def to_archive_table(df, schema):
+    """
+    Function to convert a DataFrame to an Arrow table with the archive
+    schema, so every file of a dataset has the same column types
+    Args:
+    df (df): dataframe with every column of the schema
+    schema (Schema): schema from get_archive_schema()
+    Returns:
+    table (Table): table to write
+    """
+    arrays = []
+    for field in schema:
+        values = df[field.name]
+        if pa.types.is_timestamp(field.type):
+            values = pd.to_datetime(values, utc=True)
+        elif pa.types.is_date32(field.type):
+            values = pd.to_datetime(values).dt.date
+        elif pa.types.is_integer(field.type):
+            # Nullable ints, fails on fractional values like the database
+            values = pd.to_numeric(values).astype("Int64")
+        elif pa.types.is_floating(field.type):
+            values = pd.to_numeric(values).astype(float)
+        else:
+            values = values.astype(object).where(values.notna(), None)
+        arrays.append(pa.array(values, type=field.type, from_pandas=True))
+
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def get_partition_months(dates):
+    """
+    Function to get the month partition of each date
+    Args:
+    dates (Series): dates or timestamps
+    Returns:
+    months (Series): 'YYYY-MM' per date
+    """
+    dates = pd.to_datetime(dates)
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_convert("UTC")
+
+    return dates.dt.strftime("%Y-%m")
+
+
+def get_partition_dir(dataset: str, league: str, month: str):
+    """
+    Function to get the directory of a partition
+    Args:
+    dataset (str): key of ARCHIVE_DATASETS
+    league (str): league, e.g. 'NBA'
+    month (str): month, format 'YYYY-MM'
+    Returns:
+    partition_dir (str): hive style dataset/league=X/month=YYYY-MM path
+    """
+    return os.path.join(
+        ARCHIVE_DIR, dataset, "league=" + league, "month=" + month
+    )
+
+
+def write_partition_file(partition_dir: str, table):
+    """
+    Function to write a table to a new file in a partition, renamed into
+    place once complete so readers never see a partial file
+    Args:
+    partition_dir (str): partition directory
+    table (Table): table to write
+    Returns:
+    path (str): path of the file written
+    """
+    os.makedirs(partition_dir, exist_ok=True)
+    path = os.path.join(
+        partition_dir,
+        datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        + "-"
+        + uuid.uuid4().hex[:8]
+        + ".parquet",
+    )
+    pq.write_table(table, path + ".tmp", compression="zstd")
+    os.replace(path + ".tmp", path)
+
+    return path
+
+
+def archive_df(dataset: str, league: str, df):
+    """
+    Function to append a parsed DataFrame to its dataset, one new file
+    per month partition it covers
+    Args:
+    dataset (str): key of ARCHIVE_DATASETS
+    league (str): league, e.g. 'NBA'
+    df (df): dataframe with the dataset's columns
+    Returns:
+    row_count (int): number of rows archived, 0 if archiving is disabled
+    """
+    if ARCHIVE_DIR is None or len(df) == 0:
+        return 0
+
+    # Every row of a write shares its archive time
+    df = df.assign(archivedAt=pd.Timestamp.now(tz="UTC"))
+    schema = get_archive_schema(dataset)
+    months = get_partition_months(df[ARCHIVE_DATASETS[dataset]["date_column"]])
+
+    for month, month_df in df.groupby(months):
+        partition_dir = get_partition_dir(dataset, league, month)
+        write_partition_file(partition_dir, to_archive_table(month_df, schema))
+
+        # Keep partitions to a few files, reads open every file
+        if len(get_partition_files(partition_dir)) > ARCHIVE_COMPACT_FILES:
+            compact_partition(dataset, partition_dir)
+
+    return len(df)
+
+
+def get_partition_files(partition_dir: str):
+    """
+    Function to list the complete files of a partition
+    Args:
+    partition_dir (str): partition directory
+    Returns:
+    paths (list): paths of .parquet files, oldest first
+    """
+    if not os.path.isdir(partition_dir):
+        return []
+
+    return sorted(
+        os.path.join(partition_dir, x)
+        for x in os.listdir(partition_dir)
+        if x.endswith(".parquet")
+    )
+
+
+def keep_latest_rows(df, key_columns):
+    """
+    Function to keep the latest archived row per key
+    Args:
+    df (df): dataframe with key_columns and archivedAt
+    key_columns (list): columns identifying a row
+    Returns:
+    df (df): one row per key, in the original order and index
+    """
+    return (
+        df.sort_values("archivedAt", kind="stable")
+        .drop_duplicates(key_columns, keep="last")
+        .sort_index()
+    )
+
+
+def compact_partition(dataset: str, partition_dir: str):
+    """
+    Function to rewrite a partition's files as one file, keeping only the
+    latest row per key for keyed datasets. Files written while compacting
+    are left for the next compaction
+    Args:
+    dataset (str): key of ARCHIVE_DATASETS
+    partition_dir (str): partition directory
+    Returns:
+    row_count (int): rows in the compacted file
+    """
+    paths = get_partition_files(partition_dir)
+    schema = get_archive_schema(dataset)
+    table = pa.concat_tables([pq.read_table(x, schema=schema) for x in paths])
+
+    # Take the latest rows by position, other columns stay in Arrow
+    key_columns = ARCHIVE_DATASETS[dataset]["key_columns"]
+    if key_columns:
+        table = table.take(
+            keep_latest_rows(
+                table.select(key_columns + ["archivedAt"]).to_pandas(),
+                key_columns,
+            ).index.to_numpy()
+        )
+
+    # New file first, so rows are never missing from the partition
+    write_partition_file(partition_dir, table)
+    for path in paths:
+        os.remove(path)
+
+    return table.num_rows
+
+
+def compact_archive(dataset: str = None):
+    """
+    Function to compact every partition of one or every dataset holding
+    more than one file, e.g. after a backfill
+    Args:
+    dataset (str): key of ARCHIVE_DATASETS, default every dataset
+    """
+    for name in [dataset] if dataset else ARCHIVE_DATASETS:
+        dataset_dir = os.path.join(ARCHIVE_DIR, name)
+        if not os.path.isdir(dataset_dir):
+            continue
+        for league_dir in sorted(os.listdir(dataset_dir)):
+            for month_dir in sorted(
+                os.listdir(os.path.join(dataset_dir, league_dir))
+            ):
+                partition_dir = os.path.join(dataset_dir, league_dir, month_dir)
+                if len(get_partition_files(partition_dir)) > 1:
+                    compact_partition(name, partition_dir)
+
+
+def get_archive_files(
+    dataset: str, leagues=None, date_from=None, date_to=None
+):
+    """
+    Function to list the files of the partitions a read needs
+    Args:
+    dataset (str): key of ARCHIVE_DATASETS
+    leagues (list): leagues to read, default every league archived
+    date_from (date): first date to read, default unbounded
+    date_to (date): last date to read, default unbounded
+    Returns:
+    paths (list): paths of .parquet files
+    """
+    dataset_dir = os.path.join(ARCHIVE_DIR, dataset)
+    if not os.path.isdir(dataset_dir):
+        return []
+
+    # Months are compared as 'YYYY-MM' strings
+    month_from = None if date_from is None else str(date_from)[:7]
+    month_to = None if date_to is None else str(date_to)[:7]
+
+    paths = []
+    for league_dir in sorted(os.listdir(dataset_dir)):
+        if leagues and league_dir.split("=", 1)[1] not in leagues:
+            continue
+        for month_dir in sorted(
+            os.listdir(os.path.join(dataset_dir, league_dir))
+        ):
+            month = month_dir.split("=", 1)[1]
+            if (month_from and month < month_from) or (
+                month_to and month > month_to
+            ):
+                continue
+            paths.extend(
+                get_partition_files(
+                    os.path.join(dataset_dir, league_dir, month_dir)
+                )
+            )
+
+    return paths
+
+
+def get_date_filter(field, date_from=None, date_to=None):
+    """
+    Function to build a filter on a date or timestamp column for whole
+    days, pushed down to skip row groups outside the range
+    Args:
+    field (Field): date column of the schema
+    date_from (date): first date, default unbounded
+    date_to (date): last date, inclusive, default unbounded
+    Returns:
+    date_filter (Expression): filter, None if unbounded
+    """
+    date_filter = None
+    for bound, is_start in ((date_from, True), (date_to, False)):
+        if bound is None:
+            continue
+
+        # Bound is the start of date_from and of the day after date_to
+        bound = pd.Timestamp(bound).normalize()
+        if not is_start:
+            bound = bound + timedelta(days=1)
+        if pa.types.is_timestamp(field.type):
+            value = pa.scalar(bound.tz_localize("UTC"), type=field.type)
+        else:
+            value = pa.scalar(bound.date(), type=field.type)
+
+        condition = (
+            ds.field(field.name) >= value
+            if is_start
+            else ds.field(field.name) < value
+        )
+        date_filter = (
+            condition if date_filter is None else date_filter & condition
+        )
+
+    return date_filter
+
+
+def read_archive( #pylint: disable=too-many-arguments
+    dataset: str,
+    columns=None,
+    date_from=None,
+    date_to=None,
+    leagues=None,
+    latest=True,
+):
+    """
+    Function to load a dataset from the archive, only reading the
+    partitions and columns needed
+    Args:
+    dataset (str): key of ARCHIVE_DATASETS
+    columns (list): columns to load, default every column
+    date_from (date): first date of the date column, default unbounded
+    date_to (date): last date of the date column, default unbounded
+    leagues (list): leagues to load, default every league
+    latest (bool): keep only the latest archived row per key, False
+        loads every archived version
+    Returns:
+    df (df): archived rows, with a league column
+    """
+    schema = get_archive_schema(dataset)
+    for field in ARCHIVE_PARTITION_FIELDS:
+        schema = schema.append(field)
+    date_column = ARCHIVE_DATASETS[dataset]["date_column"]
+    key_columns = ARCHIVE_DATASETS[dataset]["key_columns"]
+    columns = list(columns or [x for x in schema.names if x != "month"])
+
+    # Keys and archive time are needed to drop superseded rows
+    dedupe = latest and key_columns is not None
+    read_columns = list(columns)
+    if dedupe:
+        read_columns += [
+            x for x in key_columns + ["archivedAt"] if x not in columns
+        ]
+
+    paths = get_archive_files(dataset, leagues, date_from, date_to)
+    if not paths:
+        return schema.empty_table().select(columns).to_pandas()
+
+    # League and month columns come from partition directories
+    archive = ds.dataset(
+        paths,
+        schema=schema,
+        format="parquet",
+        partitioning="hive",
+        partition_base_dir=os.path.join(ARCHIVE_DIR, dataset),
+    )
+    df = archive.to_table(
+        columns=read_columns,
+        filter=get_date_filter(
+            schema.field(date_column), date_from, date_to
+        ),
+    ).to_pandas()
+
+    if dedupe:
+        df = keep_latest_rows(df, key_columns)[columns].reset_index(drop=True)
+
+    return df
+
+
+def create_game_log_archive_df(
+    entity: str, adv_result_set, base_result_set
+):
+    """
+    Function to join raw game log result sets into archived rows, same
+    values as write_nba_api_game_logs() stores plus game date and season
+    Args:
+    entity (str): one of 'player', 'team'
+    adv_result_set (tuple): (headers, rowSet) with MeasureType=Advanced
+    base_result_set (tuple): (headers, rowSet) with MeasureType=Base
+    Returns:
+    game_log_df (df): one row per game log
+    """
+    if entity == "player":
+        table_columns = NBA_API_PLAYER_GAME_LOGS_COLUMNS
+        join_keys = ["gameId", "teamId", "playerId"]
+    else:
+        table_columns = NBA_API_TEAM_GAME_LOGS_COLUMNS
+        join_keys = ["gameId", "teamId"]
+
+    # Raw rowSets with camelCase column names
+    base_df = pd.DataFrame(
+        base_result_set[1],
+        columns=[convert_camel_case(x) for x in base_result_set[0]],
+    )
+    adv_df = pd.DataFrame(
+        adv_result_set[1],
+        columns=[convert_camel_case(x) for x in adv_result_set[0]],
+    )
+    if len(base_df) == 0:
+        return pd.DataFrame()
+
+    # Base box score joined to advanced possessions
+    game_log_df = base_df[
+        [x for x in table_columns if x != "poss"] + ["gameDate", "seasonYear"]
+    ].merge(adv_df[join_keys + ["poss"]], on=join_keys, how="inner")
+
+    # Team minutes are truncated to INT on merge
+    if entity == "team":
+        game_log_df["min"] = np.trunc(game_log_df["min"])
+
+    return game_log_df
+
+
+def archive_game_logs(entity: str, adv_result_sets, base_result_sets):
+    """
+    Function to archive fetched game log result sets
+    Args:
+    entity (str): one of 'player', 'team'
+    adv_result_sets (list): result sets with MeasureType=Advanced
+    base_result_sets (list): result sets with MeasureType=Base
+    Returns:
+    row_count (int): number of rows archived
+    """
+    if ARCHIVE_DIR is None:
+        return 0
+
+    # One DataFrame for every window, so each month gets one new file
+    game_log_dfs = [
+        create_game_log_archive_df(entity, adv, base)
+        for adv, base in zip(adv_result_sets, base_result_sets)
+    ]
+    game_log_dfs = [x for x in game_log_dfs if len(x) > 0]
+    if not game_log_dfs:
+        return 0
+
+    return archive_df(
+        "nba_api_" + entity + "_game_logs",
+        "NBA",
+        pd.concat(game_log_dfs, ignore_index=True),
+    )
+
+
+def archive_dk_parses(league_team_odds: dict):
+    """
+    Function to archive every league's parsed events and an odds snapshot
+    Args:
+    league_team_odds (dict): league -> result of parse_league_team_odds()
+    Returns:
+    row_count (int): number of rows archived
+    """
+    row_count = 0
+    for league, (game_df, team_odds_df) in league_team_odds.items():
+        if len(game_df) == 0:
+            continue
+        row_count += archive_df(
+            "dk_events", league, game_df[list(DK_EVENTS_COLUMNS)]
+        )
+
+        # Odds are partitioned on their event's start date
+        if len(team_odds_df) > 0:
+            row_count += archive_df(
+                "dk_team_odds",
+                league,
+                team_odds_df[list(DK_NBA_TEAM_ODDS_COLUMNS)].merge(
+                    game_df[["eventId", "startDate"]], on="eventId"
+                ),
+            )
+
+    return row_count
+
+
+def archive_dk_stage(*dk_parses):
+    """
+    Function to archive every league's parsed events and odds
+    Args:
+    *dk_parses (tuple): result of parse_league_team_odds() per league, in
+        DK_LEAGUES order
+    Returns:
+    row_count (int): number of rows archived
+    """
+    return archive_dk_parses(dict(zip(DK_LEAGUES, dk_parses)))
+
+
+def archive_nba_events_stage(nba_games_df):
+    """
+    Function to archive today's NBA API games
+    Args:
+    nba_games_df (df): result of get_nba_games()
+    Returns:
+    row_count (int): number of rows archived
+    """
+    if len(nba_games_df) == 0:
+        return 0
+
+    return archive_df(
+        "nba_api_events", "NBA", nba_games_df[list(NBA_API_EVENTS_COLUMNS)]
+    )
@@ -0,0 +1,429 @@
+"""
+Functions to track which rotation players sat each team-game, and how
+teams beat their odds with them out
+"""
+# Import packages
+import numpy as np
+import pandas as pd
+from functions.extract_functions import extract_query
+
+# Average minutes, over the games a player played for a team, to count
+# as part of that team's rotation
+ROTATION_MINUTES = 15
+
+# Outcome columns of nba_team_odds_outcomes kept per team-game
+AVAILABILITY_OUTCOMES = ("atsCover", "overHit", "moneylineWin")
+
+# Player minutes per team-game on or after a game date
+PLAYER_MINUTES_QUERY = """
+    SELECT
+        g.gameId AS "gameId",
+        g.teamId AS "teamId",
+        CASE WHEN g.teamId = e.homeTeamId
+            THEN e.awayTeamId ELSE e.homeTeamId END AS "opponentTeamId",
+        (e.gameEt AT TIME ZONE 'UTC')::date AS "gameDate",
+        g.playerId AS "playerId",
+        g.min AS "min"
+    FROM nba_api_player_game_logs g
+    INNER JOIN nba_api_events e ON e.gameId = g.gameId
+    WHERE (e.gameEt AT TIME ZONE 'UTC')::date >= %s
+"""
+
+# Team-game outcomes on or after a game date
+TEAM_GAME_OUTCOMES_QUERY = """
+    SELECT
+        o.gameId AS "gameId",
+        CASE WHEN o.teamType = 'Home'
+            THEN e.homeTeamId ELSE e.awayTeamId END AS "teamId",
+        o.atsCover AS "atsCover",
+        o.overHit AS "overHit",
+        o.moneylineWin AS "moneylineWin",
+        o.gameDate AS "gameDate"
+    FROM nba_team_odds_outcomes o
+    INNER JOIN nba_api_events e ON e.gameId = o.gameId
+    WHERE o.gameDate >= %s
+"""
+
+
+# Classes
+class PlayerAvailability: #pylint: disable=too-many-instance-attributes
+    """
+    Team-game x player minutes matrix, grown incrementally as game logs
+    arrive, with outcomes aligned to its rows so availability splits are
+    NumPy masks instead of SQL queries
+
+    Minutes are stored rounded up to whole minutes as uint8, so a full
+    season (~2,500 team-games x ~600 players) takes about 1.5 MB and any
+    appearance counts as played
+    """
+
+    def __init__(self):
+        # Team-game rows, in the order they were first loaded
+        self.row_index = {}
+        self.game_ids = np.array([], dtype=object)
+        self.team_ids = np.array([], dtype=np.int64)
+        self.opponent_team_ids = np.array([], dtype=np.int64)
+        self.game_dates = np.array([], dtype="datetime64[D]")
+
+        # Player columns
+        self.player_index = {}
+        self.player_ids = np.array([], dtype=np.int64)
+
+        # Minutes and outcomes, NaN outcome when no line/push
+        self.minutes = np.zeros((0, 0), dtype=np.uint8)
+        self.outcomes = {
+            outcome: np.array([], dtype=np.float64)
+            for outcome in AVAILABILITY_OUTCOMES
+        }
+        self.outcomes_high_water_mark = None
+
+        # Rotation matrices per ROTATION_MINUTES and opponent row numbers,
+        # reset when logs change
+        self.rotation_cache = {}
+        self.opponent_row_numbers = None
+
+    def get_high_water_mark(self):
+        """
+        Function to get the latest game date loaded
+        Returns:
+        high_water_mark (date): latest game date, None if nothing loaded
+        """
+        if len(self.game_dates) == 0:
+            return None
+
+        return self.game_dates.max().astype(object)
+
+    def add_player_minutes(self, minutes_df):
+        """
+        Function to add or overwrite player minutes, adding rows for new
+        team-games and columns for new players
+        Args:
+        minutes_df (df): gameId, teamId, opponentTeamId, gameDate,
+            playerId and min columns, as from PLAYER_MINUTES_QUERY
+        """
+        if len(minutes_df) == 0:
+            return
+
+        # New team-game rows, in game date order
+        team_games = minutes_df.drop_duplicates(["gameId", "teamId"])
+        team_games = team_games.sort_values(["gameDate", "gameId"])
+        new_team_games = team_games[
+            [
+                (game_id, team_id) not in self.row_index
+                for game_id, team_id in zip(
+                    team_games["gameId"], team_games["teamId"]
+                )
+            ]
+        ]
+        for game_id, team_id in zip(
+            new_team_games["gameId"], new_team_games["teamId"]
+        ):
+            self.row_index[(game_id, team_id)] = len(self.row_index)
+        self.game_ids = np.concatenate(
+            [self.game_ids, new_team_games["gameId"].to_numpy(dtype=object)]
+        )
+        self.team_ids = np.concatenate(
+            [self.team_ids, new_team_games["teamId"].to_numpy(np.int64)]
+        )
+        self.opponent_team_ids = np.concatenate(
+            [
+                self.opponent_team_ids,
+                new_team_games["opponentTeamId"].to_numpy(np.int64),
+            ]
+        )
+        self.game_dates = np.concatenate(
+            [
+                self.game_dates,
+                pd.to_datetime(new_team_games["gameDate"])
+                .to_numpy()
+                .astype("datetime64[D]"),
+            ]
+        )
+        for outcome in AVAILABILITY_OUTCOMES:
+            self.outcomes[outcome] = np.concatenate(
+                [self.outcomes[outcome], np.full(len(new_team_games), np.nan)]
+            )
+
+        # New player columns
+        for player_id in minutes_df["playerId"].unique():
+            if player_id not in self.player_index:
+                self.player_index[player_id] = len(self.player_index)
+        self.player_ids = np.array(list(self.player_index), dtype=np.int64)
+
+        # Grow matrix, then scatter minutes into it
+        minutes = np.zeros(
+            (len(self.row_index), len(self.player_index)), dtype=np.uint8
+        )
+        minutes[: self.minutes.shape[0], : self.minutes.shape[1]] = (
+            self.minutes
+        )
+        rows = np.fromiter(
+            (
+                self.row_index[key]
+                for key in zip(minutes_df["gameId"], minutes_df["teamId"])
+            ),
+            dtype=np.int64,
+            count=len(minutes_df),
+        )
+        cols = np.fromiter(
+            (self.player_index[x] for x in minutes_df["playerId"]),
+            dtype=np.int64,
+            count=len(minutes_df),
+        )
+        minutes[rows, cols] = np.clip(
+            np.ceil(minutes_df["min"].to_numpy(dtype=np.float64)), 0, 255
+        )
+        self.minutes = minutes
+        self.rotation_cache = {}
+        self.opponent_row_numbers = None
+
+    def add_outcomes(self, outcomes_df):
+        """
+        Function to align team-game outcomes to the loaded rows
+        Args:
+        outcomes_df (df): gameId, teamId and AVAILABILITY_OUTCOMES columns,
+            as from TEAM_GAME_OUTCOMES_QUERY, unknown team-games ignored
+        """
+        keys = list(zip(outcomes_df["gameId"], outcomes_df["teamId"]))
+        known = np.array([x in self.row_index for x in keys], dtype=bool)
+        rows = np.array(
+            [self.row_index[x] for x, y in zip(keys, known) if y],
+            dtype=np.int64,
+        )
+        for outcome in AVAILABILITY_OUTCOMES:
+            # Booleans to 1/0, pushes stay NaN
+            values = outcomes_df[outcome].astype(np.float64).to_numpy()
+            self.outcomes[outcome][rows] = values[known]
+
+    def update(self, con):
+        """
+        Function to load game logs and outcomes since the latest game date
+        loaded, that date is reloaded in case it was partly loaded
+        Args:
+        con (connection): connection to SQL database
+        Returns:
+        row_count (int): number of player game logs read
+        """
+        date_from = self.get_high_water_mark() or pd.Timestamp.min.date()
+        minutes_df = extract_query(con, PLAYER_MINUTES_QUERY, (date_from,))
+        self.add_player_minutes(minutes_df)
+
+        # Outcomes are materialized after the logs, reread them from the
+        # earlier of both dates so none are skipped
+        outcomes_from = min(
+            date_from, self.outcomes_high_water_mark or date_from
+        )
+        outcomes_df = extract_query(
+            con, TEAM_GAME_OUTCOMES_QUERY, (outcomes_from,)
+        )
+        self.add_outcomes(outcomes_df)
+        if len(outcomes_df) > 0:
+            self.outcomes_high_water_mark = outcomes_df["gameDate"].max()
+
+        return len(minutes_df)
+
+    def get_average_minutes(self, team_rows):
+        """
+        Function to get each player's average minutes when playing for a
+        team
+        Args:
+        team_rows (array): row numbers of the team's team-games
+        Returns:
+        games_played (array): games played for the team per player
+        average_minutes (array): average minutes per player, 0 if none
+        """
+        games_played = (self.minutes[team_rows] > 0).sum(axis=0)
+        average_minutes = self.minutes[team_rows].sum(
+            axis=0, dtype=np.int64
+        ) / np.maximum(games_played, 1)
+
+        return games_played, average_minutes
+
+    def get_rotation(self, min_minutes: float = ROTATION_MINUTES):
+        """
+        Function to flag, per team-game, the players in the team's rotation
+        who were on the team at the time, from their first to last game
+        played for it
+        Args:
+        min_minutes (float): average minutes played for the team to count
+            as rotation
+        Returns:
+        rotation (array): bool, team-games x players
+        """
+        if min_minutes in self.rotation_cache:
+            return self.rotation_cache[min_minutes]
+
+        played = self.minutes > 0
+        rotation = np.zeros(self.minutes.shape, dtype=bool)
+        row_numbers = np.arange(len(self.team_ids))
+        for team_id in np.unique(self.team_ids):
+            team_rows = row_numbers[self.team_ids == team_id]
+            team_played = played[team_rows]
+            games_played, average_minutes = self.get_average_minutes(
+                team_rows
+            )
+            is_rotation = (games_played > 0) & (average_minutes >= min_minutes)
+
+            # Rows between first and last game played for the team, rows
+            # are in game date order within a team
+            first_game = team_played.argmax(axis=0)
+            last_game = len(team_rows) - 1 - team_played[::-1].argmax(axis=0)
+            positions = np.arange(len(team_rows))[:, None]
+            rotation[team_rows] = (
+                is_rotation
+                & (positions >= first_game)
+                & (positions <= last_game)
+            )
+
+        self.rotation_cache[min_minutes] = rotation
+
+        return rotation
+
+    def get_out_matrix(self, min_minutes: float = ROTATION_MINUTES):
+        """
+        Function to flag rotation players who didn't play each team-game
+        Args:
+        min_minutes (float): average minutes played for the team to count
+            as rotation
+        Returns:
+        out (array): bool, team-games x players
+        """
+        return self.get_rotation(min_minutes) & (self.minutes == 0)
+
+    def get_player_out_rows(
+        self, player_id: int, min_minutes: float = ROTATION_MINUTES
+    ):
+        """
+        Function to get the team-games a rotation player sat
+        Args:
+        player_id (int): NBA API player id
+        min_minutes (float): average minutes played for the team to count
+            as rotation
+        Returns:
+        out_rows (array): bool per team-game
+        """
+        col = self.player_index[player_id]
+
+        return self.get_rotation(min_minutes)[:, col] & (
+            self.minutes[:, col] == 0
+        )
+
+    def get_top_players_out(
+        self, top_n: int = 1, min_minutes: float = ROTATION_MINUTES
+    ):
+        """
+        Function to count, per team-game, how many of the team's top_n
+        rotation players by average minutes sat, e.g. top_n=1 flags games
+        without the team's best player
+        Args:
+        top_n (int): players per team, ranked by average minutes
+        min_minutes (float): average minutes played for the team to count
+            as rotation
+        Returns:
+        top_out (array): int per team-game
+        """
+        rotation = self.get_rotation(min_minutes)
+        out = self.get_out_matrix(min_minutes)
+        top_out = np.zeros(len(self.team_ids), dtype=np.int64)
+        row_numbers = np.arange(len(self.team_ids))
+        for team_id in np.unique(self.team_ids):
+            team_rows = row_numbers[self.team_ids == team_id]
+            _, average_minutes = self.get_average_minutes(team_rows)
+
+            # The team's rotation players, most minutes first
+            is_rotation = rotation[team_rows].any(axis=0)
+            top_players = np.argsort(
+                np.where(is_rotation, -average_minutes, np.inf), kind="stable"
+            )[: min(top_n, is_rotation.sum())]
+            top_out[team_rows] = out[np.ix_(team_rows, top_players)].sum(
+                axis=1
+            )
+
+        return top_out
+
+    def get_opponent_rows(self, rows):
+        """
+        Function to move a team-game mask to the opponents' rows, e.g.
+        "opponent's player out" instead of "player out"
+        Args:
+        rows (array): bool per team-game
+        Returns:
+        opponent_rows (array): bool per team-game
+        """
+        # Opponent's row number per team-game, -1 if not loaded
+        if self.opponent_row_numbers is None:
+            self.opponent_row_numbers = np.fromiter(
+                (
+                    self.row_index.get(key, -1)
+                    for key in zip(self.game_ids, self.opponent_team_ids)
+                ),
+                dtype=np.int64,
+                count=len(self.game_ids),
+            )
+
+        opponent_rows = np.zeros(len(rows), dtype=bool)
+        opponent_row_numbers = self.opponent_row_numbers[rows]
+        opponent_rows[opponent_row_numbers[opponent_row_numbers >= 0]] = True
+
+        return opponent_rows
+
+    def get_beat_rate(self, rows, outcome: str = "atsCover"):
+        """
+        Function to get how often teams beat their odds over some
+        team-games
+        Args:
+        rows (array): bool per team-game
+        outcome (str): one of AVAILABILITY_OUTCOMES
+        Returns:
+        beat_rate (float): share of graded team-games won, NaN if none
+        games (int): number of graded team-games
+        """
+        values = self.outcomes[outcome][rows]
+        graded = ~np.isnan(values)
+        games = int(graded.sum())
+        if games == 0:
+            return np.nan, 0
+
+        return float(values[graded].mean()), games
+
+    def get_beat_rates_when_out(
+        self, outcome: str = "atsCover", min_minutes: float = ROTATION_MINUTES
+    ):
+        """
+        Function to get every rotation player's team beat rate in the games
+        they sat, and in the games they played, in one pass
+        Args:
+        outcome (str): one of AVAILABILITY_OUTCOMES
+        min_minutes (float): average minutes played for the team to count
+            as rotation
+        Returns:
+        beat_rates_df (df): playerId, gamesOut, beatRateOut, gamesIn and
+            beatRateIn, one row per player with a graded game out
+        """
+        rotation = self.get_rotation(min_minutes)
+        out = rotation & (self.minutes == 0)
+        played = rotation & (self.minutes > 0)
+
+        # Graded games and wins per player as matrix products
+        values = self.outcomes[outcome]
+        graded = (~np.isnan(values)).astype(np.float64)
+        wins = np.nan_to_num(values)
+        games_out = graded @ out
+        games_in = graded @ played
+        with np.errstate(divide="ignore", invalid="ignore"):
+            beat_rate_out = (wins @ out) / games_out
+            beat_rate_in = (wins @ played) / games_in
+
+        beat_rates_df = pd.DataFrame(
+            {
+                "playerId": self.player_ids,
+                "gamesOut": games_out.astype(np.int64),
+                "beatRateOut": beat_rate_out,
+                "gamesIn": games_in.astype(np.int64),
+                "beatRateIn": beat_rate_in,
+            }
+        )
+
+        return beat_rates_df[beat_rates_df["gamesOut"] > 0].reset_index(
+            drop=True
+        )
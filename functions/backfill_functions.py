@@ -0,0 +1,253 @@
+"""
+Functions to backfill historical NBA API game logs in shards
+"""
+# Import packages
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, timedelta
+import pandas as pd
+from functions.archive_functions import archive_game_logs
+from functions.http_functions import RetryingClient
+from functions.nba_api_functions import (
+    build_nba_game_log_url,
+    get_nba_api_result_set,
+    get_nba_api_ttl,
+    get_nba_season,
+    split_date_range,
+    write_nba_api_game_logs,
+)
+
+# Shards are aligned to blocks of shard_days counted from this Monday
+SHARD_EPOCH = date(2000, 1, 3)
+
+
+# Functions
+def get_backfill_shards(date_from: str, date_to: str, shard_days: int = 7):
+    """
+    Function to split a multi-season date range into shards
+    Args:
+    date_from (str): Date from, format 'YYYY-MM-DD'
+    date_to (str): Date to, format 'YYYY-MM-DD'
+    shard_days (int): max number of days per shard
+    Returns:
+    shards (list): dicts with shard_id, season, date_from, date_to
+    """
+    # Convert to date YYYY-MM-DD
+    date_from = pd.to_datetime(date_from).date()
+    date_to = pd.to_datetime(date_to).date()
+
+    shards = []
+    # Split into seasons first, so each shard has one Season= param
+    for season_from, season_to in split_date_range(
+        date_from, date_to, (date_to - date_from).days + 1
+    ):
+        shard_from = season_from
+        while shard_from <= season_to:
+            # Align shard ends to fixed shard_days blocks starting on a
+            # Monday, so shard ids don't depend on the requested range
+            shard_to = min(
+                shard_from
+                + timedelta(
+                    days=shard_days
+                    - 1
+                    - (shard_from - SHARD_EPOCH).days % shard_days
+                ),
+                season_to,
+            )
+            shards.append(
+                {
+                    "shard_id": str(shard_from) + "_" + str(shard_to),
+                    "season": get_nba_season(shard_from),
+                    "date_from": shard_from,
+                    "date_to": shard_to,
+                }
+            )
+            shard_from = shard_to + timedelta(days=1)
+
+    return shards
+
+
+def load_checkpoint(state_file: str):
+    """
+    Function to load completed shard ids from a state file
+    Args:
+    state_file (str): path to JSON state file
+    Returns:
+    completed (set): shard ids already written
+    """
+    # Nothing completed on first run
+    if not os.path.exists(state_file):
+        return set()
+
+    with open(state_file, encoding="utf-8") as state:
+        return set(json.load(state)["completed"])
+
+
+def save_checkpoint(state_file: str, completed: set):
+    """
+    Function to atomically save completed shard ids to a state file
+    Args:
+    state_file (str): path to JSON state file
+    completed (set): shard ids already written
+    """
+    # Write to a temp file then rename, so a crash never corrupts state
+    temp_file = state_file + ".tmp"
+    with open(temp_file, "w", encoding="utf-8") as state:
+        json.dump({"completed": sorted(completed)}, state)
+    os.replace(temp_file, state_file)
+
+
+def fetch_backfill_shard(nba_header_data: dict, shard: dict, client):
+    """
+    Function to fetch all game log result sets for a shard
+    Args:
+    nba_header_data (dict): headers for NBA API request
+    shard (dict): shard from get_backfill_shards()
+    client (RetryingClient): client shared by all workers, rate limits
+        requests that miss the response cache
+    Returns:
+    result_sets (dict): (entity, measure_type) -> (headers, rowSet)
+    """
+    result_sets = {}
+    for entity in ("team", "player"):
+        for measure_type in ("Advanced", ""):
+            result_sets[(entity, measure_type)] = get_nba_api_result_set(
+                nba_header_data,
+                build_nba_game_log_url(
+                    entity, shard["date_from"], shard["date_to"], measure_type
+                ),
+                get_nba_api_ttl(shard["date_to"]),
+                client,
+            )
+
+    return result_sets
+
+
+def write_backfill_shard(con, result_sets: dict, chunk_size: int = 10000):
+    """
+    Function to write a fetched shard through the DB layer, and to the
+    archive if one is configured
+    Args:
+    con (connection): connection to SQL database
+    result_sets (dict): result sets from fetch_backfill_shard()
+    chunk_size (int): rows buffered in memory per COPY
+    Returns:
+    row_count (int): number of rows inserted or updated
+    """
+    row_count = 0
+    for entity in ("team", "player"):
+        row_count += write_nba_api_game_logs(
+            con,
+            entity,
+            result_sets[(entity, "Advanced")],
+            result_sets[(entity, "")],
+            chunk_size,
+        )
+        archive_game_logs(
+            entity,
+            [result_sets[(entity, "Advanced")]],
+            [result_sets[(entity, "")]],
+        )
+
+    return row_count
+
+
+def run_backfill( #pylint: disable=too-many-arguments, too-many-locals
+    con,
+    nba_header_data: dict,
+    date_from: str,
+    date_to: str,
+    state_file: str,
+    max_workers: int = 4,
+    requests_per_second: float = 1.0,
+    shard_days: int = 7,
+    chunk_size: int = 10000,
+    max_requests_per_second: float = None,
+):
+    """
+    Function to backfill game logs, fetching shards in parallel and
+    writing each one as it completes
+    Args:
+    con (connection): connection to SQL database
+    nba_header_data (dict): headers for NBA API request
+    date_from (str): Date from, format 'YYYY-MM-DD'
+    date_to (str): Date to, format 'YYYY-MM-DD'
+    state_file (str): path to JSON state file, reruns resume from it
+    max_workers (int): max number of shards fetched at once
+    requests_per_second (float): starting rate limit across all workers
+    shard_days (int): max number of days per shard
+    chunk_size (int): rows buffered in memory per COPY
+    max_requests_per_second (float): highest rate probed while the API
+        isn't throttling, default requests_per_second
+    Returns:
+    row_count (int): number of rows inserted or updated
+    """
+    # Skip shards finished by a previous run
+    completed = load_checkpoint(state_file)
+    shards = [
+        x
+        for x in get_backfill_shards(date_from, date_to, shard_days)
+        if x["shard_id"] not in completed
+    ]
+    print(
+        str(len(shards))
+        + " shards to backfill, "
+        + str(len(completed))
+        + " already completed"
+    )
+
+    # One client for all workers, so they share the rate limit, back off
+    # together when throttled and share the circuit breaker
+    client = RetryingClient(
+        requests_per_second,
+        burst=max_workers,
+        max_rate=max_requests_per_second,
+        pool_maxsize=max_workers,
+    )
+    row_count = 0
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        shard_iter = iter(shards)
+        while True:
+            # Keep at most 2 x max_workers shards fetched but not written,
+            # so memory stays flat when writes are slower than fetches
+            for shard in shard_iter:
+                future = executor.submit(
+                    fetch_backfill_shard, nba_header_data, shard, client
+                )
+                pending[future] = shard
+                if len(pending) >= 2 * max_workers:
+                    break
+
+            if not pending:
+                break
+
+            # Write shards on this thread as they complete
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                shard = pending.pop(future)
+                row_count += write_backfill_shard(
+                    con, future.result(), chunk_size
+                )
+
+                # Checkpoint after the shard is committed
+                completed.add(shard["shard_id"])
+                save_checkpoint(state_file, completed)
+
+                elapsed = time.perf_counter() - start_time
+                print(
+                    "Completed shard "
+                    + shard["shard_id"]
+                    + " ("
+                    + shard["season"]
+                    + "): "
+                    + str(row_count)
+                    + " rows, "
+                    + str(round(row_count / elapsed))
+                    + " rows/sec"
+                )
+
+    return row_count
@@ -0,0 +1,580 @@
+"""
+Functions to backtest betting strategies over historical NBA team lines
+and results, every strategy a NumPy mask over bets loaded once
+"""
+# Import packages
+import itertools
+import operator
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from functions.availability_functions import ROTATION_MINUTES
+from functions.dk_api_functions import DK_NBA_TEAM_LINE_COLUMNS
+from functions.extract_functions import extract_query
+from functions.odds_functions import american_to_decimal
+
+# Prices and fair odds loaded per team-game at close, and at open with
+# the name prefixed, e.g. openSpreadLine
+BACKTEST_PRICE_COLUMNS = DK_NBA_TEAM_LINE_COLUMNS + [
+    "fairMoneyline",
+    "fairSpread",
+    "pushSpread",
+    "fairOver",
+    "pushTotal",
+]
+
+# Markets a strategy can bet, totals are bet once per game on the home
+# team's row
+BACKTEST_MARKETS = ("moneyline", "spread", "over", "under")
+
+# Comparisons a strategy filter can use
+BACKTEST_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+# Team-game lines and results between two game dates. Open and close are
+# the first and last dk_nba_team_odds_history snapshots before tip-off,
+# close falls back to dk_nba_team_odds and open to close when a game has
+# no history. capturedAt is UTC, startDate is Eastern wall clock
+# labelled UTC
+BACKTEST_QUERY = (
+    """
+    WITH snapshots AS (
+        SELECT h.*
+        FROM dk_nba_team_odds_history h
+        INNER JOIN dk_events d ON d.eventId = h.eventId
+        WHERE h.capturedAt < (d.startDate AT TIME ZONE 'UTC')
+            AT TIME ZONE 'America/New_York'
+    ), opening AS (
+        SELECT DISTINCT ON (eventId, teamType) *
+        FROM snapshots
+        ORDER BY eventId, teamType, capturedAt
+    ), closing AS (
+        SELECT DISTINCT ON (eventId, teamType) *
+        FROM snapshots
+        ORDER BY eventId, teamType, capturedAt DESC
+    )
+    SELECT
+        r.eventId AS "eventId",
+        r.teamType AS "teamType",
+        r.gameId AS "gameId",
+        r.gameDate AS "gameDate",
+        r.teamSlug AS "teamSlug",
+        r.opponentSlug AS "opponentSlug",
+        CASE WHEN r.teamType = 'Home'
+            THEN e.homeTeamId ELSE e.awayTeamId END AS "teamId",
+        CASE WHEN r.teamType = 'Home'
+            THEN e.awayTeamId ELSE e.homeTeamId END AS "opponentTeamId",
+        r.pts AS "pts",
+        r.opponentPts AS "opponentPts",
+        c.eventId IS NOT NULL AS "hasHistory",
+"""
+    + ",\n".join(
+        [
+            "        COALESCE(c." + x + ", o." + x + ') AS "' + x + '"'
+            for x in BACKTEST_PRICE_COLUMNS
+        ]
+        + [
+            "        COALESCE(op."
+            + x
+            + ", c."
+            + x
+            + ", o."
+            + x
+            + ') AS "open'
+            + x[0].upper()
+            + x[1:]
+            + '"'
+            for x in BACKTEST_PRICE_COLUMNS
+        ]
+    )
+    + """
+    FROM nba_team_odds_outcomes r
+    INNER JOIN nba_api_events e ON e.gameId = r.gameId
+    INNER JOIN dk_nba_team_odds o
+        ON o.eventId = r.eventId AND o.teamType = r.teamType
+    LEFT JOIN opening op
+        ON op.eventId = r.eventId AND op.teamType = r.teamType
+    LEFT JOIN closing c
+        ON c.eventId = r.eventId AND c.teamType = r.teamType
+    WHERE r.gameDate BETWEEN %s AND %s
+"""
+)
+
+# Process pool worker's backtest, set by init_backtest_worker()
+WORKER_BACKTEST = None
+
+
+# Classes
+class Backtest:
+    """
+    Historical NBA team lines and results as NumPy columns, one row per
+    team-game in game date order, so a strategy is a boolean mask and
+    thousands of strategies are a few matrix products
+
+    Each bet risks 1 unit at the open or closing price and is graded from
+    the final score at the line taken. Closing line value (CLV) is the
+    bet's expected return at the closing fair odds, for bets on games
+    with line history and, for spreads and totals, the same line at
+    close
+    """
+
+    def __init__(self, backtest_df):
+        backtest_df = backtest_df.sort_values(
+            ["gameDate", "eventId", "teamType"], kind="stable"
+        )
+
+        # Dates as days, strings as objects, everything else as floats so
+        # missing values are NaN
+        self.columns = {}
+        for col in backtest_df.columns:
+            if col == "gameDate":
+                values = (
+                    pd.to_datetime(backtest_df[col])
+                    .to_numpy()
+                    .astype("datetime64[D]")
+                )
+            elif col in ("teamType", "gameId", "teamSlug", "opponentSlug"):
+                values = backtest_df[col].to_numpy(dtype=object)
+            else:
+                values = backtest_df[col].to_numpy(
+                    dtype=np.float64, na_value=np.nan
+                )
+            self.columns[col] = values
+
+        # Season by the year it starts, games from August on are the
+        # next season's
+        game_dates = self.columns["gameDate"]
+        years = game_dates.astype("datetime64[Y]").astype(np.int64) + 1970
+        months = game_dates.astype("datetime64[M]").astype(np.int64) % 12
+        self.columns["season"] = np.where(months >= 7, years, years - 1)
+
+        # Masks per filter and results per market and entry, reset when
+        # columns change
+        self.mask_cache = {}
+        self.results_cache = {}
+
+    def __len__(self):
+        return len(self.columns["gameDate"])
+
+    def __getstate__(self):
+        # Workers rebuild caches, so only columns are sent to them
+        return {"columns": self.columns, "mask_cache": {}, "results_cache": {}}
+
+    def add_availability(
+        self,
+        availability,
+        top_n: int = 1,
+        min_minutes: float = ROTATION_MINUTES,
+    ):
+        """
+        Function to add, per team-game, how many of the team's and the
+        opponent's rotation players sat, as playersOut, topPlayersOut,
+        opponentPlayersOut and opponentTopPlayersOut columns
+        Args:
+        availability (PlayerAvailability): loaded availability
+        top_n (int): players per team counted by topPlayersOut, ranked by
+            average minutes
+        min_minutes (float): average minutes played for the team to count
+            as rotation
+        """
+        features = {
+            "playersOut": availability.get_out_matrix(min_minutes).sum(
+                axis=1
+            ),
+            "topPlayersOut": availability.get_top_players_out(
+                top_n, min_minutes
+            ),
+        }
+
+        # Availability row of each team and its opponent, -1 if not loaded
+        for prefix, team_col in (
+            ("", "teamId"),
+            ("opponent", "opponentTeamId"),
+        ):
+            rows = np.fromiter(
+                (
+                    availability.row_index.get((game_id, int(team_id)), -1)
+                    for game_id, team_id in zip(
+                        self.columns["gameId"], self.columns[team_col]
+                    )
+                ),
+                dtype=np.int64,
+                count=len(self),
+            )
+            for name, values in features.items():
+                if prefix:
+                    name = prefix + name[0].upper() + name[1:]
+                # Row -1 picks the NaN on the end
+                self.columns[name] = np.append(
+                    values.astype(np.float64), np.nan
+                )[rows]
+
+        self.mask_cache = {}
+
+    def get_column(self, name: str, entry: str = "open"):
+        """
+        Function to get a column, prices at the entry's snapshot
+        Args:
+        name (str): column, e.g. 'spreadLine'
+        entry (str): 'open' or 'close', which prices are bet
+        Returns:
+        values (array): one value per team-game
+        """
+        if entry == "open" and name in BACKTEST_PRICE_COLUMNS:
+            name = "open" + name[0].upper() + name[1:]
+
+        return self.columns[name]
+
+    def get_filter_mask(self, strategy_filter: tuple, entry: str = "open"):
+        """
+        Function to get the team-games passing one filter
+        Args:
+        strategy_filter (tuple): (column, operator, value), e.g.
+            ('spreadLine', '>', 5), operator a key of BACKTEST_OPERATORS
+        entry (str): 'open' or 'close', prices filtered on
+        Returns:
+        mask (array): bool per team-game, False where the column is NaN
+        """
+        col, op, value = strategy_filter
+        if entry == "open" and col in BACKTEST_PRICE_COLUMNS:
+            col = "open" + col[0].upper() + col[1:]
+        key = (col, op, value)
+
+        if key not in self.mask_cache:
+            with np.errstate(invalid="ignore"):
+                self.mask_cache[key] = np.asarray(
+                    BACKTEST_OPERATORS[op](self.columns[col], value),
+                    dtype=bool,
+                )
+
+        return self.mask_cache[key]
+
+    def get_strategy_mask(self, strategy: dict):
+        """
+        Function to get the team-games a strategy bets
+        Args:
+        strategy (dict): market, entry (default 'open') and filters, a
+            list of (column, operator, value) all bets pass
+        Returns:
+        mask (array): bool per team-game
+        """
+        entry = strategy.get("entry", "open")
+        mask = self.get_results(strategy["market"], entry)["bettable"]
+        for strategy_filter in strategy.get("filters", []):
+            mask = mask & self.get_filter_mask(strategy_filter, entry)
+
+        return mask
+
+    def get_results( #pylint: disable=too-many-locals
+        self, market: str, entry: str = "open"
+    ):
+        """
+        Function to grade a 1 unit bet on every team-game in one market
+        Args:
+        market (str): one of BACKTEST_MARKETS
+        entry (str): 'open' or 'close', prices bet
+        Returns:
+        results (dict): arrays per team-game of bettable (price and
+            result known), win, push, profit (units), clv (expected
+            return at close, 0 when unknown) and clvKnown
+        """
+        if (market, entry) in self.results_cache:
+            return self.results_cache[(market, entry)]
+
+        columns = self.columns
+        margin = columns["pts"] - columns["opponentPts"]
+        total = columns["pts"] + columns["opponentPts"]
+        is_home = columns["teamType"] == "Home"
+
+        # Result at the line taken (over 0 wins), closing fair win and
+        # push probabilities, and whether the line is unchanged at close
+        if market == "moneyline":
+            odds = self.get_column("oddsMoneyline", entry)
+            result = margin
+            fair = columns["fairMoneyline"]
+            push_prob = np.zeros(len(self))
+            same_line = np.ones(len(self), dtype=bool)
+        elif market == "spread":
+            line = self.get_column("spreadLine", entry)
+            odds = self.get_column("oddsSpread", entry)
+            result = margin + line
+            fair = columns["fairSpread"]
+            push_prob = columns["pushSpread"]
+            same_line = line == columns["spreadLine"]
+        elif market in ("over", "under"):
+            line = self.get_column("totalPointsLine", entry)
+            result = total - line
+            fair = columns["fairOver"]
+            push_prob = columns["pushTotal"]
+            same_line = is_home & (line == columns["totalPointsLine"])
+            if market == "under":
+                result = -result
+                fair = 1 - fair - push_prob
+            odds = np.where(
+                is_home,
+                self.get_column("odds" + market.title(), entry),
+                np.nan,
+            )
+        else:
+            raise ValueError("Unknown backtest market " + market)
+
+        decimal = american_to_decimal(odds)
+        bettable = ~np.isnan(decimal) & ~np.isnan(result)
+        win = bettable & (result > 0)
+        push = bettable & (result == 0)
+
+        # Pushes are refunded
+        with np.errstate(invalid="ignore"):
+            clv = fair * decimal + push_prob - 1
+        clv_known = (
+            bettable
+            & (columns["hasHistory"] == 1)
+            & same_line
+            & ~np.isnan(clv)
+        )
+
+        results = {
+            "bettable": bettable,
+            "win": win.astype(np.float64),
+            "push": push.astype(np.float64),
+            "profit": np.where(win, decimal - 1, np.where(push, 0.0, -1.0))
+            * bettable,
+            "clv": np.where(clv_known, clv, 0.0),
+            "clvKnown": clv_known.astype(np.float64),
+        }
+        self.results_cache[(market, entry)] = results
+
+        return results
+
+    def evaluate( #pylint: disable=too-many-locals
+        self, strategies: list, chunk_size: int = 256
+    ):
+        """
+        Function to backtest strategies, chunk_size at a time as one
+        strategies x team-games matrix
+        Args:
+        strategies (list): strategy dicts, see get_strategy_mask()
+        chunk_size (int): strategies per matrix, bounds memory at about
+            chunk_size x team-games x 8 bytes
+        Returns:
+        metrics_df (df): strategy (description), market, entry and
+            get_mask_metrics() columns, one row per strategy in order
+        """
+        # Strategies of a market and entry share their results
+        groups = {}
+        for i, strategy in enumerate(strategies):
+            groups.setdefault(
+                (strategy["market"], strategy.get("entry", "open")), []
+            ).append(i)
+
+        metrics = []
+        for (market, entry), indices in groups.items():
+            results = self.get_results(market, entry)
+            for start in range(0, len(indices), chunk_size):
+                chunk = indices[start : start + chunk_size]
+                masks = np.vstack(
+                    [self.get_strategy_mask(strategies[i]) for i in chunk]
+                )
+                metrics.append(
+                    get_mask_metrics(masks, results).set_index(
+                        pd.Index(chunk)
+                    )
+                )
+
+        metrics_df = pd.concat(metrics).sort_index() if metrics else None
+        strategies_df = pd.DataFrame(
+            {
+                "strategy": [describe_strategy(x) for x in strategies],
+                "market": [x["market"] for x in strategies],
+                "entry": [x.get("entry", "open") for x in strategies],
+            }
+        )
+        if metrics_df is None:
+            return strategies_df
+
+        return pd.concat([strategies_df, metrics_df], axis=1)
+
+
+# Functions
+def get_backtest_df(con, date_from=None, date_to=None):
+    """
+    Function to load team-game lines and results for a backtest
+    Args:
+    con (connection): connection to SQL database
+    date_from (date): first game date, default all
+    date_to (date): last game date, inclusive, default all
+    Returns:
+    backtest_df (df): rows of BACKTEST_QUERY
+    """
+    return extract_query(
+        con,
+        BACKTEST_QUERY,
+        (
+            date_from or pd.Timestamp.min.date(),
+            date_to or pd.Timestamp.max.date(),
+        ),
+    )
+
+
+def get_mask_metrics(masks, results: dict):
+    """
+    Function to get backtest metrics of many strategies at once
+    Args:
+    masks (array): bool, strategies x team-games, team-games bet
+    results (dict): result of Backtest.get_results()
+    Returns:
+    metrics_df (df): bets, wins, pushes, hitRate (wins over graded
+        bets), profit and roi (units per bet), clv (mean over clvBets)
+        and maxDrawdown (largest fall in units from a running peak, in
+        game order) per strategy
+    """
+    # Only team-games some strategy bets, e.g. totals skip away rows
+    bet_cols = np.flatnonzero(masks.any(axis=0))
+    weights = masks[:, bet_cols].astype(np.float64)
+    results = {name: values[bet_cols] for name, values in results.items()}
+    bets = weights.sum(axis=1)
+    wins = weights @ results["win"]
+    pushes = weights @ results["push"]
+    profit = weights @ results["profit"]
+    clv_bets = weights @ results["clvKnown"]
+    clv = weights @ results["clv"]
+
+    # Running profit from 0 before the first bet, then the fall from its
+    # running peak, in place since this is the largest matrix
+    running = weights
+    running *= results["profit"]
+    np.cumsum(running, axis=1, out=running)
+    peaks = np.maximum.accumulate(running, axis=1)
+    np.maximum(peaks, 0, out=peaks)
+    peaks -= running
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return pd.DataFrame(
+            {
+                "bets": bets.astype(np.int64),
+                "wins": wins.astype(np.int64),
+                "pushes": pushes.astype(np.int64),
+                "hitRate": wins / (bets - pushes),
+                "profit": profit,
+                "roi": profit / bets,
+                "clv": clv / clv_bets,
+                "clvBets": clv_bets.astype(np.int64),
+                "maxDrawdown": peaks.max(axis=1, initial=0),
+            }
+        )
+
+
+def describe_strategy(strategy: dict):
+    """
+    Function to describe a strategy
+    Args:
+    strategy (dict): strategy, see Backtest.get_strategy_mask()
+    Returns:
+    description (str): name if given, else e.g.
+        'spread: teamType == Home & spreadLine > 5'
+    """
+    if "name" in strategy:
+        return strategy["name"]
+
+    return (
+        strategy["market"]
+        + ": "
+        + (
+            " & ".join(
+                [" ".join(str(y) for y in x) for x in strategy["filters"]]
+            )
+            if strategy.get("filters")
+            else "all"
+        )
+    )
+
+
+def get_strategy_grid(
+    market: str, filter_grid: dict, entry: str = "open", filters=None
+):
+    """
+    Function to get every combination of filter options as strategies,
+    for parameter sweeps
+    Args:
+    market (str): one of BACKTEST_MARKETS
+    filter_grid (dict): column -> list of (operator, value) options, None
+        for no filter on the column
+    entry (str): 'open' or 'close', prices bet
+    filters (list): (column, operator, value) every strategy has
+    Returns:
+    strategies (list): strategy dicts, one per combination
+    """
+    options = [
+        [None if x is None else (col,) + tuple(x) for x in col_options]
+        for col, col_options in filter_grid.items()
+    ]
+
+    return [
+        {
+            "market": market,
+            "entry": entry,
+            "filters": list(filters or [])
+            + [x for x in combination if x is not None],
+        }
+        for combination in itertools.product(*options)
+    ]
+
+
+def init_backtest_worker(backtest):
+    """
+    Function to give a process pool worker its backtest
+    Args:
+    backtest (Backtest): backtest strategies are evaluated on
+    """
+    global WORKER_BACKTEST #pylint: disable=global-statement
+    WORKER_BACKTEST = backtest
+
+
+def evaluate_worker_strategies(strategies: list):
+    """
+    Function to backtest strategies on a worker's backtest
+    Args:
+    strategies (list): strategy dicts
+    Returns:
+    metrics_df (df): result of Backtest.evaluate()
+    """
+    return WORKER_BACKTEST.evaluate(strategies)
+
+
+def sweep_strategies(
+    backtest, strategies: list, processes: int = None, chunk_size=2000
+):
+    """
+    Function to backtest strategies across processes, each process gets
+    the backtest once then chunk_size strategies at a time
+    Args:
+    backtest (Backtest): backtest to evaluate on
+    strategies (list): strategy dicts, e.g. from get_strategy_grid()
+    processes (int): worker processes, default one per CPU, 1 runs in
+        this process
+    chunk_size (int): strategies per task
+    Returns:
+    metrics_df (df): result of Backtest.evaluate(), in strategy order
+    """
+    chunks = [
+        strategies[i : i + chunk_size]
+        for i in range(0, len(strategies), chunk_size)
+    ]
+    if processes == 1 or len(chunks) <= 1:
+        return backtest.evaluate(strategies)
+
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=init_backtest_worker,
+        initargs=(backtest,),
+    ) as executor:
+        return pd.concat(
+            executor.map(evaluate_worker_strategies, chunks),
+            ignore_index=True,
+        )
@@ -0,0 +1,459 @@
+"""
+Functions to pull team odds from several sportsbooks through one adapter
+interface, store them per resolved game, and scan every book's lines
+for the best prices, arbitrage and middles
+"""
+# Import packages
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+from functions.db_functions import bulk_upsert, transaction
+from functions.dk_api_functions import (
+    DK_LEAGUES,
+    DK_NBA_TEAM_ODDS_COLUMNS,
+    DK_ODDS_TTL,
+    fix_team_slugs,
+    get_team_game_lines,
+    parse_league_team_odds,
+)
+from functions.odds_functions import american_to_decimal
+
+# Columns identifying a game across books: league, Eastern game date and
+# home team, the same match dk_nba_event_map resolves DK NBA events with
+BOOK_GAME_KEYS = ["leagueSlug", "gameDate", "homeTeamSlug"]
+
+# Staging column types for book_team_odds, one row per book, game and
+# team type
+BOOK_TEAM_ODDS_COLUMNS = {
+    "bookSlug": "VARCHAR(20)",
+    "leagueSlug": "VARCHAR(10)",
+    "gameDate": "DATE",
+    "homeTeamSlug": "VARCHAR(3)",
+    "teamType": "VARCHAR(4)",
+    "awayTeamSlug": "VARCHAR(3)",
+    "bookEventId": "VARCHAR(30)",
+    # Prices and lines, typed as in dk_nba_team_odds
+    **{
+        x: DK_NBA_TEAM_ODDS_COLUMNS[x]
+        for x in ["oddsMoneyline", "oddsSpread", "spreadLine"]
+        + ["totalPointsLine", "oddsOver", "oddsUnder"]
+    },
+    "capturedAt": "TIMESTAMP WITH TIME ZONE",
+}
+
+# Sides of each market, (first side, second side), one of each makes a
+# bet that can't lose when the prices are good enough
+BOOK_MARKET_SIDES = {
+    "moneyline": ("Away", "Home"),
+    "spread": ("Away", "Home"),
+    "total": ("Over", "Under"),
+}
+
+
+# Classes
+class BookAdapter(ABC):
+    """
+    A sportsbook's team odds. fetch() gets a league's raw response and
+    parse() turns it into the events and one row per event and team type
+    that get_team_game_lines() and parse_league_team_odds() return for
+    DraftKings, so every book is stored and scanned the same way
+
+    Books with their own API subclass this and must implement fetch()
+    and parse(), pointed at api_url so tests can serve recorded responses
+    from a local fixture server
+    """
+
+    def __init__(self, book: str, leagues, api_url: str = None):
+        self.book = book
+        self.leagues = list(leagues)
+        self.api_url = api_url
+
+    @abstractmethod
+    def fetch(self, league: str, ttl=DK_ODDS_TTL):
+        """
+        Function to fetch a league's raw odds
+        Args:
+        league (str): league slug, e.g. 'NBA'
+        ttl (int): seconds a cached response is served
+        Returns:
+        fetch_result: raw response, passed to parse()
+        """
+
+    @abstractmethod
+    def parse(self, league: str, fetch_result):
+        """
+        Function to parse a league's raw odds
+        Args:
+        league (str): league slug, e.g. 'NBA'
+        fetch_result: result of fetch()
+        Returns:
+        game_df (df): eventId, startDate (Eastern wall clock labelled
+            UTC), leagueSlug, awayTeamSlug and homeTeamSlug per event
+        team_odds_df (df): one row per event and team type with
+            DK_NBA_TEAM_ODDS_COLUMNS, empty if no offers
+        """
+
+    def fix_slugs(self, con, game_df): #pylint: disable=unused-argument
+        """
+        Function to replace the book's team slugs with team_slug_lk slugs,
+        by default the book's slugs already match
+        Args:
+        con (connection): connection to SQL database
+        game_df (df): game_df from parse()
+        Returns:
+        game_df (df): game_df with team_slug_lk slugs
+        """
+        return game_df
+
+    def get_team_odds(self, league: str, ttl=DK_ODDS_TTL):
+        """
+        Function to fetch and parse a league's odds
+        Returns:
+        game_df (df): game_df from parse()
+        team_odds_df (df): team_odds_df from parse()
+        """
+        return self.parse(league, self.fetch(league, ttl))
+
+
+class DraftKingsAdapter(BookAdapter):
+    """
+    DraftKings eventgroups, every league in DK_LEAGUES
+    """
+
+    def __init__(self, book: str = "draftkings", api_url: str = None):
+        super().__init__(book, DK_LEAGUES, api_url)
+
+    def fetch(self, league: str, ttl=DK_ODDS_TTL):
+        return get_team_game_lines(league, ttl, api_url=self.api_url)
+
+    def parse(self, league: str, fetch_result):
+        return parse_league_team_odds(league, fetch_result)
+
+    def fix_slugs(self, con, game_df):
+        return fix_team_slugs(con, game_df)
+
+
+class BookOddsAggregator:
+    """
+    Latest odds of every book, kept in memory and rescanned on each
+    refresh. A refresh replaces everything a book had for the leagues it
+    covers, so games a book pulls drop out of the scan
+    """
+
+    def __init__(self):
+        # (book, league) -> book_odds_df rows
+        self.book_odds = {}
+
+    def update(self, book_odds_df):
+        """
+        Function to replace books' odds with a refresh
+        Args:
+        book_odds_df (df): create_book_odds_df() rows of one or more
+            books and leagues
+        """
+        for key, df in book_odds_df.groupby(["bookSlug", "leagueSlug"]):
+            self.book_odds[key] = df
+
+    def scan(self, max_age: float = None):
+        """
+        Function to scan the latest odds of every book
+        Args:
+        max_age (float): skip odds captured more than max_age seconds
+            ago, stale lines make false arbitrage
+        Returns:
+        scan (dict): result of scan_book_odds()
+        """
+        book_odds_df = concat_book_odds(list(self.book_odds.values()))
+        if max_age is not None:
+            book_odds_df = book_odds_df[
+                book_odds_df["capturedAt"]
+                >= pd.Timestamp.now(tz="UTC") - pd.Timedelta(seconds=max_age)
+            ]
+
+        return scan_book_odds(book_odds_df)
+
+
+# Sportsbooks ingested, book slug -> adapter
+BOOK_ADAPTERS = {"draftkings": DraftKingsAdapter()}
+
+
+# Functions
+def concat_book_odds(book_odds_dfs: list):
+    """
+    Function to combine books' odds
+    Args:
+    book_odds_dfs (list): dfs from create_book_odds_df()
+    Returns:
+    book_odds_df (df): combined rows, with BOOK_TEAM_ODDS_COLUMNS even if
+        there are none
+    """
+    book_odds_dfs = [x for x in book_odds_dfs if len(x) > 0]
+    if not book_odds_dfs:
+        return pd.DataFrame(columns=list(BOOK_TEAM_ODDS_COLUMNS))
+
+    return pd.concat(book_odds_dfs, ignore_index=True)
+
+
+def create_book_odds_df(book: str, game_df, team_odds_df, captured_at=None):
+    """
+    Function to key a book's odds on the game they're for
+    Args:
+    book (str): book slug
+    game_df (df): game_df from BookAdapter.parse(), slugs fixed
+    team_odds_df (df): team_odds_df from BookAdapter.parse()
+    captured_at (Timestamp): when the odds were fetched, default now
+    Returns:
+    book_odds_df (df): one row per game and team type with
+        BOOK_TEAM_ODDS_COLUMNS
+    """
+    if len(game_df) == 0 or len(team_odds_df) == 0:
+        return pd.DataFrame(columns=list(BOOK_TEAM_ODDS_COLUMNS))
+
+    # startDate is Eastern wall clock time labelled UTC, so its date is
+    # the game date
+    game_df = game_df[
+        ["eventId", "startDate", "leagueSlug", "awayTeamSlug", "homeTeamSlug"]
+    ].assign(gameDate=lambda x: x["startDate"].dt.date)
+
+    # A game listed twice (e.g. a doubleheader) keeps its earliest event
+    game_df = game_df.sort_values("startDate").drop_duplicates(BOOK_GAME_KEYS)
+
+    book_odds_df = team_odds_df.merge(game_df, on="eventId", how="inner")
+    book_odds_df["bookSlug"] = book
+    book_odds_df["bookEventId"] = book_odds_df["eventId"].astype(str)
+    book_odds_df["capturedAt"] = (
+        captured_at if captured_at is not None else pd.Timestamp.now(tz="UTC")
+    )
+
+    return book_odds_df[list(BOOK_TEAM_ODDS_COLUMNS)]
+
+
+def update_book_odds(con, book_league_odds: dict):
+    """
+    Function to key every book's odds on their games and write them in
+    one transaction
+    Args:
+    con (connection): connection to SQL database
+    book_league_odds (dict): book -> league -> result of
+        BookAdapter.parse()
+    Returns:
+    book_odds_df (df): rows written, from create_book_odds_df()
+    """
+    captured_at = pd.Timestamp.now(tz="UTC")
+    book_odds_df = concat_book_odds(
+        [
+            create_book_odds_df(
+                book,
+                BOOK_ADAPTERS[book].fix_slugs(con, game_df),
+                team_odds_df,
+                captured_at,
+            )
+            for book, league_odds in book_league_odds.items()
+            for game_df, team_odds_df in league_odds.values()
+            if len(game_df) > 0 and len(team_odds_df) > 0
+        ]
+    )
+
+    # Only overwrite odds when the new value is not null, like
+    # dk_nba_team_odds
+    if len(book_odds_df) > 0:
+        with transaction(con) as cursor:
+            bulk_upsert(
+                cursor,
+                "book_team_odds",
+                book_odds_df,
+                BOOK_TEAM_ODDS_COLUMNS,
+                ["bookSlug"] + BOOK_GAME_KEYS + ["teamType"],
+                keep_on_null=True,
+            )
+        print("Inserted/Updated book_team_odds")
+
+    return book_odds_df
+
+
+def get_book_sides(book_odds_df):
+    """
+    Function to turn books' odds into one row per book, game, market and
+    side, with the line the opposite side must have to pair with it
+    Args:
+    book_odds_df (df): rows from create_book_odds_df()
+    Returns:
+    sides_df (df): game (row number in games_df), market, side, line,
+        pairLine, odds, decimal and bookSlug columns
+    games_df (df): BOOK_GAME_KEYS and awayTeamSlug per game
+    """
+    book_odds_df = book_odds_df.reset_index(drop=True)
+    games = book_odds_df.groupby(BOOK_GAME_KEYS, sort=False).ngroup()
+    games_df = (
+        book_odds_df[BOOK_GAME_KEYS + ["awayTeamSlug"]]
+        .groupby(games.to_numpy())
+        .first()
+    )
+    games = games.to_numpy()
+    team_types = book_odds_df["teamType"].to_numpy(dtype=object)
+    books = book_odds_df["bookSlug"].to_numpy(dtype=object)
+    spread_lines = book_odds_df["spreadLine"].to_numpy(dtype=float)
+    total_lines = book_odds_df["totalPointsLine"].to_numpy(dtype=float)
+
+    # Totals are on both team rows, keep one per book and game
+    first_rows = np.flatnonzero(
+        ~book_odds_df.duplicated(["bookSlug"] + BOOK_GAME_KEYS).to_numpy()
+    )
+
+    # Spreads pair on the home line, the away side's is mirrored
+    home_lines = np.where(team_types == "Home", spread_lines, -spread_lines)
+    parts = [
+        ("moneyline", slice(None), team_types, 0.0, 0.0, "oddsMoneyline"),
+        ("spread", slice(None), team_types, spread_lines, home_lines,
+         "oddsSpread"),
+        ("total", first_rows, "Over", total_lines, total_lines, "oddsOver"),
+        ("total", first_rows, "Under", total_lines, total_lines,
+         "oddsUnder"),
+    ]
+    sides_df = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "game": games[rows],
+                    "market": market,
+                    "side": side if isinstance(side, str) else side[rows],
+                    "line": np.broadcast_to(line, len(games))[rows],
+                    "pairLine": np.broadcast_to(pair_line, len(games))[rows],
+                    "odds": book_odds_df[odds_col].to_numpy(dtype=float)[
+                        rows
+                    ],
+                    "bookSlug": books[rows],
+                }
+            )
+            for market, rows, side, line, pair_line, odds_col in parts
+        ],
+        ignore_index=True,
+    )
+    sides_df["decimal"] = american_to_decimal(sides_df["odds"])
+
+    return sides_df[sides_df["decimal"].notna()], games_df
+
+
+def get_best_prices(sides_df):
+    """
+    Function to get the best price for every game, market, side and line
+    across books
+    Args:
+    sides_df (df): sides_df from get_book_sides()
+    Returns:
+    best_df (df): one row per game, market, side and line, with the best
+        price's book and the number of books offering it
+    """
+    keys = ["game", "market", "side", "line"]
+    best_df = sides_df.sort_values(
+        "decimal", ascending=False, kind="stable"
+    ).drop_duplicates(keys)
+    best_df = best_df.merge(
+        sides_df.groupby(keys, as_index=False).size().rename(
+            columns={"size": "books"}
+        ),
+        on=keys,
+    )
+
+    return best_df.sort_values(keys, ignore_index=True)
+
+
+def pair_sides(first_df, second_df, on):
+    """
+    Function to pair each market's first side with its second side
+    Args:
+    first_df (df): Away/Over rows
+    second_df (df): Home/Under rows
+    on (list): columns to pair on
+    Returns:
+    pairs_df (df): paired rows, first side's columns suffixed A and the
+        second's B
+    """
+    return first_df.merge(second_df, on=on, suffixes=("A", "B"))
+
+
+def find_arbitrage(best_df):
+    """
+    Function to find markets where the best prices of both sides, at
+    paired lines, imply less than 100% so betting both wins either way
+    Args:
+    best_df (df): best_df from get_best_prices()
+    Returns:
+    arbitrage_df (df): one row per game, market and paired line, with
+        margin (share of stakes won) and stakeA (share of stakes on the
+        first side so both sides pay the same)
+    """
+    first_sides = [x[0] for x in BOOK_MARKET_SIDES.values()]
+    arbitrage_df = pair_sides(
+        best_df[best_df["side"].isin(first_sides)],
+        best_df[~best_df["side"].isin(first_sides)],
+        ["game", "market", "pairLine"],
+    )
+    implied = 1 / arbitrage_df["decimalA"] + 1 / arbitrage_df["decimalB"]
+    arbitrage_df["margin"] = 1 / implied - 1
+    arbitrage_df["stakeA"] = 1 / arbitrage_df["decimalA"] / implied
+
+    return arbitrage_df[arbitrage_df["margin"] > 0].reset_index(drop=True)
+
+
+def find_middles(best_df):
+    """
+    Function to find spreads and totals where the most generous line on
+    each side leaves a window of results in which both sides win, e.g.
+    Home +3.5 at one book and Away -2.5 at another
+    Args:
+    best_df (df): best_df from get_best_prices()
+    Returns:
+    middles_df (df): one row per game and market, with window (points
+        wide) and cost (implied probability of both sides, over 1 means
+        the bets lose money outside the window)
+    """
+    best_df = best_df[best_df["market"] != "moneyline"].copy()
+
+    # More points is better for spreads and unders, fewer for overs
+    best_df["value"] = np.where(
+        best_df["side"] == "Over", -best_df["line"], best_df["line"]
+    )
+    best_df = best_df.sort_values(
+        ["value", "decimal"], ascending=False, kind="stable"
+    ).drop_duplicates(["game", "market", "side"])
+
+    first_sides = [x[0] for x in BOOK_MARKET_SIDES.values()]
+    middles_df = pair_sides(
+        best_df[best_df["side"].isin(first_sides)],
+        best_df[~best_df["side"].isin(first_sides)],
+        ["game", "market"],
+    )
+    middles_df["window"] = middles_df["valueA"] + middles_df["valueB"]
+    middles_df["cost"] = (
+        1 / middles_df["decimalA"] + 1 / middles_df["decimalB"]
+    )
+
+    return middles_df[middles_df["window"] > 0].reset_index(drop=True)
+
+
+def scan_book_odds(book_odds_df):
+    """
+    Function to scan every book's odds for the best prices, arbitrage
+    and middles
+    Args:
+    book_odds_df (df): rows from create_book_odds_df(), any books and
+        leagues
+    Returns:
+    scan (dict): 'best', 'arbitrage' and 'middles' DataFrames from
+        get_best_prices(), find_arbitrage() and find_middles(), with
+        BOOK_GAME_KEYS and awayTeamSlug instead of the game number
+    """
+    sides_df, games_df = get_book_sides(book_odds_df)
+    best_df = get_best_prices(sides_df)
+
+    return {
+        name: games_df.merge(df, left_index=True, right_on="game")
+        .drop(columns=["game"])
+        .reset_index(drop=True)
+        for name, df in (
+            ("best", best_df),
+            ("arbitrage", find_arbitrage(best_df)),
+            ("middles", find_middles(best_df)),
+        )
+    }
@@ -0,0 +1,206 @@
+"""
+Functions to cache HTTP responses on disk
+"""
+# Import packages
+import contextlib
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+
+# Classes
+class ResponseCache:
+    """
+    Compressed on-disk response cache keyed on URL, evicting least
+    recently used entries once the directory grows past max_bytes
+    """
+
+    def __init__(
+        self, cache_dir: str, max_bytes: int = 500_000_000, offline=False
+    ):
+        """
+        Args:
+        cache_dir (str): directory to store responses in
+        max_bytes (int): max total size of cached files
+        offline (bool): serve cached responses regardless of age and
+            never hit the network
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_path(self, url: str):
+        """
+        Function to get the cache file path for a URL
+        Args:
+        url (str): request url
+        Returns:
+        path (str): path of cache file
+        """
+        return os.path.join(
+            self.cache_dir, hashlib.sha256(url.encode()).hexdigest() + ".gz"
+        )
+
+    def open(self, url: str):
+        """
+        Function to open a cached response to read its body incrementally
+        Args:
+        url (str): request url
+        Returns:
+        entry (dict): metadata, None if not cached
+        cache_file (GzipFile): file positioned at the start of the body,
+            None if not cached. The caller closes it
+        """
+        path = self.get_path(url)
+        try:
+            cache_file = gzip.open(path, "rb")
+        except (FileNotFoundError, OSError):
+            return None, None
+
+        # First line is metadata, rest is the body
+        try:
+            entry = json.loads(cache_file.readline())
+        except (OSError, ValueError):
+            cache_file.close()
+            return None, None
+
+        # Mark as recently used for eviction
+        os.utime(path)
+
+        return entry, cache_file
+
+    def get(self, url: str):
+        """
+        Function to read a cached response
+        Args:
+        url (str): request url
+        Returns:
+        entry (dict): metadata + body, None if not cached
+        """
+        entry, cache_file = self.open(url)
+        if entry is None:
+            return None
+
+        with cache_file:
+            try:
+                entry["body"] = cache_file.read()
+            except (OSError, EOFError):
+                return None
+
+        return entry
+
+    @contextlib.contextmanager
+    def open_writer(self, url: str, headers=None, fetched_at=None):
+        """
+        Function to write a response body to the cache as it's read,
+        replacing the cached response only once the body is complete
+        Args:
+        url (str): request url
+        headers (dict): response headers, ETag/Last-Modified are kept
+        fetched_at (float): time the response was validated, default now
+        Returns:
+        cache_file (GzipFile): file to write the body to
+        """
+        headers = headers or {}
+        entry = {
+            "url": url,
+            "fetched_at": fetched_at or time.time(),
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+        }
+
+        # Write to a temp file then rename, so readers never see a
+        # partial file
+        path = self.get_path(url)
+        temp_path = path + "." + str(threading.get_ident()) + ".tmp"
+        try:
+            with gzip.open(temp_path, "wb") as cache_file:
+                cache_file.write(json.dumps(entry).encode() + b"\n")
+                yield cache_file
+            os.replace(temp_path, path)
+        finally:
+            # Failed writes leave no temp file behind
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        self.evict()
+
+    def put(self, url: str, body: bytes, headers=None, fetched_at=None):
+        """
+        Function to write a response to the cache
+        Args:
+        url (str): request url
+        body (bytes): response body
+        headers (dict): response headers, ETag/Last-Modified are kept
+        fetched_at (float): time the response was validated, default now
+        """
+        with self.open_writer(url, headers, fetched_at) as cache_file:
+            cache_file.write(body)
+
+    def touch(self, url: str, entry: dict):
+        """
+        Function to mark a cached response as fresh after a 304
+        Args:
+        url (str): request url
+        entry (dict): entry from get() or open(), without a body the
+            cached body is copied over from disk
+        """
+        headers = {
+            "ETag": entry["etag"],
+            "Last-Modified": entry["last_modified"],
+        }
+        if "body" in entry:
+            self.put(url, entry["body"], headers)
+            return
+
+        _, old_file = self.open(url)
+        if old_file is None:
+            return
+        with old_file, self.open_writer(url, headers) as cache_file:
+            shutil.copyfileobj(old_file, cache_file)
+
+    def evict(self):
+        """
+        Function to delete least recently used files over max_bytes
+        """
+        with self.lock:
+            # Oldest use first
+            files = sorted(
+                [
+                    x
+                    for x in os.scandir(self.cache_dir)
+                    if x.name.endswith(".gz")
+                ],
+                key=lambda x: x.stat().st_mtime,
+            )
+            total_bytes = sum(x.stat().st_size for x in files)
+            for cache_file in files:
+                if total_bytes <= self.max_bytes:
+                    break
+                total_bytes -= cache_file.stat().st_size
+                try:
+                    os.remove(cache_file.path)
+                except FileNotFoundError:
+                    pass
+
+
+# Functions
+def is_fresh(entry: dict, ttl):
+    """
+    Function to check if a cached response is within its TTL
+    Args:
+    entry (dict): entry from ResponseCache.get()
+    ttl (float): seconds a response stays fresh, None never expires
+    Returns:
+    fresh (bool): True if the entry can be served without a request
+    """
+    if ttl is None:
+        return True
+
+    return time.time() - entry["fetched_at"] < ttl
@@ -0,0 +1,441 @@
+"""
+Functions to write data to the SQL database
+"""
+# Import packages
+import csv
+import hashlib
+import os
+import time
+import weakref
+from contextlib import contextmanager
+from io import StringIO
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from functions.metrics_functions import record_retry, record_rows_written
+
+# Connection pool used by pooled_connection(), set by configure_db_pool()
+DB_POOL = None
+
+# Errors where the connection dropped and the statement can be retried
+TRANSIENT_DB_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+# Errors where a row was rejected, retrying the same rows fails again
+DATA_DB_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError)
+
+# Names of statements already prepared on each connection
+PREPARED_STATEMENTS = weakref.WeakKeyDictionary()
+
+# Rows written inside each connection's open transaction(), recorded
+# once it commits
+PENDING_ROWS_WRITTEN = weakref.WeakKeyDictionary()
+
+
+# Functions
+def configure_db_pool(dsn: str = None, minconn: int = 1, maxconn: int = 8):
+    """
+    Function to create the thread-safe connection pool
+    Args:
+    dsn (str): connection string, default DATABASE_URL env variable
+    minconn (int): connections opened up front
+    maxconn (int): max connections checked out at once
+    Returns:
+    pool (ThreadedConnectionPool): pool now used by pooled_connection()
+    """
+    global DB_POOL #pylint: disable=global-statement
+    DB_POOL = ThreadedConnectionPool(
+        minconn, maxconn, dsn or os.environ["DATABASE_URL"]
+    )
+
+    return DB_POOL
+
+
+@contextmanager
+def pooled_connection(pool=None):
+    """
+    Function to check a connection out of the pool for a block
+    Args:
+    pool (ThreadedConnectionPool): pool to use, default DB_POOL
+    Yields:
+    con (connection): connection in autocommit mode, use transaction()
+        to group statements
+    """
+    pool = pool or DB_POOL or configure_db_pool()
+    con = pool.getconn()
+    broken = False
+
+    try:
+        # Same mode the ingest scripts used, writes open their own
+        # transaction
+        con.autocommit = True
+        yield con
+    except TRANSIENT_DB_ERRORS:
+        broken = True
+        raise
+    finally:
+        # Drop dead connections instead of handing them out again
+        pool.putconn(con, close=broken or con.closed != 0)
+
+
+def run_db_stage(func, *args, retries=3, backoff=1.0, pool=None, **kwargs):
+    """
+    Function to run an ingest stage on a pooled connection, retrying the
+    whole stage on transient connection errors
+    Args:
+    func (function): stage taking a connection as its first argument,
+        must be safe to rerun (each write is one transaction)
+    *args: positional args passed to func after the connection
+    retries (int): max number of retries
+    backoff (float): seconds to wait before the first retry, doubled on
+        each retry
+    pool (ThreadedConnectionPool): pool to use, default DB_POOL
+    **kwargs: keyword args passed to func
+    Returns:
+    result: whatever func returns
+    """
+    for attempt in range(retries + 1):
+        try:
+            with pooled_connection(pool) as con:
+                return func(con, *args, **kwargs)
+        except TRANSIENT_DB_ERRORS as error:
+            # Out of retries -> raise
+            if attempt == retries:
+                raise
+            print(
+                "Transient DB error in "
+                + func.__name__
+                + ", retrying: "
+                + repr(error)
+            )
+            record_retry("db")
+            time.sleep(backoff * 2**attempt)
+
+    return None
+
+
+def execute_prepared(cursor, query: str):
+    """
+    Function to execute a statement, preparing it once per connection
+    Args:
+    cursor (cursor): cursor to execute on
+    query (str): statement without parameters
+    Returns:
+    row_count (int): number of rows affected
+    """
+    # Name statement by its text, so each distinct query is prepared once
+    name = "stmt_" + hashlib.md5(query.encode()).hexdigest()[:16]
+    prepared = PREPARED_STATEMENTS.setdefault(cursor.connection, set())
+    if name not in prepared:
+        cursor.execute("PREPARE " + name + " AS " + query)
+        prepared.add(name)
+
+    cursor.execute("EXECUTE " + name)
+
+    return cursor.rowcount
+
+
+@contextmanager
+def transaction(con):
+    """
+    Function to run a block of statements inside a single transaction
+    Args:
+    con (connection): connection to SQL database
+    Yields:
+    cursor (cursor): cursor bound to the open transaction
+    """
+    # Remember autocommit setting so it can be restored afterwards
+    autocommit = con.autocommit
+    con.autocommit = False
+    PENDING_ROWS_WRITTEN[con] = []
+
+    try:
+        # Commit if the block succeeds, roll back otherwise
+        with con:
+            with con.cursor() as cursor:
+                yield cursor
+
+        # Only committed rows are recorded, a rolled back or retried
+        # write never is
+        for table, written, staged in PENDING_ROWS_WRITTEN[con]:
+            record_rows_written(table, written, staged)
+    finally:
+        PENDING_ROWS_WRITTEN.pop(con, None)
+        con.autocommit = autocommit
+
+
+def record_rows_on_commit(cursor, table: str, written: int, staged=None):
+    """
+    Function to record rows merged into a table once they're committed
+    Args:
+    cursor (cursor): cursor the rows were written on
+    table (str): table written to
+    written (int): rows inserted or changed
+    staged (int): rows staged for the merge, None if unknown
+    """
+    pending = PENDING_ROWS_WRITTEN.get(cursor.connection)
+
+    # Outside transaction(), the statement was already committed
+    if pending is None:
+        record_rows_written(table, written, staged)
+    else:
+        pending.append((table, written, staged))
+
+
+def create_stage_table(cursor, stage_table, column_types):
+    """
+    Function to create an empty temp staging table, kept for the life of
+    the connection so merges into it can stay prepared
+    Args:
+    cursor (cursor): cursor inside an open transaction
+    stage_table (str): name of temp table, always staged with the same
+        column_types
+    column_types (dict): column name -> SQL type, in table order
+    """
+    # Create temp table once per connection, emptied on every commit
+    cursor.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS "
+        + stage_table
+        + " ("
+        + ", ".join([col + " " + typ for col, typ in column_types.items()])
+        + ") ON COMMIT DELETE ROWS"
+    )
+
+    # Empty rows staged earlier in this transaction
+    cursor.execute("TRUNCATE " + stage_table)
+
+
+def copy_df_to_stage(cursor, stage_table, df, column_types):
+    """
+    Function to stage a dataframe into a temp table with COPY
+    Args:
+    cursor (cursor): cursor inside an open transaction
+    stage_table (str): name of temp table to stage into
+    df (df): dataframe to stage, must contain column_types keys
+    column_types (dict): column name -> SQL type, in table order
+    """
+    # Create/empty temp table
+    create_stage_table(cursor, stage_table, column_types)
+
+    # Write dataframe to an in-memory csv buffer (NaN -> empty -> NULL)
+    buffer = StringIO()
+    df[list(column_types)].to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+
+    # Stream buffer into temp table
+    cursor.copy_expert(
+        "COPY "
+        + stage_table
+        + " ("
+        + ", ".join(column_types)
+        + ") FROM STDIN WITH (FORMAT csv)",
+        buffer,
+    )
+
+
+def copy_rows_to_stage( #pylint: disable=too-many-arguments
+    cursor,
+    stage_table,
+    column_types,
+    rows,
+    chunk_size=10000,
+    sequence_column: str = None,
+):
+    """
+    Function to stream an iterable of rows into a temp table with COPY
+    Args:
+    cursor (cursor): cursor inside an open transaction
+    stage_table (str): name of temp table to stage into
+    column_types (dict): column name -> SQL type, in row order
+    rows (iterable): rows as sequences, None values are loaded as NULL
+    chunk_size (int): rows buffered in memory per COPY
+    sequence_column (str): extra BIGINT column written with each row's
+        position, so staging order can be queried. Table rows have no
+        order of their own
+    Returns:
+    row_count (int): number of rows staged
+    """
+    # Number rows in the order they were staged
+    if sequence_column is not None:
+        column_types = {**column_types, sequence_column: "BIGINT"}
+        rows = (
+            list(row) + [row_number] for row_number, row in enumerate(rows)
+        )
+
+    # Create/empty temp table
+    create_stage_table(cursor, stage_table, column_types)
+
+    # Set COPY statement
+    copy_query = (
+        "COPY "
+        + stage_table
+        + " ("
+        + ", ".join(column_types)
+        + ") FROM STDIN WITH (FORMAT csv)"
+    )
+
+    # Buffer chunk_size rows at a time so memory stays flat
+    row_count = 0
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        row_count += 1
+
+        # Flush full chunk
+        if row_count % chunk_size == 0:
+            buffer.seek(0)
+            cursor.copy_expert(copy_query, buffer)
+            buffer.seek(0)
+            buffer.truncate()
+
+    # Flush remainder
+    if buffer.tell() > 0:
+        buffer.seek(0)
+        cursor.copy_expert(copy_query, buffer)
+
+    return row_count
+
+
+def upsert_from_query( #pylint: disable=too-many-arguments
+    cursor,
+    table,
+    columns,
+    select_query,
+    key_columns,
+    keep_on_null=False,
+    skip_unchanged=False,
+    staged_rows=None,
+):
+    """
+    Function to insert/update the result of a query into a table
+    Args:
+    cursor (cursor): cursor inside an open transaction
+    table (str): name of table to upsert into
+    columns (list): table columns, in the order select_query returns them
+    select_query (str): query over staged data returning one row per key
+    key_columns (list): columns of the table's primary key
+    keep_on_null (bool): keep existing value when the new value is null
+    skip_unchanged (bool): don't rewrite rows whose values are unchanged
+    staged_rows (int): rows staged for the merge, recorded with the rows
+        written so skipped rows can be counted
+    Returns:
+    row_count (int): number of rows inserted or updated
+    """
+    # Build new values for non-key columns
+    update_columns = [col for col in columns if col not in key_columns]
+    if keep_on_null:
+        # Only overwrite when the new value is not null
+        new_values = [
+            "COALESCE(EXCLUDED." + col + ", " + table + "." + col + ")"
+            for col in update_columns
+        ]
+    else:
+        new_values = ["EXCLUDED." + col for col in update_columns]
+
+    # Build SET clause
+    set_clause = ", ".join(
+        [col + " = " + val for col, val in zip(update_columns, new_values)]
+    )
+
+    # Only update rows where a value changed, so unchanged rows aren't
+    # rewritten (no dead tuples/WAL) and aren't counted
+    if skip_unchanged:
+        set_clause += (
+            " WHERE ("
+            + ", ".join([table + "." + col for col in update_columns])
+            + ") IS DISTINCT FROM ("
+            + ", ".join(new_values)
+            + ")"
+        )
+
+    # Merge query result into table
+    row_count = execute_prepared(
+        cursor,
+        "INSERT INTO "
+        + table
+        + " ("
+        + ", ".join(columns)
+        + ") "
+        + select_query
+        + " ON CONFLICT ("
+        + ", ".join(key_columns)
+        + ") DO UPDATE SET "
+        + set_clause,
+    )
+    record_rows_on_commit(cursor, table, row_count, staged_rows)
+
+    return row_count
+
+
+def bulk_upsert( #pylint: disable=too-many-arguments
+    cursor,
+    table,
+    df,
+    column_types,
+    key_columns,
+    keep_on_null=False,
+    skip_unchanged=False,
+):
+    """
+    Function to insert/update a dataframe into a table in one statement
+    Args:
+    cursor (cursor): cursor inside an open transaction
+    table (str): name of table to upsert into
+    df (df): dataframe to upsert, must contain column_types keys
+    column_types (dict): column name -> SQL type used for staging
+    key_columns (list): columns of the table's primary key
+    keep_on_null (bool): keep existing value when the new value is null
+    skip_unchanged (bool): don't rewrite rows whose values are unchanged
+    Returns:
+    row_count (int): number of rows inserted or updated
+    """
+    # Last row wins for duplicate keys, same as calling the procedure per row
+    df = df.drop_duplicates(subset=key_columns, keep="last")
+
+    # Stage dataframe
+    stage_table = "stage_" + table
+    copy_df_to_stage(cursor, stage_table, df, column_types)
+
+    # Merge staged rows into table
+    return upsert_from_query(
+        cursor,
+        table,
+        list(column_types),
+        "SELECT " + ", ".join(column_types) + " FROM " + stage_table,
+        key_columns,
+        keep_on_null=keep_on_null,
+        skip_unchanged=skip_unchanged,
+        staged_rows=len(df),
+    )
+
+
+def bulk_insert(cursor, table, df, column_types):
+    """
+    Function to append a dataframe to a table, skipping existing keys
+    Args:
+    cursor (cursor): cursor inside an open transaction
+    table (str): name of table to insert into
+    df (df): dataframe to insert, must contain column_types keys
+    column_types (dict): column name -> SQL type used for staging
+    Returns:
+    row_count (int): number of rows inserted
+    """
+    # Stage dataframe
+    stage_table = "stage_" + table
+    copy_df_to_stage(cursor, stage_table, df, column_types)
+
+    # Append staged rows, rows already in the table are left as is
+    row_count = execute_prepared(
+        cursor,
+        "INSERT INTO "
+        + table
+        + " ("
+        + ", ".join(column_types)
+        + ") SELECT "
+        + ", ".join(column_types)
+        + " FROM "
+        + stage_table
+        + " ON CONFLICT DO NOTHING",
+    )
+    record_rows_on_commit(cursor, table, row_count, len(df))
+
+    return row_count
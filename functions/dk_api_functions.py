@@ -2,30 +2,264 @@
 Functions to pull data from DraftKings API
 """
 # Import packages
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import ijson
 import pandas as pd
-import requests
 import numpy as np
+from functions.db_functions import (
+    DATA_DB_ERRORS,
+    bulk_upsert,
+    transaction,
+)
+from functions.extract_functions import extract_query
+from functions.http_functions import get_json, get_json_stream
+from functions.metrics_functions import (
+    record_rows_parsed,
+    record_swallowed_error,
+)
+from functions.odds_functions import FAIR_ODDS_COLUMNS, add_fair_odds
+
+# DraftKings eventgroups url, override to point at a local replay server
+DK_API_URL = (
+    "https://sportsbook-us-ny.draftkings.com//sites/US-NY-SB/api/v5/"
+    + "eventgroups/"
+)
+
+# Seconds a cached odds response is served before refetching
+DK_ODDS_TTL = 30
+
+# Timezone startDate is stored in, as wall clock time labelled UTC like
+# nba_api_events.gameEt
+EASTERN_TZ = "America/New_York"
+
+# team_slug_lk rows, loaded once per process by get_team_slug_lookup()
+TEAM_SLUG_LOOKUP = None
+
+# Prices and lines of a team row as DraftKings lists them, fair odds
+# are derived from them
+DK_NBA_TEAM_LINE_COLUMNS = [
+    "oddsMoneyline",
+    "oddsSpread",
+    "spreadLine",
+    "totalPointsLine",
+    "oddsOver",
+    "oddsUnder",
+]
+
+# Staging column types, matching update_dkodds_nba_team parameters plus
+# total odds and fair odds, dk_team_odds has the same columns
+DK_NBA_TEAM_ODDS_COLUMNS = {
+    "eventId": "INT",
+    "teamType": "VARCHAR(4)",
+    **{x: "FLOAT" for x in DK_NBA_TEAM_LINE_COLUMNS},
+    **{x: "FLOAT" for x in FAIR_ODDS_COLUMNS},
+}
+
+# Staging column types, matching update_dkevents parameters
+DK_EVENTS_COLUMNS = {
+    "eventId": "INT",
+    "startDate": "TIMESTAMP WITH TIME ZONE",
+    "awayTeamSlug": "VARCHAR(3)",
+    "homeTeamSlug": "VARCHAR(3)",
+    "awayTeamName": "VARCHAR(30)",
+    "homeTeamName": "VARCHAR(30)",
+    "leagueSlug": "VARCHAR(10)",
+}
+
+# Game line offer labels -> odd type
+DK_GAME_LINE_LABELS = {
+    "Spread": "Spread",
+    "Moneyline": "Moneyline",
+    "Total": "Total",
+}
+
+# ijson prefixes of eventgroup events and offer subcategory descriptors
+DK_EVENTS_PREFIX = "eventGroup.events.item"
+DK_DESCRIPTOR_PREFIX = (
+    "eventGroup.offerCategories.item.offerSubcategoryDescriptors.item"
+)
+DK_OFFERS_PREFIX = DK_DESCRIPTOR_PREFIX + ".offerSubcategory.offers"
+
+# Leagues to ingest: DK eventgroup, Game Lines subcategories, offer
+# label -> odd type, and the table odds are written to
+DK_LEAGUES = {
+    "NBA": {
+        "eventgroup_id": 42648,
+        "subcategory_ids": [4511],
+        "offer_labels": DK_GAME_LINE_LABELS,
+        "odds_table": "dk_nba_team_odds",
+    },
+    "NFL": {
+        "eventgroup_id": 88808,
+        "subcategory_ids": [4518],
+        "offer_labels": DK_GAME_LINE_LABELS,
+        "odds_table": "dk_team_odds",
+    },
+    "MLB": {
+        "eventgroup_id": 84240,
+        "subcategory_ids": [4519],
+        "offer_labels": {
+            "Run Line": "Spread",
+            "Moneyline": "Moneyline",
+            "Total": "Total",
+        },
+        "odds_table": "dk_team_odds",
+    },
+    "NHL": {
+        "eventgroup_id": 42133,
+        "subcategory_ids": [4525],
+        "offer_labels": {
+            "Puck Line": "Spread",
+            "Moneyline": "Moneyline",
+            "Total": "Total",
+        },
+        "odds_table": "dk_team_odds",
+    },
+}
+
 
 # Functions
-def get_nba_team_game_lines():
+def to_eastern_wall_clock(timestamps):
     """
-    Function to get offer subcategory 4511 from DK API (NBA team game lines)
+    Function to convert UTC timestamps to Eastern wall clock time, still
+    labelled UTC, following daylight saving time
+    Args:
+    timestamps (Series or Timestamp): tz-aware timestamps
     Returns:
-    nba_team_game_lines (df): dataframe of available NBA team game lines
-    nba_game_df (df): dataframe of available NBA games
+    timestamps (Series or Timestamp): Eastern wall clock time labelled UTC
+    """
+    if isinstance(timestamps, pd.Series):
+        return (
+            timestamps.dt.tz_convert(EASTERN_TZ)
+            .dt.tz_localize(None)
+            .dt.tz_localize("UTC")
+        )
+
+    return timestamps.tz_convert(EASTERN_TZ).tz_localize(None).tz_localize(
+        "UTC"
+    )
+
+
+def parse_eventgroup( #pylint: disable=too-many-branches
+    dk_file, subcategory_ids: list, include_events=True
+):
+    """
+    Function to stream an eventgroup response, only building the events
+    and the offers of the requested subcategories, every other offer
+    category is tokenized and dropped
+    Args:
+    dk_file (file): binary file-like object with the response body
+    subcategory_ids (list): offer subcategory ids to keep
+    include_events (bool): build the events array
+    Returns:
+    events (list): eventgroup events, empty if include_events is False
+    subcategory_offers (dict): subcategory id -> offers, only for the
+        requested subcategories found
+    """
+    events = []
+    subcategory_offers = {}
+    builder = None
+    build_prefix = None
+    subcategory_id = None
+    descriptor_offers = None
+
+    for prefix, event, value in ijson.parse(dk_file, use_float=True):
+        # Feed the object being built until its closing event
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == build_prefix and event in ("end_map", "end_array"):
+                if build_prefix == DK_EVENTS_PREFIX:
+                    events.append(builder.value)
+                else:
+                    descriptor_offers = builder.value
+                builder = None
+            continue
+
+        # Event objects
+        if prefix == DK_EVENTS_PREFIX and event == "start_map":
+            if include_events:
+                builder = ijson.ObjectBuilder()
+                build_prefix = prefix
+                builder.event(event, value)
+
+        # Subcategory id of the current descriptor
+        elif prefix == DK_DESCRIPTOR_PREFIX + ".subcategoryId":
+            subcategory_id = int(value)
+
+        # Offers, built if the id is requested or not seen yet
+        elif prefix == DK_OFFERS_PREFIX and event == "start_array":
+            if subcategory_id is None or subcategory_id in subcategory_ids:
+                builder = ijson.ObjectBuilder()
+                build_prefix = prefix
+                builder.event(event, value)
+
+        # End of descriptor, keep its offers if requested
+        elif prefix == DK_DESCRIPTOR_PREFIX and event == "end_map":
+            if descriptor_offers is not None and (
+                subcategory_id in subcategory_ids
+            ):
+                subcategory_offers[subcategory_id] = descriptor_offers
+            subcategory_id = None
+            descriptor_offers = None
+
+    return events, subcategory_offers
+
+
+def get_team_game_lines(
+    league: str, ttl=DK_ODDS_TTL, stream=True, api_url: str = None
+):
+    """
+    Function to get a league's game line offer subcategories from DK API
+    Args:
+    league (str): key of DK_LEAGUES, e.g. 'NBA'
+    ttl (int): seconds a cached response is served, 0 always revalidates
+    stream (bool): parse the response incrementally with
+        parse_eventgroup(), False loads the whole response
+    api_url (str): eventgroups url, default DK_API_URL
+    Returns:
+    team_game_lines (dict): game line offers of every subcategory
+    game_df (df): dataframe of available games
     offer_length (int): number of offers to pull
     """
+    league_config = DK_LEAGUES[league]
     try:
-        # Set the API URL for NBA teams
-        dk_nba_team_url = "https://sportsbook-us-ny.draftkings.com//sites/" + \
-        "US-NY-SB/api/v5/eventgroups/42648?format=json"
-
-        # Get team data from the API
-        dk_nba_team_data = requests.get(dk_nba_team_url).json()["eventGroup"] #pylint: disable=line-too-long, missing-timeout
+        # Set the API URL for the league's eventgroup
+        dk_team_url = (
+            (api_url or DK_API_URL)
+            + str(league_config["eventgroup_id"])
+            + "?format=json"
+        )
 
-        # Construct NBA Game Dataframe
+        # Get events and game line offers from the API
+        if stream:
+            events, subcategory_offers = get_json_stream(
+                dk_team_url,
+                partial(
+                    parse_eventgroup,
+                    subcategory_ids=league_config["subcategory_ids"],
+                ),
+                ttl=ttl,
+            )
+        else:
+            dk_team_data = get_json(dk_team_url, ttl=ttl)["eventGroup"]
+            events = dk_team_data["events"]
+
+            # Game lines first level
+            team_offer_cats = [
+                x
+                for x in dk_team_data["offerCategories"]
+                if x["name"] == "Game Lines"
+            ][0]["offerSubcategoryDescriptors"]
+            subcategory_offers = {
+                x["subcategoryId"]: x["offerSubcategory"]["offers"]
+                for x in team_offer_cats
+                if x["subcategoryId"] in league_config["subcategory_ids"]
+            }
+
+        # Construct Game Dataframe
         # Select columns for games dataframe
-        nba_game_df_cols = [
+        game_df_cols = [
             "eventId",
             "nameIdentifier",
             "startDate",
@@ -35,43 +269,38 @@ def get_nba_team_game_lines():
         ]
 
         # Create dataframe of games available
-        nba_game_df = pd.json_normalize(dk_nba_team_data["events"])[
-            nba_game_df_cols
-        ]
+        game_df = pd.json_normalize(events)[game_df_cols]
 
-        # Convert startDate to datetime,
-        # then convert to EST by subtracting 5 hours
-        nba_game_df["startDate"] = pd.to_datetime(nba_game_df["startDate"])
-        nba_game_df["startDate"] = nba_game_df["startDate"] - pd.Timedelta(
-            hours=5
+        # Convert startDate to datetime, then to Eastern time (EST or EDT),
+        # so late tip-offs keep their Eastern game date
+        game_df["startDate"] = to_eastern_wall_clock(
+            pd.to_datetime(game_df["startDate"], utc=True)
         )
 
         # Rename eventStatus.state to gameState
-        nba_game_df.rename(
-            columns={"eventStatus.state": "gameState"}, inplace=True
-        )
+        game_df.rename(columns={"eventStatus.state": "gameState"}, inplace=True)
 
         # Only take games that have not started
-        nba_game_df = nba_game_df[nba_game_df["gameState"] == "NOT_STARTED"]
+        game_df = game_df[game_df["gameState"] == "NOT_STARTED"]
         
-        # if not @ in nameidentifier, return empty df
-        if not "@" in nba_game_df["nameIdentifier"].iloc[0]:
+        # if no games or not @ in nameidentifier, return empty df
+        if len(game_df) == 0 or not "@" in game_df["nameIdentifier"].iloc[0]:
             return pd.DataFrame(), pd.DataFrame(), 0
 
         # Create away column from first word of nameIdentifier, trim whitespace
-        nba_game_df["awayTeamName"] = (
-            nba_game_df["nameIdentifier"].str.split(" @ ").str[0].str.strip()
+        game_df["awayTeamName"] = (
+            game_df["nameIdentifier"].str.split(" @ ").str[0].str.strip()
         )
         # Create home column from second word of nameIdentifier, trim whitespace
-        nba_game_df["homeTeamName"] = (
-            nba_game_df["nameIdentifier"].str.split(" @ ").str[1].str.strip()
+        game_df["homeTeamName"] = (
+            game_df["nameIdentifier"].str.split(" @ ").str[1].str.strip()
         )
 
-        # Add NBA type column
-        nba_game_df["leagueSlug"] = "NBA"
+        # Add league type column
+        game_df["leagueSlug"] = league
 
         # Rename teamShortName1 and teamShortName2
-        nba_game_df.rename(
+        game_df.rename(
             columns={
                 "teamShortName1": "awayTeamSlug",
                 "teamShortName2": "homeTeamSlug",
@@ -80,36 +309,52 @@ def get_nba_team_game_lines():
         )
 
         # Drop nameIdentifier and gameState
-        nba_game_df.drop(columns=["nameIdentifier", "gameState"], inplace=True)
+        game_df.drop(columns=["nameIdentifier", "gameState"], inplace=True)
 
         # Make eventId an int
-        nba_game_df["eventId"] = nba_game_df["eventId"].astype(int)
+        game_df["eventId"] = game_df["eventId"].astype(int)
         ###
 
-        ### Get offers df from offerCategories and offerSubcategoryDescriptors
-        # Game lines first level
-        nba_team_offer_cats = [
-            x
-            for x in dk_nba_team_data["offerCategories"]
-            if x["name"] == "Game Lines"
-        ][0]["offerSubcategoryDescriptors"]
-
-        # Filter for normal game lines ID (total/point spread/moneyline)
-        nba_team_game_lines = [
-            x for x in nba_team_offer_cats if x["subcategoryId"] == 4511
-        ][0]
+        ### Get offers of the league's game lines IDs (total/spread/moneyline),
+        # offers of every subcategory are combined
+        team_game_lines = {
+            "subcategoryIds": league_config["subcategory_ids"],
+            "offerSubcategory": {
+                "offers": [
+                    offer
+                    for x in league_config["subcategory_ids"]
+                    for offer in subcategory_offers.get(x, [])
+                ]
+            },
+        }
 
         # Get number of offers to loop through
-        offer_length = len(nba_team_game_lines["offerSubcategory"]["offers"])
+        offer_length = len(team_game_lines["offerSubcategory"]["offers"])
         ###
 
-        return nba_team_game_lines, nba_game_df, offer_length
+        record_rows_parsed(len(game_df))
+        return team_game_lines, game_df, offer_length
 
-    except RuntimeError:
-        # Error retrieving data -> return empty
+    except (RuntimeError, KeyError, IndexError) as error:
+        # Error retrieving data or league out of season -> return empty
+        record_swallowed_error(error)
+        record_rows_parsed(0)
         return pd.DataFrame(), pd.DataFrame(), 0
 
 
+def get_nba_team_game_lines(ttl=DK_ODDS_TTL):
+    """
+    Function to get offer subcategory 4511 from DK API (NBA team game lines)
+    Args:
+    ttl (int): seconds a cached response is served, 0 always revalidates
+    Returns:
+    nba_team_game_lines (dict): NBA team game line offers
+    nba_game_df (df): dataframe of available NBA games
+    offer_length (int): number of offers to pull
+    """
+    return get_team_game_lines("NBA", ttl)
+
+
 def create_nba_team_odds_df(nba_team_game_lines, event_ind):
     """
     Function to create NBA team odds dataframe for a given event index
@@ -182,184 +427,425 @@ def create_nba_team_odds_df(nba_team_game_lines, event_ind):
     return event_odds_df
 
 
-def update_nba_team_odds(cursor, nba_game_df, nba_team_odds_df, con):
+def parse_team_odds(team_game_lines, offer_labels=None):
     """
-    Function to join meta info to nba_team_odds_df + update SQL tables
+    Function to create team odds dataframe for all events in one pass,
+    same output as concatenating create_nba_team_odds_df() for every event
     Args:
-    cursor (cursor): cursor to SQL database
-    nba_game_df (df): nba_game_df from get_nba_team_game_lines()
-    nba_team_odds_df (df): nba_team_odds_df from create_nba_team_odds_df()
-    con (connection): connection to SQL database
+    team_game_lines (dict): team_game_lines from get_team_game_lines()
+    offer_labels (dict): offer label -> odd type, default
+        DK_GAME_LINE_LABELS
+    Returns:
+    team_odds_df (df): dataframe of available odds for all events
     """
-    try:
-        # Try to join meta info to nba_team_odds_df
-        if len(nba_team_odds_df) > 0:
-
-            # Make eventId an int
-            nba_team_odds_df["eventId"] = nba_team_odds_df["eventId"].astype(
-                int
-            )
-
-            # join nba_game_df
-            nba_team_odds_df = nba_team_odds_df.merge(
-                nba_game_df[["eventId", "awayTeamName", "homeTeamName"]],
-                on="eventId",
-                how="inner",
-            )
-
-            # Create teamType column
-            nba_team_odds_df["teamType"] = np.where(
-                nba_team_odds_df["label"] == nba_team_odds_df["homeTeamName"],
-                "Home",
-                "Away",
-            )
-
-            # filter for over/under labels (which will always
-            # be the same so can just take Over)
-            over_under_lines = nba_team_odds_df[
-                nba_team_odds_df["label"].isin(["Over"])
-            ][["eventId", "line"]]
-            over_under_lines.rename(
-                columns={"line": "totalPointsLine"}, inplace=True
-            )
-
-            # Get spread lines
-            spread_lines = nba_team_odds_df[
-                nba_team_odds_df["oddType"] == "Spread"
-            ][["eventId", "line", "teamType"]]
-            spread_lines.rename(columns={"line": "spreadLine"}, inplace=True)
-
-            # Filter out Over/Under labels
-            nba_team_odds_df = nba_team_odds_df[
-                ~nba_team_odds_df["label"].isin(["Over", "Under"])
-            ]
-
-            # Pivot wider on team type and eventId
-            nba_team_odds_df = nba_team_odds_df.pivot_table(
-                index=["eventId", "teamType"],
-                columns=["oddType"],
-                values=["oddsAmerican"],
-                aggfunc="first",
+    offer_labels = offer_labels or DK_GAME_LINE_LABELS
+
+    # Outcome keys to keep per odd type
+    odd_type_keys = {
+        "Spread": ("oddsAmerican", "label", "line"),
+        "Moneyline": ("oddsAmerican", "label"),
+        "Total": ("oddsAmerican", "label", "line"),
+    }
+
+    # Column lists, filled in one walk over the offers
+    odds_american = []
+    labels = []
+    lines = []
+    odd_types = []
+    event_ids = []
+
+    for event_offers in team_game_lines["offerSubcategory"]["offers"]:
+        # Live/empty events have no offers
+        if not event_offers:
+            continue
+        event_id = event_offers[0].get("eventId")
+
+        for odd_type, keys in odd_type_keys.items():
+            # First offer for this odd type
+            offer = next(
+                (
+                    x
+                    for x in event_offers
+                    if offer_labels.get(x.get("label")) == odd_type
+                ),
+                None,
             )
+            if offer is None or not offer.get("outcomes"):
+                continue
+
+            # Skip the odd type if any key is missing from every outcome
+            outcomes = offer["outcomes"]
+            if not all(any(key in x for x in outcomes) for key in keys):
+                continue
+
+            for outcome in outcomes:
+                odds_american.append(outcome.get("oddsAmerican", np.nan))
+                labels.append(outcome.get("label", np.nan))
+                lines.append(
+                    outcome.get("line", np.nan) if "line" in keys else np.nan
+                )
+                odd_types.append(odd_type)
+                event_ids.append(event_id)
+
+    # Build dataframe once
+    return pd.DataFrame(
+        {
+            "oddsAmerican": odds_american,
+            "label": labels,
+            "line": np.array(lines, dtype=float),
+            "oddType": odd_types,
+            "eventId": event_ids,
+        }
+    )
+
+
+def parse_nba_team_odds(nba_team_game_lines):
+    """
+    Function to create NBA team odds dataframe for all events in one pass
+    Args:
+    nba_team_game_lines (dict): nba_team_game_lines from
+        get_nba_team_game_lines()
+    Returns:
+    nba_team_odds_df (df): dataframe of available odds for all events
+    """
+    return parse_team_odds(
+        nba_team_game_lines, DK_LEAGUES["NBA"]["offer_labels"]
+    )
 
-            # Fix colummn names then reset index
-            nba_team_odds_df.columns = [
-                "".join(col) for col in nba_team_odds_df.columns
-            ]
-            nba_team_odds_df = nba_team_odds_df.reset_index()
 
-            # Join spread_lines and over_under_lines
-            nba_team_odds_df = nba_team_odds_df.merge(
-                spread_lines, on=["eventId", "teamType"], how="left"
-            )
-            nba_team_odds_df = nba_team_odds_df.merge(
-                over_under_lines, on="eventId", how="left"
-            )
+def get_first_by_key(keys, mask, values, out_keys):
+    """
+    Function to get the first value per key among masked rows
+    Args:
+    keys (array): int key of each row
+    mask (array): rows to consider
+    values (array): value of each row
+    out_keys (array): sorted keys to return values for
+    Returns:
+    first (array): first value per out_keys, NaN if a key has no rows
+    """
+    rows = np.flatnonzero(mask)
+    row_keys, first_rows = np.unique(keys[rows], return_index=True)
+    first = np.full(len(out_keys), np.nan)
+    found = np.isin(row_keys, out_keys)
+    first[np.searchsorted(out_keys, row_keys[found])] = values[
+        rows[first_rows[found]]
+    ]
 
-            # Remove American from columns names
-            nba_team_odds_df.columns = nba_team_odds_df.columns.str.replace(
-                "American", ""
-            )
+    return first
 
-            # Convert spreadLine, oddsSpread, and totalPoints to float
-            nba_team_odds_df[
-                ["spreadLine", "oddsSpread", "totalPointsLine", "oddsMoneyline"]
-            ] = nba_team_odds_df[
-                ["spreadLine", "oddsSpread", "totalPointsLine", "oddsMoneyline"]
-            ].astype(
-                float
-            )
 
-            # If event/teamType combo in SQL, update, else insert
-            for (
-                index, #pylint: disable=unused-variable
-                row,
-            ) in nba_team_odds_df.iterrows():
-                # Query
-                query = "CALL update_dkodds_nba_team(%s, %s, %s, %s, %s, %s)"
-                # Execute
-                cursor.execute(
-                    query,
-                    (
-                        row["eventId"],
-                        row["teamType"],
-                        row["oddsMoneyline"],
-                        row["oddsSpread"],
-                        row["spreadLine"],
-                        row["totalPointsLine"],
-                    ),
+def create_nba_team_odds_wide_df( #pylint: disable=too-many-locals
+    nba_game_df, nba_team_odds_df, league: str = "NBA"
+):
+    """
+    Function to reshape odds to one row per event and team type with
+    array lookups on a key per row, with fair odds
+    Args:
+    nba_game_df (df): nba_game_df from get_nba_team_game_lines()
+    nba_team_odds_df (df): nba_team_odds_df from parse_nba_team_odds()
+    league (str): key of DK_LEAGUES, sets push probabilities
+    Returns:
+    nba_team_odds_df (df): dataframe with DK_NBA_TEAM_ODDS_COLUMNS, sorted
+        by eventId and teamType
+    """
+    # Position of each row's event in the sorted events, odds of other
+    # events are dropped
+    game_ids = nba_game_df["eventId"].astype(int).to_numpy()
+    game_order = np.argsort(game_ids, kind="stable")
+    game_ids = game_ids[game_order]
+    event_ids = nba_team_odds_df["eventId"].astype(int).to_numpy()
+    positions = np.searchsorted(game_ids, event_ids)
+    known = np.isin(event_ids, game_ids)
+
+    labels = nba_team_odds_df["label"].to_numpy(dtype=object)
+    odd_types = nba_team_odds_df["oddType"].to_numpy(dtype=object)
+    odds = nba_team_odds_df["oddsAmerican"].astype(float).to_numpy()
+    lines = nba_team_odds_df["line"].astype(float).to_numpy()
+    is_over = known & (labels == "Over")
+    is_under = known & (labels == "Under")
+    is_team = known & ~is_over & ~is_under
+
+    # Team rows are keyed 2 * event position, + 1 for Home so Away sorts
+    # first, a team type has a row if it has any odds
+    home_names = nba_game_df["homeTeamName"].to_numpy(dtype=object)[
+        game_order
+    ]
+    is_home = np.zeros(len(labels), dtype=bool)
+    is_home[known] = labels[known] == home_names[positions[known]]
+    team_keys = 2 * positions + is_home
+    out_keys = np.unique(team_keys[is_team & ~np.isnan(odds)])
+    out_positions = out_keys // 2
+
+    # First non-null odds per odd type, like pivot_table(aggfunc="first"),
+    # Over and Under lines are always the same so take Over's
+    nba_team_odds_df = pd.DataFrame(
+        {
+            "eventId": game_ids[out_positions],
+            "teamType": np.where(out_keys % 2 == 1, "Home", "Away"),
+            "oddsMoneyline": get_first_by_key(
+                team_keys,
+                is_team & (odd_types == "Moneyline") & ~np.isnan(odds),
+                odds,
+                out_keys,
+            ),
+            "oddsSpread": get_first_by_key(
+                team_keys,
+                is_team & (odd_types == "Spread") & ~np.isnan(odds),
+                odds,
+                out_keys,
+            ),
+            "spreadLine": get_first_by_key(
+                team_keys, is_team & (odd_types == "Spread"), lines, out_keys
+            ),
+            **{
+                col: get_first_by_key(
+                    positions, mask, values, np.arange(len(game_ids))
+                )[out_positions]
+                for col, mask, values in (
+                    ("totalPointsLine", is_over, lines),
+                    ("oddsOver", is_over, odds),
+                    ("oddsUnder", is_under, odds),
                 )
+            },
+        }
+    )
 
-        print("Inserted/Updated dk_nba_team_odds")
+    return add_fair_odds(nba_team_odds_df, league)
 
-    except: #pylint: disable=bare-except
-        # No offers today
-        print("No offers today")
 
-    try:
-        # Try to update nba game df
-        # Query team_slug_lk to get correct team names
-        team_fix = pd.read_sql(
+def get_team_slug_lookup(con, refresh=False):
+    """
+    Function to get team_slug_lk, read from SQL once per process
+    Args:
+    con (connection): connection to SQL database
+    refresh (bool): re-read team_slug_lk, e.g. after adding teams
+    Returns:
+    team_fix (df): leagueSlug, dk_slug and team_slug columns
+    """
+    global TEAM_SLUG_LOOKUP #pylint: disable=global-statement
+
+    # Query team_slug_lk to get correct team names
+    if TEAM_SLUG_LOOKUP is None or refresh:
+        TEAM_SLUG_LOOKUP = extract_query(
+            con,
             """
             SELECT
+                league_slug AS "leagueSlug",
                 dk_slug,
                 team_slug
             FROM
                 team_slug_lk
-            WHERE
-                league_slug = 'NBA'
             """,
-            con=con
         )
 
-        # Join team_fix to nba_team_odds_df
-        # Replace away team names with correct names
-        nba_game_df = nba_game_df.merge(
-            team_fix,
-            left_on="awayTeamSlug",
-            right_on="dk_slug",
+    return TEAM_SLUG_LOOKUP
+
+
+def fix_team_slugs(con, game_df):
+    """
+    Function to replace DK team slugs with team_slug_lk slugs
+    Args:
+    con (connection): connection to SQL database
+    game_df (df): game_df from get_team_game_lines(), any leagues
+    Returns:
+    game_df (df): game_df with fixed awayTeamSlug/homeTeamSlug
+    """
+    team_fix = get_team_slug_lookup(con)
+
+    # Replace away then home team slugs with correct slugs,
+    # matched within the event's league
+    for slug_col in ("awayTeamSlug", "homeTeamSlug"):
+        game_df = game_df.merge(
+            team_fix.rename(columns={"dk_slug": slug_col}),
+            on=["leagueSlug", slug_col],
             how="left",
         )
-        # Replace awayTeamSlug with team_slug
-        nba_game_df["awayTeamSlug"].update(nba_game_df["team_slug"])
+        game_df[slug_col] = game_df["team_slug"].fillna(game_df[slug_col])
+        game_df = game_df.drop(columns=["team_slug"])
 
-        # Drop joined columns
-        nba_game_df.drop(
-            columns=["team_slug", "dk_slug"],
-            inplace=True,
-        )
+    return game_df
 
-        # Replace home team names with correct names
-        nba_game_df = nba_game_df.merge(
-            team_fix,
-            left_on="homeTeamSlug",
-            right_on="dk_slug",
-            how="left",
+
+def write_team_odds(cursor, game_df, team_odds: dict):
+    """
+    Function to upsert events and wide odds inside an open transaction
+    Args:
+    cursor (cursor): cursor inside an open transaction
+    game_df (df): game_df from fix_team_slugs()
+    team_odds (dict): odds table -> df from create_nba_team_odds_wide_df()
+    """
+    for odds_table, team_odds_df in team_odds.items():
+        if len(team_odds_df) > 0:
+            # Only overwrite odds when the new value is not null,
+            # same as update_dkodds_nba_team
+            bulk_upsert(
+                cursor,
+                odds_table,
+                team_odds_df,
+                DK_NBA_TEAM_ODDS_COLUMNS,
+                ["eventId", "teamType"],
+                keep_on_null=True,
+            )
+            print("Inserted/Updated " + odds_table)
+
+    if len(game_df) > 0:
+        bulk_upsert(
+            cursor,
+            "dk_events",
+            game_df,
+            DK_EVENTS_COLUMNS,
+            ["eventId"],
         )
+        print("Inserted/Updated dk_events")
 
-        # Replace homeTeamSlug with team_slug
-        nba_game_df["homeTeamSlug"].update(nba_game_df["team_slug"])
-
-        if len(nba_game_df) > 0:
-            for index, row in nba_game_df.iterrows():
-                # Query
-                query = "CALL update_dkevents(%s, %s, %s, %s, %s, %s, %s)"
-                # Execute
-                cursor.execute(
-                    query,
-                    (
-                        row["eventId"],
-                        row["startDate"],
-                        row["awayTeamSlug"],
-                        row["homeTeamSlug"],
-                        row["awayTeamName"],
-                        row["homeTeamName"],
-                        row["leagueSlug"],
-                    ),
-                )
 
-            print("Inserted/Updated dk_events")
+def update_nba_team_odds(con, nba_game_df, nba_team_odds_df):
+    """
+    Function to join meta info to nba_team_odds_df + update SQL tables
+    Args:
+    con (connection): connection to SQL database
+    nba_game_df (df): nba_game_df from get_nba_team_game_lines()
+    nba_team_odds_df (df): nba_team_odds_df from parse_nba_team_odds()
+    """
+    try:
+        # Try to join meta info to nba_team_odds_df
+        if len(nba_team_odds_df) > 0:
+            nba_team_odds_df = create_nba_team_odds_wide_df(
+                nba_game_df, nba_team_odds_df
+            )
+
+    except: #pylint: disable=bare-except
+        # No offers today
+        print("No offers today")
+        nba_team_odds_df = pd.DataFrame()
+
+    try:
+        # Try to update nba game df
+        nba_game_df = fix_team_slugs(con, nba_game_df)
 
     except: #pylint: disable=bare-except
         # No games today
         print("No games today")
+        nba_game_df = pd.DataFrame()
+
+    # Stage and merge both tables in one transaction
+    with transaction(con) as cursor:
+        write_team_odds(
+            cursor, nba_game_df, {"dk_nba_team_odds": nba_team_odds_df}
+        )
+
+
+def parse_league_team_odds(league: str, team_game_lines_result):
+    """
+    Function to parse a league's team odds to one row per event/team type
+    Args:
+    league (str): key of DK_LEAGUES, e.g. 'NBA'
+    team_game_lines_result (tuple): result of get_team_game_lines()
+    Returns:
+    game_df (df): dataframe of available games
+    team_odds_df (df): one row per event and team type, empty if no offers
+    """
+    team_game_lines, game_df, offer_length = team_game_lines_result
+
+    # If offer length is 0, then there are no games today
+    if offer_length == 0:
+        record_rows_parsed(0)
+        return game_df, pd.DataFrame()
+
+    try:
+        # Try to reshape odds, events without odds get no rows
+        team_odds_df = create_nba_team_odds_wide_df(
+            game_df,
+            parse_team_odds(
+                team_game_lines, DK_LEAGUES[league]["offer_labels"]
+            ),
+            league,
+        )
+
+    except (KeyError, ValueError) as error:
+        # No offers today, events are still written
+        print("No " + league + " offers today")
+        record_swallowed_error(error)
+        team_odds_df = pd.DataFrame()
+
+    record_rows_parsed(len(team_odds_df))
+    return game_df, team_odds_df
+
+
+def get_league_team_odds(league: str, ttl=DK_ODDS_TTL):
+    """
+    Function to fetch and parse a league's team odds
+    Args:
+    league (str): key of DK_LEAGUES, e.g. 'NBA'
+    ttl (int): seconds a cached response is served, 0 always revalidates
+    Returns:
+    game_df (df): dataframe of available games
+    team_odds_df (df): one row per event and team type, empty if no offers
+    """
+    return parse_league_team_odds(league, get_team_game_lines(league, ttl))
+
+
+def get_all_team_odds(leagues=None, ttl=DK_ODDS_TTL):
+    """
+    Function to fetch and parse team odds for several leagues at once
+    Args:
+    leagues (list): keys of DK_LEAGUES, default all
+    ttl (int): seconds a cached response is served, 0 always revalidates
+    Returns:
+    league_team_odds (dict): league -> result of get_league_team_odds()
+    """
+    leagues = leagues or list(DK_LEAGUES)
+
+    # One request per eventgroup, all in flight on the shared session
+    with ThreadPoolExecutor(max_workers=len(leagues)) as executor:
+        futures = {
+            league: executor.submit(get_league_team_odds, league, ttl)
+            for league in leagues
+        }
+
+    return {league: future.result() for league, future in futures.items()}
+
+
+def update_team_odds(con, league_team_odds: dict):
+    """
+    Function to write each league's events and odds in its own
+    transaction, one batched upsert per table, so rows one league's
+    tables reject don't discard the other leagues
+    Args:
+    con (connection): connection to SQL database
+    league_team_odds (dict): league -> result of get_league_team_odds()
+    Returns:
+    failed_leagues (list): leagues whose write was rolled back
+    """
+    league_team_odds = {
+        league: (game_df, team_odds_df)
+        for league, (game_df, team_odds_df) in league_team_odds.items()
+        if len(game_df) > 0
+    }
+    if not league_team_odds:
+        print("No games today")
+        return []
+
+    failed_leagues = []
+    for league, (game_df, team_odds_df) in league_team_odds.items():
+        # Slugs are looked up before the transaction, the lookup uses
+        # the same connection
+        game_df = fix_team_slugs(con, game_df)
+
+        try:
+            with transaction(con) as cursor:
+                write_team_odds(
+                    cursor,
+                    game_df,
+                    {DK_LEAGUES[league]["odds_table"]: team_odds_df},
+                )
+
+        except DATA_DB_ERRORS as error:
+            # Rows rejected -> this league's write is rolled back, the
+            # rest are still written
+            print("Failed to write " + league + " odds: " + repr(error))
+            record_swallowed_error(error)
+            failed_leagues.append(league)
+
+    return failed_leagues
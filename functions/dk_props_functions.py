@@ -0,0 +1,347 @@
+"""
+Functions to pull player props and alternate lines from DraftKings API
+"""
+# Import packages
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import chain
+from functions.db_functions import (
+    copy_rows_to_stage,
+    transaction,
+    upsert_from_query,
+)
+from functions.dk_api_functions import (
+    DK_LEAGUES,
+    DK_ODDS_TTL,
+    parse_eventgroup,
+)
+from functions.http_functions import get_json_stream
+from functions.metrics_functions import (
+    record_rows_parsed,
+    record_swallowed_error,
+)
+from functions import dk_api_functions
+
+# NBA player prop markets -> (offer category id, offer subcategory id)
+DK_NBA_PROP_MARKETS = {
+    "points": (1215, 12488),
+    "rebounds": (1216, 12492),
+    "assists": (1217, 12495),
+    "threes": (1218, 12497),
+}
+
+# NBA alternate line markets -> (offer category id, offer subcategory
+# id), DraftKings lists them under Game Lines in their own subcategories
+DK_NBA_ALT_LINE_MARKETS = {
+    "Spread": (487, 4606),
+    "Total": (487, 4607),
+}
+
+# Offer labels kept as alternate lines -> market
+DK_ALT_LINE_LABELS = {
+    "Spread": "Spread",
+    "Alternate Spread": "Spread",
+    "Total": "Total",
+    "Alternate Total": "Total",
+}
+
+# Staging column types for dk_nba_player_props
+DK_NBA_PLAYER_PROPS_COLUMNS = {
+    "eventId": "INT",
+    "market": "VARCHAR(30)",
+    "playerName": "VARCHAR(60)",
+    "line": "FLOAT",
+    "oddsOver": "FLOAT",
+    "oddsUnder": "FLOAT",
+}
+
+# Staging column types for dk_nba_alt_lines
+DK_NBA_ALT_LINES_COLUMNS = {
+    "eventId": "INT",
+    "market": "VARCHAR(10)",
+    "side": "VARCHAR(5)",
+    "line": "FLOAT",
+    "oddsAmerican": "FLOAT",
+}
+
+
+# Functions
+def get_subcategory_offers(
+    category_id: int, subcategory_id: int, ttl=DK_ODDS_TTL
+):
+    """
+    Function to get an NBA offer subcategory's offers from DK API
+    Args:
+    category_id (int): offer category id, e.g. 1215
+    subcategory_id (int): offer subcategory id, e.g. 12488
+    ttl (int): seconds a cached response is served, 0 always revalidates
+    Returns:
+    subcategory_offers (list): list of offers per event, empty if none
+    """
+    # Subcategory url, read DK_API_URL at call time so it can be overridden
+    dk_prop_url = (
+        dk_api_functions.DK_API_URL
+        + str(DK_LEAGUES["NBA"]["eventgroup_id"])
+        + "/categories/"
+        + str(category_id)
+        + "/subcategories/"
+        + str(subcategory_id)
+        + "?format=json"
+    )
+
+    try:
+        # Only build the subcategory's offers, events aren't needed
+        _, subcategory_offers = get_json_stream(
+            dk_prop_url,
+            partial(
+                parse_eventgroup,
+                subcategory_ids=[subcategory_id],
+                include_events=False,
+            ),
+            ttl=ttl,
+        )
+
+        subcategory_offers = subcategory_offers[subcategory_id]
+
+    except (RuntimeError, KeyError) as error:
+        # Error retrieving data or market not offered -> return empty
+        record_swallowed_error(error)
+        subcategory_offers = []
+
+    # Offers across every event
+    record_rows_parsed(sum(len(x) for x in subcategory_offers))
+    return subcategory_offers
+
+
+def get_prop_offers(market: str, ttl=DK_ODDS_TTL):
+    """
+    Function to get a player prop subcategory's offers from DK API
+    Args:
+    market (str): key of DK_NBA_PROP_MARKETS, e.g. 'points'
+    ttl (int): seconds a cached response is served, 0 always revalidates
+    Returns:
+    prop_offers (list): list of offers per event, empty if none
+    """
+    return get_subcategory_offers(*DK_NBA_PROP_MARKETS[market], ttl=ttl)
+
+
+def get_alt_line_offers(market: str, ttl=DK_ODDS_TTL):
+    """
+    Function to get an alternate line subcategory's offers from DK API
+    Args:
+    market (str): key of DK_NBA_ALT_LINE_MARKETS, e.g. 'Spread'
+    ttl (int): seconds a cached response is served, 0 always revalidates
+    Returns:
+    alt_line_offers (list): list of offers per event, empty if none
+    """
+    return get_subcategory_offers(*DK_NBA_ALT_LINE_MARKETS[market], ttl=ttl)
+
+
+def get_all_prop_offers(markets=None, ttl=DK_ODDS_TTL):
+    """
+    Function to get several player prop subcategories at once
+    Args:
+    markets (list): keys of DK_NBA_PROP_MARKETS, default all
+    ttl (int): seconds a cached response is served, 0 always revalidates
+    Returns:
+    market_offers (dict): market -> result of get_prop_offers()
+    """
+    markets = markets or list(DK_NBA_PROP_MARKETS)
+
+    # One request per subcategory, all in flight on the shared session
+    with ThreadPoolExecutor(max_workers=len(markets)) as executor:
+        futures = {
+            market: executor.submit(get_prop_offers, market, ttl)
+            for market in markets
+        }
+
+    return {market: future.result() for market, future in futures.items()}
+
+
+def iter_player_prop_rows(market: str, prop_offers: list):
+    """
+    Function to lazily turn prop offers into rows, one per player and line
+    with Over/Under odds side by side
+    Args:
+    market (str): market name stored with each row
+    prop_offers (list): result of get_prop_offers()
+    Returns:
+    rows (generator): rows in DK_NBA_PLAYER_PROPS_COLUMNS order, odds as
+        DraftKings strings cast by the database
+    """
+    for event_offers in prop_offers:
+        for offer in event_offers:
+            # Pair Over/Under outcomes of the offer by player and line
+            lines = {}
+            for outcome in offer.get("outcomes", []):
+                # Skip outcomes without a line, odds or player, e.g. game
+                # level markets listed in a player prop subcategory
+                if (
+                    "line" not in outcome
+                    or "oddsAmerican" not in outcome
+                    or not outcome.get("participant")
+                ):
+                    continue
+                odds = lines.setdefault(
+                    (outcome["participant"], outcome["line"]), [None, None]
+                )
+                if outcome.get("label") == "Over":
+                    odds[0] = outcome["oddsAmerican"]
+                elif outcome.get("label") == "Under":
+                    odds[1] = outcome["oddsAmerican"]
+
+            for (player_name, line), (odds_over, odds_under) in lines.items():
+                yield (
+                    offer["eventId"],
+                    market,
+                    player_name,
+                    line,
+                    odds_over,
+                    odds_under,
+                )
+
+
+def iter_alt_line_rows(line_offers, game_df):
+    """
+    Function to lazily turn every Spread/Total offer of an event into rows,
+    main and alternate lines
+    Args:
+    line_offers (iterable): lists of offers per event, e.g. the Game Lines
+        offers of team_game_lines and results of get_alt_line_offers()
+    game_df (df): game_df from get_team_game_lines()
+    Returns:
+    rows (generator): rows in DK_NBA_ALT_LINES_COLUMNS order
+    """
+    # Home team name per event, to tell Home/Away spreads apart
+    home_team_names = dict(zip(game_df["eventId"], game_df["homeTeamName"]))
+
+    for event_offers in line_offers:
+        for offer in event_offers:
+            market = DK_ALT_LINE_LABELS.get(offer.get("label"))
+            event_id = int(offer.get("eventId", 0))
+            # Skip moneylines and events that already started
+            if market is None or event_id not in home_team_names:
+                continue
+
+            for outcome in offer.get("outcomes", []):
+                if "line" not in outcome or "oddsAmerican" not in outcome:
+                    continue
+                if market == "Total":
+                    side = outcome.get("label")
+                elif outcome.get("label") == home_team_names[event_id]:
+                    side = "Home"
+                else:
+                    side = "Away"
+                yield (
+                    event_id,
+                    market,
+                    side,
+                    outcome["line"],
+                    outcome["oddsAmerican"],
+                )
+
+
+def write_stage_rows( #pylint: disable=too-many-arguments
+    cursor, table, column_types, key_columns, rows, chunk_size=10000
+):
+    """
+    Function to COPY rows into a staging table and merge them in one
+    statement, last staged row wins for duplicate keys
+    Args:
+    cursor (cursor): cursor inside an open transaction
+    table (str): name of table to upsert into
+    column_types (dict): column name -> SQL type, in row order
+    key_columns (list): columns of the table's primary key
+    rows (iterable): rows as sequences
+    chunk_size (int): rows buffered in memory per COPY
+    Returns:
+    row_count (int): number of rows inserted or changed
+    """
+    stage_table = "stage_" + table
+    staged_rows = copy_rows_to_stage(
+        cursor,
+        stage_table,
+        column_types,
+        rows,
+        chunk_size,
+        sequence_column="stagedRow",
+    )
+
+    # One row per key, DISTINCT ON keeps the first row per key, so order
+    # the staged rows last staged first
+    return upsert_from_query(
+        cursor,
+        table,
+        list(column_types),
+        "SELECT DISTINCT ON ("
+        + ", ".join(key_columns)
+        + ") "
+        + ", ".join(column_types)
+        + " FROM "
+        + stage_table
+        + " ORDER BY "
+        + ", ".join(key_columns)
+        + ", stagedRow DESC",
+        key_columns,
+        skip_unchanged=True,
+        staged_rows=staged_rows,
+    )
+
+
+def update_nba_props( #pylint: disable=too-many-arguments
+    con,
+    market_offers: dict,
+    team_game_lines=None,
+    game_df=None,
+    chunk_size=10000,
+    alt_line_offers=None,
+):
+    """
+    Function to write player props and alternate lines in one transaction
+    Args:
+    con (connection): connection to SQL database
+    market_offers (dict): result of get_all_prop_offers()
+    team_game_lines (dict): team_game_lines from get_nba_team_game_lines(),
+        None to skip main and alternate lines
+    game_df (df): game_df from get_nba_team_game_lines()
+    chunk_size (int): rows buffered in memory per COPY
+    alt_line_offers (dict): market -> result of get_alt_line_offers(),
+        None to only write the main lines
+    Returns:
+    row_counts (dict): table -> number of rows inserted or changed
+    """
+    row_counts = {}
+    with transaction(con) as cursor:
+        # Every market streams through one COPY
+        row_counts["dk_nba_player_props"] = write_stage_rows(
+            cursor,
+            "dk_nba_player_props",
+            DK_NBA_PLAYER_PROPS_COLUMNS,
+            ["eventId", "market", "playerName", "line"],
+            chain.from_iterable(
+                iter_player_prop_rows(market, prop_offers)
+                for market, prop_offers in market_offers.items()
+            ),
+            chunk_size,
+        )
+
+        if team_game_lines is not None and len(game_df) > 0:
+            row_counts["dk_nba_alt_lines"] = write_stage_rows(
+                cursor,
+                "dk_nba_alt_lines",
+                DK_NBA_ALT_LINES_COLUMNS,
+                ["eventId", "market", "side", "line"],
+                iter_alt_line_rows(
+                    chain(
+                        team_game_lines["offerSubcategory"]["offers"],
+                        *(alt_line_offers or {}).values(),
+                    ),
+                    game_df,
+                ),
+                chunk_size,
+            )
+
+    for table, row_count in row_counts.items():
+        print("Inserted/Updated " + str(row_count) + " rows in " + table)
+
+    return row_counts
@@ -0,0 +1,67 @@
+"""
+Functions to map DraftKings NBA events to NBA API games
+"""
+# Import packages
+from functions.db_functions import transaction, upsert_from_query
+
+# Columns of dk_nba_event_map, in select order
+DK_NBA_EVENT_MAP_COLUMNS = [
+    "eventId",
+    "gameId",
+    "gameDate",
+    "homeTeamSlug",
+    "awayTeamSlug",
+]
+
+# DK events not mapped yet, plus the latest mapped slate whose start
+# times can still move, matched to the NBA game on the same Eastern date
+# with the same home team. startDate and gameEt are Eastern wall clock
+# time labelled UTC, so their UTC dates are the game date, both sides
+# are served by date expression indexes.
+DK_NBA_EVENT_MAP_QUERY = """
+    SELECT
+        d.eventId,
+        e.gameId,
+        (e.gameEt AT TIME ZONE 'UTC')::date,
+        e.homeTeamSlug,
+        e.awayTeamSlug
+    FROM dk_events d
+    INNER JOIN nba_api_events e
+        ON (e.gameEt AT TIME ZONE 'UTC')::date
+            = (d.startDate AT TIME ZONE 'UTC')::date
+        AND e.homeTeamSlug = d.homeTeamSlug
+    WHERE d.leagueSlug = 'NBA'
+    AND (
+        NOT EXISTS (
+            SELECT 1 FROM dk_nba_event_map m WHERE m.eventId = d.eventId
+        )
+        OR (d.startDate AT TIME ZONE 'UTC')::date >= (
+            SELECT MAX(gameDate) FROM dk_nba_event_map
+        )
+    )
+"""
+
+
+# Functions
+def resolve_nba_event_map(con):
+    """
+    Function to map every unmapped DK NBA event to its NBA API game in
+    one statement
+    Args:
+    con (connection): connection to SQL database
+    Returns:
+    row_count (int): number of mappings inserted or changed
+    """
+    with transaction(con) as cursor:
+        row_count = upsert_from_query(
+            cursor,
+            "dk_nba_event_map",
+            DK_NBA_EVENT_MAP_COLUMNS,
+            DK_NBA_EVENT_MAP_QUERY,
+            ["eventId"],
+            skip_unchanged=True,
+        )
+
+    print("Inserted/Updated " + str(row_count) + " rows in dk_nba_event_map")
+
+    return row_count
@@ -0,0 +1,164 @@
+"""
+Functions to extract query results from the SQL database into
+DataFrames with COPY, faster and leaner than pd.read_sql
+"""
+# Import packages
+from io import BytesIO
+import pyarrow as pa
+from pyarrow import csv
+from functions.db_functions import transaction
+
+# Postgres type OIDs -> Arrow types the COPY output is parsed into,
+# other types are read as strings
+PG_ARROW_TYPES = {
+    16: pa.bool_(),  # boolean
+    20: pa.int64(),  # bigint
+    21: pa.int16(),  # smallint
+    23: pa.int32(),  # integer
+    700: pa.float32(),  # real
+    701: pa.float64(),  # double precision
+    1700: pa.float64(),  # numeric
+    1082: pa.date32(),  # date
+    1114: pa.timestamp("us"),  # timestamp
+    1184: pa.timestamp("us", tz="UTC"),  # timestamp with time zone
+}
+
+# Tables extract_table() can filter on a date range: join needed to get
+# the date, and the date expression. Game logs and odds get their date
+# from their event, timestamps are Eastern wall clock labelled UTC
+EXTRACT_DATES = {
+    "dk_events": ("", "(t.startDate AT TIME ZONE 'UTC')::date"),
+    "dk_nba_team_odds": (
+        "INNER JOIN dk_events e ON e.eventId = t.eventId",
+        "(e.startDate AT TIME ZONE 'UTC')::date",
+    ),
+    "dk_team_odds": (
+        "INNER JOIN dk_events e ON e.eventId = t.eventId",
+        "(e.startDate AT TIME ZONE 'UTC')::date",
+    ),
+    "dk_nba_event_map": ("", "t.gameDate"),
+    "nba_api_events": ("", "(t.gameEt AT TIME ZONE 'UTC')::date"),
+    "nba_api_team_game_logs": (
+        "INNER JOIN nba_api_events e ON e.gameId = t.gameId",
+        "(e.gameEt AT TIME ZONE 'UTC')::date",
+    ),
+    "nba_api_player_game_logs": (
+        "INNER JOIN nba_api_events e ON e.gameId = t.gameId",
+        "(e.gameEt AT TIME ZONE 'UTC')::date",
+    ),
+    "nba_team_odds_outcomes": ("", "t.gameDate"),
+}
+
+
+# Functions
+def extract_query(con, query: str, params=None):
+    """
+    Function to load a query's results with COPY TO STDOUT, parsed
+    straight into typed columns
+    Args:
+    con (connection): connection to SQL database
+    query (str): SELECT query, with %s placeholders for params
+    params (tuple): query parameters
+    Returns:
+    df (df): query results, same column names as pd.read_sql
+    """
+    buffer = BytesIO()
+    with transaction(con) as cursor:
+        # Timestamps with time zone are written in UTC, e.g. +00
+        cursor.execute(
+            "SET LOCAL TimeZone = 'UTC'; SET LOCAL DateStyle = 'ISO'"
+        )
+        query = cursor.mogrify(query, params).decode()
+
+        # Column names and types without running the query
+        cursor.execute("SELECT * FROM (" + query + ") q LIMIT 0")
+        columns = [(x.name, x.type_code) for x in cursor.description]
+
+        cursor.copy_expert(
+            "COPY (" + query + ") TO STDOUT WITH (FORMAT csv)", buffer
+        )
+
+    column_types = {
+        name: PG_ARROW_TYPES.get(type_code, pa.string())
+        for name, type_code in columns
+    }
+
+    # No rows, the CSV reader needs at least one line
+    if buffer.tell() == 0:
+        return pa.schema(column_types.items()).empty_table().to_pandas()
+
+    buffer.seek(0)
+    # Unquoted empty fields are NULL, quoted ones are empty strings
+    table = csv.read_csv(
+        buffer,
+        read_options=csv.ReadOptions(column_names=list(column_types)),
+        convert_options=csv.ConvertOptions(
+            column_types=column_types,
+            true_values=["t"],
+            false_values=["f"],
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+    buffer.close()
+
+    # Free each Arrow column once converted, so peak memory stays near
+    # the size of the DataFrame
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def extract_table( #pylint: disable=too-many-arguments
+    con,
+    table: str,
+    columns=None,
+    date_from=None,
+    date_to=None,
+    where: str = None,
+):
+    """
+    Function to load a table, selecting only the columns and dates
+    needed in the database
+    Args:
+    con (connection): connection to SQL database
+    table (str): table to load
+    columns (list): camelCase columns to load, default every column
+        with the database's lowercase names like SELECT *
+    date_from (date): first date, needs the table in EXTRACT_DATES
+    date_to (date): last date, inclusive, needs the table in
+        EXTRACT_DATES
+    where (str): extra SQL condition on the table, aliased t
+    Returns:
+    df (df): table rows
+    """
+    # Columns aliased to keep their case, t.* is lowercase
+    select = (
+        ", ".join(["t." + x + ' AS "' + x + '"' for x in columns])
+        if columns
+        else "t.*"
+    )
+
+    conditions = []
+    params = []
+    join = ""
+    if date_from is not None or date_to is not None:
+        join, date_expression = EXTRACT_DATES[table]
+        if date_from is not None:
+            conditions.append(date_expression + " >= %s")
+            params.append(date_from)
+        if date_to is not None:
+            conditions.append(date_expression + " <= %s")
+            params.append(date_to)
+    if where:
+        conditions.append("(" + where + ")")
+
+    return extract_query(
+        con,
+        "SELECT "
+        + select
+        + " FROM "
+        + table
+        + " t "
+        + join
+        + (" WHERE " + " AND ".join(conditions) if conditions else ""),
+        tuple(params) or None,
+    )
@@ -0,0 +1,566 @@
+"""
+Functions shared by the DraftKings and NBA API HTTP requests
+"""
+# Import packages
+import json
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from functions.cache_functions import ResponseCache, is_fresh
+from functions.metrics_functions import record_http_request, record_retry
+
+# Session shared by all requests, keeps connections alive between calls
+SESSION = requests.Session()
+
+# Response cache used by get_json(), set by configure_response_cache()
+RESPONSE_CACHE = None
+
+# Statuses retried by RetryingClient, the host is throttling or briefly
+# down
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Request errors retried by RetryingClient
+RETRY_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+
+# Classes
+class RateLimiter: #pylint: disable=too-few-public-methods
+    """
+    Thread-safe token bucket, allows `rate` requests per second with
+    bursts of up to `burst` requests
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Args:
+        rate (float): tokens added per second
+        burst (int): max tokens held
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Function to block until a request is allowed
+        """
+        while True:
+            with self.lock:
+                # Refill bucket for time elapsed
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+
+                # Take a token if one is available
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                # Otherwise wait until the next token is due
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class AdaptiveRateLimiter(RateLimiter): #pylint: disable=too-many-instance-attributes
+    """
+    Token bucket whose rate adapts to the host: doubled every second of
+    successful requests until the host first throttles, then raised by
+    `increase` requests per second every second, cut by `decrease` each
+    time the host throttles, between min_rate and max_rate
+    """
+
+    def __init__( #pylint: disable=too-many-arguments
+        self,
+        rate: float,
+        burst: int = 1,
+        min_rate: float = None,
+        max_rate: float = None,
+        increase: float = 0.5,
+        decrease: float = 0.75,
+    ):
+        """
+        Args:
+        rate (float): starting tokens added per second
+        burst (int): max tokens held
+        min_rate (float): lowest rate, default rate / 10
+        max_rate (float): highest rate, default rate (never raised)
+        increase (float): requests per second added per second of
+            successful requests
+        decrease (float): factor the rate is multiplied by when throttled
+        """
+        super().__init__(rate, burst)
+        self.min_rate = min_rate or rate / 10
+        self.max_rate = max_rate or rate
+        self.increase = increase
+        self.decrease = decrease
+        self.last_decrease = 0.0
+        self.slow_start = True
+
+    def set_rate(self, rate: float):
+        """
+        Function to change the rate, tokens earned so far are kept
+        Args:
+        rate (float): new tokens added per second
+        """
+        with self.lock:
+            # Refill at the old rate up to now
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.rate = min(self.max_rate, max(self.min_rate, rate))
+
+    def succeeded(self):
+        """
+        Function to probe a higher rate after a successful request. Each
+        request adds 1 while no request was throttled, so the rate
+        doubles every second, then increase / rate, so the rate climbs
+        by about `increase` per second.
+        """
+        if self.slow_start:
+            self.set_rate(self.rate + 1)
+        else:
+            self.set_rate(self.rate + self.increase / self.rate)
+
+    def throttled(self):
+        """
+        Function to cut the rate after the host throttled a request.
+        Requests in flight together are throttled together, so the rate
+        is cut at most once per second, and the burst is dropped.
+        """
+        now = time.monotonic()
+        if now - self.last_decrease < 1:
+            return
+        self.last_decrease = now
+        self.slow_start = False
+        self.set_rate(self.rate * self.decrease)
+        with self.lock:
+            self.tokens = min(self.tokens, 0.0)
+
+
+class CircuitOpenError(requests.RequestException):
+    """
+    Raised instead of sending a request while a host's circuit is open
+    """
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker, opens after failure_threshold failures
+    in a row and then lets one trial request through every reset_seconds
+    until one succeeds
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds=60.0):
+        """
+        Args:
+        failure_threshold (int): failures in a row that open the circuit
+        reset_seconds (float): seconds before a trial request is allowed
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def check(self, url: str):
+        """
+        Function to raise unless a request may be sent
+        Args:
+        url (str): url about to be requested, for the error message
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return
+
+            # Half open, let one trial request through and wait for it
+            now = time.monotonic()
+            if now - self.opened_at >= self.reset_seconds:
+                self.opened_at = now
+                return
+
+        raise CircuitOpenError(
+            "Circuit open after "
+            + str(self.failures)
+            + " failures in a row, not requesting "
+            + url
+        )
+
+    def succeeded(self):
+        """
+        Function to close the circuit after a successful request
+        """
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failed(self):
+        """
+        Function to count a failed request, opening the circuit once
+        failure_threshold are in a row
+        """
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class RetryingClient: #pylint: disable=too-many-instance-attributes
+    """
+    HTTP client for a throttling API: keep-alive connections, adaptive
+    rate limit, connect/read timeouts, retries with exponential backoff
+    and full jitter on RETRY_STATUSES and RETRY_ERRORS, and a circuit
+    breaker. Has the same get() as a Session, so it can be passed as the
+    session of get_json() and get_json_stream().
+    """
+
+    def __init__( #pylint: disable=too-many-arguments
+        self,
+        rate: float = 1.0,
+        burst: int = 1,
+        max_rate: float = None,
+        retries: int = 4,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        connect_timeout: float = 5.0,
+        failure_threshold: int = 8,
+        reset_seconds: float = 60.0,
+        pool_maxsize: int = 8,
+    ):
+        """
+        Args:
+        rate (float): starting requests per second
+        burst (int): max requests sent at once
+        max_rate (float): highest requests per second probed, default
+            rate
+        retries (int): max retries per request
+        backoff (float): max seconds before the first retry, doubled on
+            each retry
+        max_backoff (float): cap on seconds between retries
+        connect_timeout (float): seconds to wait for a connection, the
+            read timeout is the timeout passed to get()
+        failure_threshold (int): failed attempts in a row that open the
+            circuit
+        reset_seconds (float): seconds the circuit stays open
+        pool_maxsize (int): keep-alive connections kept, one per worker
+        """
+        # Keep-alive session, pool sized so concurrent workers each keep
+        # their connection
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.rate_limiter = AdaptiveRateLimiter(
+            rate, burst, max_rate=max_rate or rate
+        )
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold, reset_seconds
+        )
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.connect_timeout = connect_timeout
+
+    def get_retry_wait(self, attempt: int, response=None):
+        """
+        Function to get seconds to wait before a retry, a random wait up
+        to the exponential backoff so throttled workers don't retry in
+        step, and at least the host's Retry-After
+        Args:
+        attempt (int): attempts made so far, minus one
+        response (Response): throttled response, None after an error
+        Returns:
+        wait (float): seconds to wait
+        """
+        wait = random.uniform(
+            0, min(self.max_backoff, self.backoff * 2**attempt)
+        )
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                wait = max(wait, min(self.max_backoff, int(retry_after)))
+
+        return wait
+
+    def get(self, url: str, headers=None, timeout=60, stream=False):
+        """
+        Function to send a GET request, retrying throttled and failed
+        attempts
+        Args:
+        url (str): url to request
+        headers (dict): request headers
+        timeout (float): read timeout in seconds
+        stream (bool): don't read the body before returning
+        Returns:
+        request (Response): first response that isn't retried, or the
+            last response once retries are used up
+        """
+        for attempt in range(self.retries + 1):
+            self.circuit_breaker.check(url)
+            self.rate_limiter.acquire()
+            start_time = time.perf_counter()
+            try:
+                request = self.session.get(
+                    url,
+                    headers=headers,
+                    timeout=(min(self.connect_timeout, timeout), timeout),
+                    stream=stream,
+                )
+            except RETRY_ERRORS as error:
+                # stats.nba.com throttles by leaving requests hanging
+                self.circuit_breaker.failed()
+                if isinstance(error, requests.Timeout):
+                    self.rate_limiter.throttled()
+                record_http_request(
+                    url,
+                    type(error).__name__,
+                    seconds=time.perf_counter() - start_time,
+                )
+                if attempt == self.retries:
+                    raise
+                record_retry("http")
+                time.sleep(self.get_retry_wait(attempt))
+                continue
+
+            # Success, or an error retrying won't fix, e.g. 404
+            if request.status_code not in RETRY_STATUSES:
+                self.circuit_breaker.succeeded()
+                self.rate_limiter.succeeded()
+                return request
+
+            # Throttled or host error, slow down then retry
+            self.circuit_breaker.failed()
+            if request.status_code == 429:
+                self.rate_limiter.throttled()
+            if attempt == self.retries:
+                return request
+            request.close()
+            record_response(url, request, start_time)
+            record_retry("http")
+            time.sleep(self.get_retry_wait(attempt, request))
+
+        return None
+
+
+class TeeReader: #pylint: disable=too-few-public-methods
+    """
+    Binary file-like object that copies everything read from a stream to
+    another file, e.g. a response body to the response cache as it's
+    parsed
+    """
+
+    def __init__(self, stream, sink):
+        """
+        Args:
+        stream (file): binary stream to read from, e.g. Response.raw
+        sink (file): binary file each chunk read is written to
+        """
+        self.stream = stream
+        self.sink = sink
+
+    def read(self, size=-1):
+        """
+        Function to read from the stream, copying the chunk to the sink
+        Args:
+        size (int): max bytes to read, -1 reads to the end
+        Returns:
+        chunk (bytes): bytes read
+        """
+        chunk = self.stream.read(size)
+        self.sink.write(chunk)
+
+        return chunk
+
+    def drain(self, chunk_size: int = 65536):
+        """
+        Function to read and copy whatever is left of the stream
+        Args:
+        chunk_size (int): bytes read at a time
+        """
+        while self.read(chunk_size):
+            pass
+
+
+# Functions
+def record_response(url: str, request, start_time: float):
+    """
+    Function to record a response's status, bytes received and latency
+    Args:
+    url (str): requested url
+    request (Response): response, with its body read
+    start_time (float): perf_counter() before the request was sent
+    """
+    record_http_request(
+        url,
+        request.status_code,
+        request.raw.tell(),
+        time.perf_counter() - start_time,
+    )
+
+
+def configure_response_cache(
+    cache_dir: str, max_bytes: int = 500_000_000, offline=False
+):
+    """
+    Function to enable the on-disk response cache for get_json()
+    Args:
+    cache_dir (str): directory to store responses in
+    max_bytes (int): max total size of cached files
+    offline (bool): only serve from cache, never hit the network
+    Returns:
+    cache (ResponseCache): cache now used by get_json()
+    """
+    global RESPONSE_CACHE #pylint: disable=global-statement
+    RESPONSE_CACHE = ResponseCache(cache_dir, max_bytes, offline)
+
+    return RESPONSE_CACHE
+
+
+def get_json( #pylint: disable=too-many-arguments
+    url: str, headers=None, ttl=0, timeout=60, session=None
+):
+    """
+    Function to get a JSON response, through the response cache if one
+    is configured
+    Args:
+    url (str): url to request
+    headers (dict): request headers
+    ttl (float): seconds a cached response is served without a request,
+        None never expires, 0 always revalidates
+    timeout (int): request timeout in seconds
+    session (Session): session to send the request on, default shared
+    Returns:
+    resp (dict): JSON response
+    """
+    session = session or SESSION
+    cache = RESPONSE_CACHE
+
+    # No cache -> plain request
+    if cache is None:
+        start_time = time.perf_counter()
+        request = session.get(url, headers=headers, timeout=timeout)
+        record_response(url, request, start_time)
+        request.raise_for_status()
+        return request.json()
+
+    # Serve fresh (or any, when offline) cached response
+    entry = cache.get(url)
+    if entry is not None and (cache.offline or is_fresh(entry, ttl)):
+        record_http_request(url, "cached")
+        return json.loads(entry["body"])
+    if cache.offline:
+        raise LookupError("Offline and not cached: " + url)
+
+    # Revalidate stale response if the server offered validators
+    request_headers = dict(headers or {})
+    if entry is not None and entry["etag"]:
+        request_headers["If-None-Match"] = entry["etag"]
+    if entry is not None and entry["last_modified"]:
+        request_headers["If-Modified-Since"] = entry["last_modified"]
+
+    start_time = time.perf_counter()
+    request = session.get(url, headers=request_headers, timeout=timeout)
+    record_response(url, request, start_time)
+
+    # Not modified -> cached body is fresh again
+    if request.status_code == 304 and entry is not None:
+        cache.touch(url, entry)
+        return json.loads(entry["body"])
+
+    request.raise_for_status()
+    cache.put(url, request.content, request.headers)
+
+    return request.json()
+
+
+def get_json_stream( #pylint: disable=too-many-arguments
+    url: str, parse, headers=None, ttl=0, timeout=60, session=None
+):
+    """
+    Function to parse a JSON response incrementally instead of loading it
+    whole, through the response cache if one is configured
+    Args:
+    url (str): url to request
+    parse (function): binary file-like object -> parsed result, e.g. an
+        ijson based parser that keeps only what it needs
+    headers (dict): request headers
+    ttl (float): seconds a cached response is served without a request,
+        None never expires, 0 always revalidates
+    timeout (int): request timeout in seconds
+    session (Session): session to send the request on, default shared
+    Returns:
+    result: result of parse()
+    """
+    session = session or SESSION
+    cache = RESPONSE_CACHE
+
+    # No cache -> parse the body as it arrives, never holding all of it
+    if cache is None:
+        start_time = time.perf_counter()
+        with session.get(
+            url, headers=headers, timeout=timeout, stream=True
+        ) as request:
+            try:
+                request.raise_for_status()
+                request.raw.decode_content = True
+                return parse(request.raw)
+            finally:
+                # Recorded once the body is read, so latency includes it
+                record_response(url, request, start_time)
+
+    # Cached bodies are parsed straight from the compressed file, never
+    # holding all of it
+    entry, cache_file = cache.open(url)
+    if entry is not None and (cache.offline or is_fresh(entry, ttl)):
+        record_http_request(url, "cached")
+        with cache_file:
+            return parse(cache_file)
+    if cache_file is not None:
+        cache_file.close()
+    if cache.offline:
+        raise LookupError("Offline and not cached: " + url)
+
+    # Revalidate stale response if the server offered validators
+    request_headers = dict(headers or {})
+    if entry is not None and entry["etag"]:
+        request_headers["If-None-Match"] = entry["etag"]
+    if entry is not None and entry["last_modified"]:
+        request_headers["If-Modified-Since"] = entry["last_modified"]
+
+    start_time = time.perf_counter()
+    with session.get(
+        url, headers=request_headers, timeout=timeout, stream=True
+    ) as request:
+        try:
+            # Not modified -> cached body is fresh again, parsed below
+            if request.status_code == 304 and entry is not None:
+                cache.touch(url, entry)
+            else:
+                # Parse the body as it arrives while compressing it into
+                # the cache, which keeps the old response until it's done
+                request.raise_for_status()
+                request.raw.decode_content = True
+                with cache.open_writer(url, request.headers) as cache_file:
+                    body = TeeReader(request.raw, cache_file)
+                    result = parse(body)
+
+                    # Cache the rest of the body if parse() stopped early
+                    body.drain()
+
+                return result
+        finally:
+            # Recorded once the body is read, so latency includes it
+            record_response(url, request, start_time)
+
+    entry, cache_file = cache.open(url)
+    with cache_file:
+        return parse(cache_file)
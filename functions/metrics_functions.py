@@ -0,0 +1,374 @@
+"""
+Functions to instrument ingest stages and export Prometheus metrics and
+a JSON run summary
+"""
+# Import packages
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    push_to_gateway,
+    start_http_server,
+    write_to_textfile,
+)
+
+# Registry of ingest metrics, kept apart from the default process
+# collectors so exported files only hold ingest series
+METRICS_REGISTRY = CollectorRegistry()
+
+# Stage latency, alert when e.g. the p90 of a fetch degrades
+STAGE_SECONDS = Histogram(
+    "ingest_stage_seconds",
+    "Wall clock of an ingest stage",
+    ["stage", "status"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+    registry=METRICS_REGISTRY,
+)
+STAGE_LAST_SUCCESS = Gauge(
+    "ingest_stage_last_success_timestamp_seconds",
+    "Unix time an ingest stage last completed",
+    ["stage"],
+    registry=METRICS_REGISTRY,
+)
+
+# HTTP requests, status is the HTTP status code or 'cached' for
+# responses served from the response cache without a request
+HTTP_REQUESTS = Counter(
+    "ingest_http_requests_total",
+    "HTTP requests sent or served from cache",
+    ["stage", "host", "status"],
+    registry=METRICS_REGISTRY,
+)
+HTTP_RESPONSE_BYTES = Counter(
+    "ingest_http_response_bytes_total",
+    "Response bytes received over the network",
+    ["stage", "host"],
+    registry=METRICS_REGISTRY,
+)
+HTTP_SECONDS = Histogram(
+    "ingest_http_request_seconds",
+    "Latency of an HTTP request, including reading the body",
+    ["host"],
+    registry=METRICS_REGISTRY,
+)
+
+# Retries, kind is 'http' or 'db'
+RETRIES = Counter(
+    "ingest_retries_total",
+    "Retried requests and database stages",
+    ["stage", "kind"],
+    registry=METRICS_REGISTRY,
+)
+
+# Rows through each stage, staged rows are either written (inserted or
+# changed) or skipped (unchanged or duplicate keys)
+ROWS_PARSED = Counter(
+    "ingest_rows_parsed_total",
+    "Rows parsed from API responses",
+    ["stage"],
+    registry=METRICS_REGISTRY,
+)
+ROWS_WRITTEN = Counter(
+    "ingest_rows_written_total",
+    "Rows inserted or changed",
+    ["table"],
+    registry=METRICS_REGISTRY,
+)
+ROWS_SKIPPED = Counter(
+    "ingest_rows_skipped_total",
+    "Staged rows left unchanged",
+    ["table"],
+    registry=METRICS_REGISTRY,
+)
+
+# Errors handled by returning empty results, e.g. 'No offers today'
+SWALLOWED_ERRORS = Counter(
+    "ingest_swallowed_errors_total",
+    "Errors handled by returning empty results",
+    ["stage", "error"],
+    registry=METRICS_REGISTRY,
+)
+
+# Last run, alert when rows parsed/staged drop to zero or runs stop
+LAST_RUN_ROWS = Gauge(
+    "ingest_last_run_rows",
+    "Rows parsed, staged, written or skipped by a stage in the last run",
+    ["stage", "kind"],
+    registry=METRICS_REGISTRY,
+)
+LAST_RUN_SECONDS = Gauge(
+    "ingest_last_run_seconds",
+    "Wall clock of the last run",
+    registry=METRICS_REGISTRY,
+)
+LAST_RUN_FAILED_STAGES = Gauge(
+    "ingest_last_run_failed_stages",
+    "Stages that failed or were skipped in the last run",
+    registry=METRICS_REGISTRY,
+)
+LAST_RUN_TIMESTAMP = Gauge(
+    "ingest_last_run_timestamp_seconds",
+    "Unix time the last run finished",
+    registry=METRICS_REGISTRY,
+)
+
+# Stage recorded against, per thread, set by stage_context()
+STAGE_CONTEXT = threading.local()
+
+# Totals of the current run per stage and table, reset by start_run()
+RUN_TOTALS = {"started": None, "stages": {}, "tables": {}}
+RUN_LOCK = threading.Lock()
+
+# (stage, kind) of every ingest_last_run_rows series set so far
+REPORTED_ROW_GAUGES = set()
+
+
+# Functions
+def get_stage():
+    """
+    Function to get the stage the current thread is running
+    Returns:
+    stage (str): stage name, 'none' outside of stage_context()
+    """
+    return getattr(STAGE_CONTEXT, "stage", None) or "none"
+
+
+@contextmanager
+def stage_context(stage: str):
+    """
+    Function to attribute everything recorded by the current thread in a
+    block to a stage
+    Args:
+    stage (str): stage name, e.g. 'dk_fetch_nba'
+    """
+    previous = getattr(STAGE_CONTEXT, "stage", None)
+    STAGE_CONTEXT.stage = stage
+    try:
+        yield
+    finally:
+        STAGE_CONTEXT.stage = previous
+
+
+def add_to_run(group: str, name: str, **amounts):
+    """
+    Function to add amounts to a stage's or table's run totals
+    Args:
+    group (str): one of 'stages', 'tables'
+    name (str): stage or table name
+    **amounts: total name -> amount to add
+    """
+    with RUN_LOCK:
+        totals = RUN_TOTALS[group].setdefault(name, {})
+        for key, amount in amounts.items():
+            totals[key] = totals.get(key, 0) + amount
+
+
+def record_http_request(
+    url: str, status, response_bytes: int = 0, seconds: float = 0.0
+):
+    """
+    Function to record an HTTP request
+    Args:
+    url (str): requested url
+    status (int or str): HTTP status code, 'cached' if served from cache
+    response_bytes (int): bytes received over the network
+    seconds (float): latency of the request
+    """
+    stage = get_stage()
+    host = urlsplit(url).hostname or "none"
+    HTTP_REQUESTS.labels(stage, host, str(status)).inc()
+    HTTP_RESPONSE_BYTES.labels(stage, host).inc(response_bytes)
+    if status != "cached":
+        HTTP_SECONDS.labels(host).observe(seconds)
+
+    add_to_run(
+        "stages",
+        stage,
+        http_requests=1,
+        response_bytes=response_bytes,
+        http_seconds=seconds,
+        **{"http_" + str(status): 1},
+    )
+
+
+def record_retry(kind: str):
+    """
+    Function to record a retry
+    Args:
+    kind (str): one of 'http', 'db'
+    """
+    stage = get_stage()
+    RETRIES.labels(stage, kind).inc()
+    add_to_run("stages", stage, **{kind + "_retries": 1})
+
+
+def record_rows_parsed(rows: int):
+    """
+    Function to record rows parsed from an API response, zero rows are
+    recorded too so empty responses show up
+    Args:
+    rows (int): rows parsed
+    """
+    stage = get_stage()
+    ROWS_PARSED.labels(stage).inc(rows)
+    add_to_run("stages", stage, rows_parsed=rows)
+
+
+def record_rows_written(table: str, written: int, staged: int = None):
+    """
+    Function to record rows merged into a table
+    Args:
+    table (str): table written to
+    written (int): rows inserted or changed
+    staged (int): rows staged for the merge, None if unknown
+    """
+    stage = get_stage()
+    ROWS_WRITTEN.labels(table).inc(written)
+    amounts = {"rows_written": written}
+    if staged is not None:
+        ROWS_SKIPPED.labels(table).inc(max(staged - written, 0))
+        amounts["rows_staged"] = staged
+        amounts["rows_skipped"] = max(staged - written, 0)
+
+    add_to_run("stages", stage, **amounts)
+    add_to_run("tables", table, **amounts)
+
+
+def record_swallowed_error(error: Exception):
+    """
+    Function to record an error handled by returning an empty result
+    Args:
+    error (Exception): error caught
+    """
+    stage = get_stage()
+    SWALLOWED_ERRORS.labels(stage, type(error).__name__).inc()
+    add_to_run(
+        "stages",
+        stage,
+        swallowed_errors=1,
+        **{"error_" + type(error).__name__: 1},
+    )
+
+
+def record_stage(stage: str, status: str, seconds: float = None):
+    """
+    Function to record the outcome of a stage
+    Args:
+    stage (str): stage name
+    status (str): one of 'done', 'failed', 'skipped'
+    seconds (float): wall clock of the stage, None if it never ran
+    """
+    if seconds is not None:
+        STAGE_SECONDS.labels(stage, status).observe(seconds)
+    if status == "done":
+        STAGE_LAST_SUCCESS.labels(stage).set_to_current_time()
+
+    with RUN_LOCK:
+        totals = RUN_TOTALS["stages"].setdefault(stage, {})
+        totals["status"] = status
+        totals["seconds"] = seconds
+
+
+def start_run():
+    """
+    Function to reset the run totals before a run
+    """
+    with RUN_LOCK:
+        RUN_TOTALS["started"] = time.time()
+        RUN_TOTALS["stages"] = {}
+        RUN_TOTALS["tables"] = {}
+
+
+def finish_run(summary_file: str = None):
+    """
+    Function to set the last run gauges and build the run summary
+    Args:
+    summary_file (str): path to write the summary to as JSON, optional
+    Returns:
+    summary (dict): run status, seconds, and totals per stage and table
+    """
+    finished = time.time()
+    with RUN_LOCK:
+        started = RUN_TOTALS["started"] or finished
+        stages = json.loads(json.dumps(RUN_TOTALS["stages"]))
+        tables = json.loads(json.dumps(RUN_TOTALS["tables"]))
+
+    # Millisecond precision is plenty for the summary
+    for totals in stages.values():
+        for key in ("seconds", "http_seconds"):
+            if totals.get(key) is not None:
+                totals[key] = round(totals[key], 3)
+
+    failed_stages = [
+        stage
+        for stage, totals in stages.items()
+        if totals.get("status") in ("failed", "skipped")
+    ]
+
+    # Row counts a stage reported in an earlier run but not this one
+    # (e.g. its fetch failed) are set to zero rather than left stale, so
+    # alerts on a drop to zero fire
+    row_gauges = {
+        (stage, kind): totals["rows_" + kind]
+        for stage, totals in stages.items()
+        for kind in ("parsed", "staged", "written", "skipped")
+        if "rows_" + kind in totals
+    }
+    for stage, kind in REPORTED_ROW_GAUGES - set(row_gauges):
+        LAST_RUN_ROWS.labels(stage, kind).set(0)
+    for (stage, kind), rows in row_gauges.items():
+        LAST_RUN_ROWS.labels(stage, kind).set(rows)
+    REPORTED_ROW_GAUGES.update(row_gauges)
+    LAST_RUN_SECONDS.set(finished - started)
+    LAST_RUN_FAILED_STAGES.set(len(failed_stages))
+    LAST_RUN_TIMESTAMP.set(finished)
+
+    summary = {
+        "started": datetime.fromtimestamp(started, timezone.utc).isoformat(),
+        "seconds": round(finished - started, 3),
+        "status": "failed" if failed_stages else "ok",
+        "failed_stages": failed_stages,
+        "stages": stages,
+        "tables": tables,
+    }
+
+    if summary_file:
+        os.makedirs(os.path.dirname(summary_file) or ".", exist_ok=True)
+        with open(summary_file, "w", encoding="utf-8") as summary_output:
+            json.dump(summary, summary_output, indent=2)
+
+    return summary
+
+
+def export_metrics(textfile: str = None, pushgateway: str = None):
+    """
+    Function to export the metrics of a finished batch run
+    Args:
+    textfile (str): path to write in the text format, e.g. for the
+        node_exporter textfile collector, optional
+    pushgateway (str): Pushgateway address to push to, optional
+    """
+    if textfile:
+        write_to_textfile(textfile, METRICS_REGISTRY)
+    if pushgateway:
+        push_to_gateway(
+            pushgateway, job="odds_ingest", registry=METRICS_REGISTRY
+        )
+
+
+def start_metrics_server(port: int):
+    """
+    Function to serve the metrics for scraping, for long running
+    processes like the odds poller
+    Args:
+    port (int): port to serve /metrics on
+    """
+    start_http_server(port, registry=METRICS_REGISTRY)
@@ -1,11 +1,115 @@
+#pylint: disable=too-many-lines
 """
 NBA API Functions
 """
 # Load libraries
-from datetime import date
+import time
+from datetime import date, timedelta
 from re import sub
 import pandas as pd
-import requests
+from functions.db_functions import (
+    bulk_upsert,
+    copy_rows_to_stage,
+    transaction,
+    upsert_from_query,
+)
+from functions.http_functions import RetryingClient, get_json
+from functions.metrics_functions import (
+    record_rows_parsed,
+    record_swallowed_error,
+)
+
+# NBA API base url, override to point at a local replay server
+NBA_API_URL = "https://stats.nba.com/stats/"
+
+# Client shared by every NBA API request, stats.nba.com throttles hard so
+# start at 1 request/s and probe up to 4, backing off when throttled
+NBA_API_CLIENT = RetryingClient(rate=1.0, burst=4, max_rate=4.0)
+
+# Seconds a cached response about today's games is served before
+# refetching, responses about completed days never expire
+NBA_API_LIVE_TTL = 600
+
+# Headers for NBA API requests
+NBA_HEADER_DATA = {
+    "Connection": "keep-alive",
+    "Accept": "application/json, text/plain, */*",
+    "x-nba-stats-token": "true",
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_6) \
+        AppleWebKit/537.36 (KHTML, like Gecko) Chrome/79.0.3945.130 \
+            Safari/537.36",
+    "x-nba-stats-origin": "stats",
+    "Sec-Fetch-Site": "same-origin",
+    "Sec-Fetch-Mode": "cors",
+    "Referer": "https://stats.nba.com/",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+# Staging column types, matching update_nbaapi_events parameters
+NBA_API_EVENTS_COLUMNS = {
+    "gameId": "VARCHAR(25)",
+    "gameEt": "TIMESTAMP WITH TIME ZONE",
+    "awayTeamId": "INT",
+    "awayTeamSlug": "VARCHAR(3)",
+    "awayTeamName": "VARCHAR(30)",
+    "homeTeamId": "INT",
+    "homeTeamSlug": "VARCHAR(3)",
+    "homeTeamName": "VARCHAR(30)",
+}
+
+# Staging column types, matching update_nbaapi_team_game_logs parameters
+NBA_API_TEAM_GAME_LOGS_COLUMNS = {
+    "gameId": "VARCHAR(25)",
+    "teamId": "INT",
+    "wl": "VARCHAR(1)",
+    "pts": "INT",
+    "fgm": "INT",
+    "fga": "INT",
+    "fg3M": "INT",
+    "fg3A": "INT",
+    "ftm": "INT",
+    "fta": "INT",
+    "oreb": "INT",
+    "dreb": "INT",
+    "reb": "INT",
+    "ast": "INT",
+    "tov": "FLOAT",
+    "stl": "INT",
+    "blk": "INT",
+    "blka": "INT",
+    "pf": "INT",
+    "pfd": "INT",
+    "poss": "INT",
+    "min": "INT",
+}
+
+# Staging column types, matching update_nbaapi_player_game_logs parameters
+NBA_API_PLAYER_GAME_LOGS_COLUMNS = {
+    "gameId": "VARCHAR(25)",
+    "playerId": "INT",
+    "teamId": "INT",
+    "wl": "VARCHAR(1)",
+    "min": "DOUBLE PRECISION",
+    "pts": "INT",
+    "fgm": "INT",
+    "fga": "INT",
+    "fg3M": "INT",
+    "fg3A": "INT",
+    "ftm": "INT",
+    "fta": "INT",
+    "oreb": "INT",
+    "dreb": "INT",
+    "reb": "INT",
+    "ast": "INT",
+    "tov": "INT",
+    "stl": "INT",
+    "blk": "INT",
+    "blka": "INT",
+    "pf": "INT",
+    "pfd": "INT",
+    "poss": "INT",
+}
 
 # Functions
 def convert_camel_case(string: str):
@@ -23,6 +127,83 @@ def convert_camel_case(string: str):
     return "".join([clean_name[0].lower(), clean_name[1:]])
 
 
+def get_nba_season(day):
+    """
+    Function to derive the NBA API season string for a date
+    Args:
+    day (date): date within the season
+    Returns:
+    season (str): season string, format 'YYYY-YY'
+    """
+    # Seasons start in the fall
+    if day.month > 8:
+        return str(day.year) + "-" + str(day.year + 1)[2:4]
+
+    return str(day.year - 1) + "-" + str(day.year)[2:4]
+
+
+def get_nba_api_ttl(day):
+    """
+    Function to get the cache TTL for responses about a given day
+    Args:
+    day (date): last game date covered by the response
+    Returns:
+    ttl (int): seconds to cache, None for completed days
+    """
+    # Games before yesterday are final and their stats won't change
+    if day < date.today() - timedelta(days=1):
+        return None
+
+    return NBA_API_LIVE_TTL
+
+
+def build_nba_game_log_url(
+    entity: str, date_from, date_to, measure_type: str = ""
+):
+    """
+    Function to build a game log url for the NBA API
+    Args:
+    entity (str): one of 'player', 'team'
+    date_from (date): date from, season is derived from this date
+    date_to (date): date to
+    measure_type (str): MeasureType param, '' for Base or 'Advanced'
+    Returns:
+    nba_game_log_url (str): url for given params
+    """
+    # encode dates with %2F
+    date_from_url = (
+        str(date_from.month)
+        + "%2F"
+        + str(date_from.day)
+        + "%2F"
+        + str(date_from.year)
+    )
+    date_to_url = (
+        str(date_to.month)
+        + "%2F"
+        + str(date_to.day)
+        + "%2F"
+        + str(date_to.year)
+    )
+
+    # Construct url without f string
+    return (
+        NBA_API_URL
+        + entity
+        + "gamelogs?DateFrom="
+        + date_from_url
+        + "&DateTo="
+        + date_to_url
+        + "&GameSegment=&LastNGames=0&LeagueID=00&Location=&MeasureType="
+        + measure_type
+        + "&Month=0&OpponentTeamID=0&Outcome=&PORound=0&"
+        + "PaceAdjust=N&PerMode=Totals&Period=0&PlusMinus=N&Rank=N&Season="
+        + get_nba_season(date_from)
+        + "&SeasonSegment=&SeasonType=&ShotClockRange=&TeamID=0&"
+        + "VsConference=&VsDivision="
+    )
+
+
 def get_nba_games(nba_header_data: dict, day=date.today()):
     """
     Function to scrape NBA API for specified date
@@ -34,19 +215,21 @@ def get_nba_games(nba_header_data: dict, day=date.today()):
     """
     # Paste into url
     nba_schedule_url = (
-        "https://stats.nba.com/stats/scoreboardv3?GameDate="
+        NBA_API_URL
+        + "scoreboardv3?GameDate="
         + str(day)
         + "&LeagueID=00"
     )
 
-    # Send request
-    request = requests.get(
-        nba_schedule_url, headers=nba_header_data, timeout=10
+    # Send request, get JSON response
+    resp = get_json(
+        nba_schedule_url,
+        headers=nba_header_data,
+        ttl=get_nba_api_ttl(pd.to_datetime(day).date()),
+        timeout=10,
+        session=NBA_API_CLIENT,
     )
 
-    # Get JSON response
-    resp = request.json()
-
     # Set json resp columns to grab
     nba_json_schedule_cols = [
         "gameId",
@@ -61,6 +244,7 @@ def get_nba_games(nba_header_data: dict, day=date.today()):
 
     # Normalize json and select columns
     nba_games_today = pd.json_normalize(resp["scoreboard"]["games"])
+    record_rows_parsed(len(nba_games_today))
 
     # If games
     if len(nba_games_today) > 0:
@@ -116,9 +300,10 @@ def get_nba_games(nba_header_data: dict, day=date.today()):
             # - Update all other columns where game id = gameId - #
 
             return nba_games_today
-        except RuntimeError:
+        except RuntimeError as error:
             # Error -> return print statement
             print("Error Returning Today's Games")
+            record_swallowed_error(error)
             return pd.DataFrame()
 
     else:
@@ -127,18 +312,15 @@ def get_nba_games(nba_header_data: dict, day=date.today()):
         return pd.DataFrame()
 
 
-def get_nba_api_player_game_logs(
-    nba_header_data: dict, date_from: str = None, date_to: str = None
-):
+def get_game_log_dates(date_from: str = None, date_to: str = None):
     """
-    Function to scrape NBA API for Player game logs
+    Function to resolve game log dates, defaulting to yesterday
     Args:
-    nba_header_data (dict): headers for NBA API request
-    season_type(str): Season type, one of 'Regular Season', 'Playoffs', 'PlayIn'
     date_from (str): Date from, format 'YYYY-MM-DD'
     date_to (str): Date to, format 'YYYY-MM-DD'
     Returns:
-    nba_api_player_game_logs (df): df w/ team game logs for given params
+    date_from (date): resolved date from
+    date_to (date): resolved date to
     """
     # Set default dates if date_from or date_to is None
     # date_from
@@ -156,140 +338,201 @@ def get_nba_api_player_game_logs(
     else:
         # If supplied, convert to date YYYY-MM-DD
         date_to = pd.to_datetime(date_to).date()
-    ##
 
-    # Determine season
-    # Get current year and month
-    current_year = date.today().year
-    current_month = date.today().month
+    return date_from, date_to
 
-    # Derive season
-    if current_month > 8:
-        season_url = str(current_year) + "-" + str(current_year + 1)[2:4]
-    else:
-        season_url = str(current_year - 1) + "-" + str(current_year)[2:4]
-    ##
+
+def create_nba_api_player_game_logs_df(resp_adv: dict, resp_base: dict):
+    """
+    Function to create player game logs df from NBA API responses
+    Args:
+    resp_adv (dict): playergamelogs response with MeasureType=Advanced
+    resp_base (dict): playergamelogs response with MeasureType=Base
+    Returns:
+    nba_api_player_game_logs (df): df w/ player game logs
+    """
+    # get column names of advanced response
+    nba_api_player_game_logs_headers_adv = resp_adv["resultSets"][0]["headers"]
+
+    # Set columns to select for advanced box
+    nba_api_player_game_logs_columns_adv = [
+        "PLAYER_ID",
+        "TEAM_ID",
+        "GAME_ID",
+        "POSS",
+    ]
+
+    # Turn rowSet into dataframe, set column names
+    nba_api_player_poss_counts = pd.DataFrame(
+        resp_adv["resultSets"][0]["rowSet"],
+        columns=nba_api_player_game_logs_headers_adv,
+    )[nba_api_player_game_logs_columns_adv]
+
+    # get column names of base response
+    nba_api_player_game_logs_headers_base = resp_base["resultSets"][0][
+        "headers"
+    ]
+
+    # set columns to select for base game logs
+    nba_api_player_game_logs_columns_base = [
+        "GAME_ID",
+        "PLAYER_ID",
+        "TEAM_ID",
+        "WL",
+        "MIN",
+        "PTS",
+        "FGM",
+        "FGA",
+        "FG3M",
+        "FG3A",
+        "FTM",
+        "FTA",
+        "OREB",
+        "DREB",
+        "REB",
+        "AST",
+        "TOV",
+        "STL",
+        "BLK",
+        "BLKA",
+        "PF",
+        "PFD",
+    ]
+    # Turn rowSet into dataframe, set column names
+    nba_api_player_game_logs = pd.DataFrame(
+        resp_base["resultSets"][0]["rowSet"],
+        columns=nba_api_player_game_logs_headers_base,
+    )[nba_api_player_game_logs_columns_base]
+
+    # Join game logs with poss counts
+    nba_api_player_game_logs = nba_api_player_game_logs.merge(
+        nba_api_player_poss_counts, on=["GAME_ID", "TEAM_ID", "PLAYER_ID"]
+    )
+
+    # Convert to camel case
+    nba_api_player_game_logs.columns = [
+        convert_camel_case(x) for x in nba_api_player_game_logs.columns
+    ]
+
+    return nba_api_player_game_logs
+
+
+def create_nba_api_team_game_logs_df(resp_adv: dict, resp_base: dict):
+    """
+    Function to create team game logs df from NBA API responses
+    Args:
+    resp_adv (dict): teamgamelogs response with MeasureType=Advanced
+    resp_base (dict): teamgamelogs response with MeasureType=Base
+    Returns:
+    nba_api_team_game_logs (df): dataframe with team game logs
+    """
+    # get column names of advanced response
+    nba_api_team_game_logs_headers_adv = resp_adv["resultSets"][0]["headers"]
+
+    # Set columns to select for advanced box
+    nba_api_team_game_logs_columns_adv = ["TEAM_ID", "GAME_ID", "POSS"]
+
+    # Turn rowSet into dataframe, set column names
+    nba_api_team_poss_counts = pd.DataFrame(
+        resp_adv["resultSets"][0]["rowSet"],
+        columns=nba_api_team_game_logs_headers_adv,
+    )[nba_api_team_game_logs_columns_adv]
+
+    # get column names of base response
+    nba_api_team_game_logs_headers_base = resp_base["resultSets"][0]["headers"]
+
+    # set columns to select for base game logs
+    nba_api_team_game_logs_columns_base = [
+        "GAME_ID",
+        "TEAM_ID",
+        "WL",
+        "MIN",
+        "PTS",
+        "FGM",
+        "FGA",
+        "FG3M",
+        "FG3A",
+        "FTM",
+        "FTA",
+        "OREB",
+        "DREB",
+        "REB",
+        "AST",
+        "TOV",
+        "STL",
+        "BLK",
+        "BLKA",
+        "PF",
+        "PFD",
+    ]
+    # Turn rowSet into dataframe, set column names
+    nba_api_team_game_logs = pd.DataFrame(
+        resp_base["resultSets"][0]["rowSet"],
+        columns=nba_api_team_game_logs_headers_base,
+    )[nba_api_team_game_logs_columns_base]
+
+    # Join game logs with poss counts on GAME_ID and TEAM_ID
+    nba_api_team_game_logs = nba_api_team_game_logs.merge(
+        nba_api_team_poss_counts, on=["GAME_ID", "TEAM_ID"]
+    )
+
+    # Convert to camel case
+    nba_api_team_game_logs.columns = [
+        convert_camel_case(x) for x in nba_api_team_game_logs.columns
+    ]
+
+    # Convert min to int
+    nba_api_team_game_logs["min"] = nba_api_team_game_logs["min"].astype(
+        int
+    )
+
+    return nba_api_team_game_logs
+
+
+def get_nba_api_player_game_logs(
+    nba_header_data: dict, date_from: str = None, date_to: str = None
+):
+    """
+    Function to scrape NBA API for Player game logs
+    Args:
+    nba_header_data (dict): headers for NBA API request
+    date_from (str): Date from, format 'YYYY-MM-DD'
+    date_to (str): Date to, format 'YYYY-MM-DD'
+    Returns:
+    nba_api_player_game_logs (df): df w/ player game logs for given params
+    """
+    # Resolve dates, default to yesterday
+    date_from, date_to = get_game_log_dates(date_from, date_to)
 
     try:
         # Try to retrieve game logs
 
-        # encode dates with %2F
-        date_from_url = (
-            str(date_from.month)
-            + "%2F"
-            + str(date_from.day)
-            + "%2F"
-            + str(date_from.year)
-        )
-        date_to_url = (
-            str(date_to.month)
-            + "%2F"
-            + str(date_to.day)
-            + "%2F"
-            + str(date_to.year)
+        # Construct advanced url
+        nba_game_log_url_adv = build_nba_game_log_url(
+            "player", date_from, date_to, "Advanced"
         )
 
-        # Construct advanced url without f string
-        nba_game_log_url_adv = (
-            "https://stats.nba.com/stats/playergamelogs?DateFrom="
-            + date_from_url
-            + "&DateTo="
-            + date_to_url
-            + "&GameSegment=&LastNGames=0&LeagueID=00&Location=&MeasureType"
-            + "=Advanced&Month=0&OpponentTeamID=0&Outcome=&PORound=0&"
-            + "PaceAdjust=N&PerMode=Totals&Period=0&PlusMinus=N&Rank=N&Season="
-            + season_url
-            + "&SeasonSegment=&SeasonType=&ShotClockRange=&TeamID=0&"
-            + "VsConference=&VsDivision="
+        # Send request
+        resp_adv = get_json(
+            nba_game_log_url_adv,
+            headers=nba_header_data,
+            ttl=get_nba_api_ttl(date_to),
+            session=NBA_API_CLIENT,
         )
 
-        # Send request
-        request = requests.get(nba_game_log_url_adv, headers=nba_header_data) #pylint: disable=missing-timeout
-
-        # Get JSON response
-        resp = request.json()
-
-        # get column names of advanced response
-        nba_api_player_game_logs_headers_adv = resp["resultSets"][0]["headers"]
-
-        # Set columns to select for advanced box
-        nba_api_player_game_logs_columns_adv = [
-            "PLAYER_ID",
-            "TEAM_ID",
-            "GAME_ID",
-            "POSS",
-        ]
-
-        # Turn rowSet into dataframe, set column names
-        nba_api_player_poss_counts = pd.DataFrame(
-            resp["resultSets"][0]["rowSet"],
-            columns=nba_api_player_game_logs_headers_adv,
-        )[nba_api_player_game_logs_columns_adv]
-
-        # Construct base game log url without f string
-        nba_game_log_url_base = (
-            "https://stats.nba.com/stats/playergamelogs?DateFrom="
-            + date_from_url
-            + "&DateTo="
-            + date_to_url
-            + "&GameSegment=&LastNGames=0&LeagueID=00&Location=&MeasureType"
-            + "=&Month=0&OpponentTeamID=0&Outcome=&PORound=0&"
-            + "PaceAdjust=N&PerMode=Totals&Period=0&PlusMinus=N&Rank=N&Season="
-            + season_url
-            + "&SeasonSegment=&SeasonType=&ShotClockRange=&TeamID=0&"
-            + "VsConference=&VsDivision="
+        # Construct base game log url
+        nba_game_log_url_base = build_nba_game_log_url(
+            "player", date_from, date_to
         )
         # Send request
-        request = requests.get(nba_game_log_url_base, headers=nba_header_data) #pylint: disable=missing-timeout
-
-        # Get JSON response
-        resp = request.json()
-
-        # get column names of base response
-        nba_api_player_game_logs_headers_base = resp["resultSets"][0]["headers"]
-
-        # set columns to select for base game logs
-        nba_api_player_game_logs_columns_base = [
-            "GAME_ID",
-            "PLAYER_ID",
-            "TEAM_ID",
-            "WL",
-            "MIN",
-            "PTS",
-            "FGM",
-            "FGA",
-            "FG3M",
-            "FG3A",
-            "FTM",
-            "FTA",
-            "OREB",
-            "DREB",
-            "REB",
-            "AST",
-            "TOV",
-            "STL",
-            "BLK",
-            "BLKA",
-            "PF",
-            "PFD",
-        ]
-        # Turn rowSet into dataframe, set column names
-        nba_api_player_game_logs = pd.DataFrame(
-            resp["resultSets"][0]["rowSet"],
-            columns=nba_api_player_game_logs_headers_base,
-        )[nba_api_player_game_logs_columns_base]
-
-        # Join game logs with poss counts
-        nba_api_player_game_logs = nba_api_player_game_logs.merge(
-            nba_api_player_poss_counts, on=["GAME_ID", "TEAM_ID", "PLAYER_ID"]
+        resp_base = get_json(
+            nba_game_log_url_base,
+            headers=nba_header_data,
+            ttl=get_nba_api_ttl(date_to),
+            session=NBA_API_CLIENT,
         )
 
-        # Convert to camel case
-        nba_api_player_game_logs.columns = [
-            convert_camel_case(x) for x in nba_api_player_game_logs.columns
-        ]
-
-        return nba_api_player_game_logs
+        return create_nba_api_player_game_logs_df(resp_adv, resp_base)
 
     except RuntimeError:
         # Error -> return empty dataframe
@@ -303,161 +546,43 @@ def get_nba_api_team_game_logs(
     Function to scrape NBA API for Team game logs
     Args:
     nba_header_data (dict): headers for NBA API request
-    season_type(str): Season type, one of 'Regular Season', 'Playoffs', 'PlayIn'
     date_from (str): Date from, format 'YYYY-MM-DD'
     date_to (str): Date to, format 'YYYY-MM-DD'
     Returns:
     nba_api_team_game_logs (df): dataframe with team game logs for given params
     """
-    # Set default dates if date_from or date_to is None
-    # date_from
-    if date_from is None:
-        # Set to yesterday
-        date_from = date.today() - pd.Timedelta(days=1)
-    else:
-        # If supplied, convert to date YYYY-MM-DD
-        date_from = pd.to_datetime(date_from).date()
-
-    # date_to
-    if date_to is None:
-        # Set to yesterday
-        date_to = date.today() - pd.Timedelta(days=1)
-    else:
-        # If supplied, convert to date YYYY-MM-DD
-        date_to = pd.to_datetime(date_to).date()
-    ##
-
-    # Determine season
-    # Get current year and month
-    current_year = date.today().year
-    current_month = date.today().month
-
-    # Derive season
-    if current_month > 8:
-        season_url = str(current_year) + "-" + str(current_year + 1)[2:4]
-    else:
-        season_url = str(current_year - 1) + "-" + str(current_year)[2:4]
-    ##
+    # Resolve dates, default to yesterday
+    date_from, date_to = get_game_log_dates(date_from, date_to)
 
     try:
         # Try to retrieve game logs
 
-        # encode dates with %2F
-        date_from_url = (
-            str(date_from.month)
-            + "%2F"
-            + str(date_from.day)
-            + "%2F"
-            + str(date_from.year)
-        )
-        date_to_url = (
-            str(date_to.month)
-            + "%2F"
-            + str(date_to.day)
-            + "%2F"
-            + str(date_to.year)
-        )
-
-        # Construct advanced url to get possessions without f string
-        nba_game_log_url_adv = (
-            "https://stats.nba.com/stats/teamgamelogs?DateFrom="
-            + date_from_url
-            + "&DateTo="
-            + date_to_url
-            + "&GameSegment=&LastNGames=0&LeagueID=00&Location=&MeasureType"
-            + "=Advanced&Month=0&OpponentTeamID=0&Outcome=&PORound=0&"
-            + "PaceAdjust=N&PerMode=Totals&Period=0&PlusMinus=N&Rank=N&Season="
-            + season_url
-            + "&SeasonSegment=&SeasonType=&ShotClockRange=&TeamID=0&"
-            + "VsConference=&VsDivision="
+        # Construct advanced url to get possessions
+        nba_game_log_url_adv = build_nba_game_log_url(
+            "team", date_from, date_to, "Advanced"
         )
         # Send request
-        request = requests.get(nba_game_log_url_adv, headers=nba_header_data) #pylint: disable=missing-timeout
-
-        # Get JSON response
-        resp = request.json()
-
-        # get column names of advanced response
-        nba_api_team_game_logs_headers_adv = resp["resultSets"][0]["headers"]
-
-        # Set columns to select for advanced box
-        nba_api_team_game_logs_columns_adv = ["TEAM_ID", "GAME_ID", "POSS"]
-
-        # Turn rowSet into dataframe, set column names
-        nba_api_team_poss_counts = pd.DataFrame(
-            resp["resultSets"][0]["rowSet"],
-            columns=nba_api_team_game_logs_headers_adv,
-        )[nba_api_team_game_logs_columns_adv]
+        resp_adv = get_json(
+            nba_game_log_url_adv,
+            headers=nba_header_data,
+            ttl=get_nba_api_ttl(date_to),
+            session=NBA_API_CLIENT,
+        )
 
         # Construct base game log url
-        nba_game_log_url_base = (
-            "https://stats.nba.com/stats/teamgamelogs?DateFrom="
-            + date_from_url
-            + "&DateTo="
-            + date_to_url
-            + "&GameSegment=&LastNGames=0&LeagueID=00&Location=&MeasureType"
-            + "=&Month=0&OpponentTeamID=0&Outcome=&PORound=0&"
-            + "PaceAdjust=N&PerMode=Totals&Period=0&PlusMinus=N&Rank=N&Season="
-            + season_url
-            + "&SeasonSegment=&SeasonType=&ShotClockRange=&TeamID=0&"
-            + "VsConference=&VsDivision="
+        nba_game_log_url_base = build_nba_game_log_url(
+            "team", date_from, date_to
         )
 
         # Send requets
-        request = requests.get(nba_game_log_url_base, headers=nba_header_data) #pylint: disable=missing-timeout
-
-        # Get JSON response
-        resp = request.json()
-
-        # get column names of base response
-        nba_api_team_game_logs_headers_base = resp["resultSets"][0]["headers"]
-
-        # set columns to select for base game logs
-        nba_api_team_game_logs_columns_base = [
-            "GAME_ID",
-            "TEAM_ID",
-            "WL",
-            "MIN",
-            "PTS",
-            "FGM",
-            "FGA",
-            "FG3M",
-            "FG3A",
-            "FTM",
-            "FTA",
-            "OREB",
-            "DREB",
-            "REB",
-            "AST",
-            "TOV",
-            "STL",
-            "BLK",
-            "BLKA",
-            "PF",
-            "PFD",
-        ]
-        # Turn rowSet into dataframe, set column names
-        nba_api_team_game_logs = pd.DataFrame(
-            resp["resultSets"][0]["rowSet"],
-            columns=nba_api_team_game_logs_headers_base,
-        )[nba_api_team_game_logs_columns_base]
-
-        # Join game logs with poss counts on GAME_ID and TEAM_ID
-        nba_api_team_game_logs = nba_api_team_game_logs.merge(
-            nba_api_team_poss_counts, on=["GAME_ID", "TEAM_ID"]
-        )
-
-        # Convert to camel case
-        nba_api_team_game_logs.columns = [
-            convert_camel_case(x) for x in nba_api_team_game_logs.columns
-        ]
-
-        # Convert min to int
-        nba_api_team_game_logs["min"] = nba_api_team_game_logs["min"].astype(
-            int
+        resp_base = get_json(
+            nba_game_log_url_base,
+            headers=nba_header_data,
+            ttl=get_nba_api_ttl(date_to),
+            session=NBA_API_CLIENT,
         )
 
-        return nba_api_team_game_logs
+        return create_nba_api_team_game_logs_df(resp_adv, resp_base)
 
     except RuntimeError:
         # Error -> return empty dataframe
@@ -465,121 +590,451 @@ def get_nba_api_team_game_logs(
 
 
 def update_nba_api_data(
-    cursor, nba_games_today, nba_api_team_game_logs, nba_api_player_game_logs
+    con,
+    nba_games_today,
+    nba_api_team_game_logs=None,
+    nba_api_player_game_logs=None,
 ):
     """
     Function to update data from the NBA API
     Args:
+    con (connection): connection to SQL database
     nba_games_today (df): dataframe from get_nba_games_today()
-    nba_api_team_game_logs (df): dataframe from get_nba_api_team_game_logs()
-    nba_api_player_game_logs (df): dataframe from get_nba_api_player_game_logs()
+    nba_api_team_game_logs (df): dataframe from get_nba_api_team_game_logs(),
+        None when synced by sync_nba_api_game_logs()
+    nba_api_player_game_logs (df): dataframe from
+        get_nba_api_player_game_logs(), None when synced by
+        sync_nba_api_game_logs()
     """
-    try:
-        # Try to update nba_games_today
+    # Stage and merge all tables in one transaction
+    with transaction(con) as cursor:
+        # Update nba_games_today
         if len(nba_games_today) > 0:
-            for index, row in nba_games_today.iterrows(): #pylint: disable=unused-variable
-                # Query
-                query = (
-                    "CALL update_nbaapi_events(%s, %s, %s, %s, %s, %s, %s, %s)"
-                )
-                # Execute
-                cursor.execute(
-                    query,
-                    (
-                        row["gameId"],
-                        row["gameEt"],
-                        row["awayTeamId"],
-                        row["awayTeamSlug"],
-                        row["awayTeamName"],
-                        row["homeTeamId"],
-                        row["homeTeamSlug"],
-                        row["homeTeamName"],
-                    ),
-                )
+            bulk_upsert(
+                cursor,
+                "nba_api_events",
+                nba_games_today,
+                NBA_API_EVENTS_COLUMNS,
+                ["gameId"],
+            )
             print("Updated nba_api_events")
-    except RuntimeError:
-        print("Error updating nba_api_events")
 
-    try:
-        # Try to update nba_api_team_game_logs
-        if len(nba_api_team_game_logs) > 0:
-            for index, row in nba_api_team_game_logs.iterrows():
-                # Query
-                query = """
-                            CALL update_nbaapi_team_game_logs(%s, %s, %s, %s, %s, %s,
-                            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                            """
-                # Execute
-                cursor.execute(
-                    query,
-                    (
-                        row["gameId"],
-                        row["teamId"],
-                        row["wl"],
-                        row["pts"],
-                        row["fgm"],
-                        row["fga"],
-                        row["fg3M"],
-                        row["fg3A"],
-                        row["ftm"],
-                        row["fta"],
-                        row["oreb"],
-                        row["dreb"],
-                        row["reb"],
-                        row["ast"],
-                        row["tov"],
-                        row["stl"],
-                        row["blk"],
-                        row["blka"],
-                        row["pf"],
-                        row["pfd"],
-                        row["poss"],
-                        row["min"],
-                    ),
-                )
+        # Update nba_api_team_game_logs
+        if (
+            nba_api_team_game_logs is not None
+            and len(nba_api_team_game_logs) > 0
+        ):
+            bulk_upsert(
+                cursor,
+                "nba_api_team_game_logs",
+                nba_api_team_game_logs,
+                NBA_API_TEAM_GAME_LOGS_COLUMNS,
+                ["gameId", "teamId"],
+                skip_unchanged=True,
+            )
             print("Updated nba_api_team_game_logs")
-    except RuntimeError:
-        print("Error updating nba_api_team_game_logs")
 
-    try:
-        # TRY to update nba_api_player_game_logs
-        if len(nba_api_player_game_logs) > 0:
-            for index, row in nba_api_player_game_logs.iterrows():
-                # Query
-                query = """
-                CALL update_nbaapi_player_game_logs(%s, %s, %s, %s, %s, %s, %s,
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """
-                # Execute
-                cursor.execute(
-                    query,
+        # Update nba_api_player_game_logs
+        if (
+            nba_api_player_game_logs is not None
+            and len(nba_api_player_game_logs) > 0
+        ):
+            bulk_upsert(
+                cursor,
+                "nba_api_player_game_logs",
+                nba_api_player_game_logs,
+                NBA_API_PLAYER_GAME_LOGS_COLUMNS,
+                ["gameId", "playerId"],
+                skip_unchanged=True,
+            )
+            print("Updated nba_api_player_game_logs")
+
+
+def split_date_range(date_from, date_to, window_days: int = 7):
+    """
+    Function to split a date range into windows within a single season
+    Args:
+    date_from (date): first date of range
+    date_to (date): last date of range
+    window_days (int): max number of days per window
+    Returns:
+    windows (list): list of (date_from, date_to) tuples
+    """
+    windows = []
+    window_from = date_from
+    while window_from <= date_to:
+        # Window ends after window_days or at date_to
+        window_to = min(
+            window_from + timedelta(days=window_days - 1), date_to
+        )
+
+        # Don't let a window cross into the next season (Sep 1)
+        season_end = date(
+            window_from.year + (window_from.month > 8), 8, 31
+        )
+        window_to = min(window_to, season_end)
+
+        windows.append((window_from, window_to))
+        window_from = window_to + timedelta(days=1)
+
+    return windows
+
+
+def get_nba_api_result_set(
+    nba_header_data: dict, url: str, ttl=0, client=None
+):
+    """
+    Function to get the first raw result set from the NBA API
+    Args:
+    nba_header_data (dict): headers for NBA API request
+    url (str): url to request
+    ttl (int): seconds to cache, None never expires
+    client (RetryingClient): client to send the request on, default
+        NBA_API_CLIENT
+    Returns:
+    headers (list): column names of the result set
+    row_set (list): rows of the result set
+    """
+    # Send request, get JSON response
+    resp = get_json(
+        url,
+        headers=nba_header_data,
+        ttl=ttl,
+        session=client or NBA_API_CLIENT,
+    )
+    record_rows_parsed(len(resp["resultSets"][0]["rowSet"]))
+
+    return resp["resultSets"][0]["headers"], resp["resultSets"][0]["rowSet"]
+
+
+def select_row_set_columns(headers, row_set, columns):
+    """
+    Function to lazily select camelCase columns from a raw rowSet
+    Args:
+    headers (list): column names of the result set
+    row_set (list): rows of the result set
+    columns (list): camelCase column names to select, in order
+    Returns:
+    rows (generator): rows containing only the selected columns
+    """
+    # Map camelCase column names to rowSet positions
+    headers = [convert_camel_case(x) for x in headers]
+    positions = [headers.index(col) for col in columns]
+
+    return ([row[i] for i in positions] for row in row_set)
+
+
+def get_nba_api_game_log_result_sets( #pylint: disable=too-many-arguments
+    nba_header_data: dict,
+    entity: str,
+    measure_type: str,
+    date_from,
+    date_to,
+    window_days: int = 7,
+):
+    """
+    Function to get raw game log result sets for any date range, one per
+    window from split_date_range()
+    Args:
+    nba_header_data (dict): headers for NBA API request
+    entity (str): one of 'player', 'team'
+    measure_type (str): one of 'Advanced', '' (Base)
+    date_from (date): first date of range
+    date_to (date): last date of range
+    window_days (int): days fetched per request, bounds response size
+    Returns:
+    result_sets (list): (headers, rowSet) per window
+    """
+    return [
+        get_nba_api_result_set(
+            nba_header_data,
+            build_nba_game_log_url(
+                entity, window_from, window_to, measure_type
+            ),
+            get_nba_api_ttl(window_to),
+        )
+        for window_from, window_to in split_date_range(
+            date_from, date_to, window_days
+        )
+    ]
+
+
+def write_nba_api_game_logs( #pylint: disable=too-many-locals
+    con, entity: str, adv_result_set, base_result_set, chunk_size=10000
+):
+    """
+    Function to stream raw game log result sets into SQL with COPY,
+    rows already stored with the same values are not rewritten
+    Args:
+    con (connection): connection to SQL database
+    entity (str): one of 'player', 'team'
+    adv_result_set (tuple): (headers, rowSet) with MeasureType=Advanced
+    base_result_set (tuple): (headers, rowSet) with MeasureType=Base
+    chunk_size (int): rows buffered in memory per COPY
+    Returns:
+    row_count (int): number of rows inserted or changed
+    """
+    # Set table and keys for entity
+    if entity == "player":
+        table = "nba_api_player_game_logs"
+        table_columns = NBA_API_PLAYER_GAME_LOGS_COLUMNS
+        join_keys = ["gameId", "teamId", "playerId"]
+        key_columns = ["gameId", "playerId"]
+    else:
+        table = "nba_api_team_game_logs"
+        table_columns = NBA_API_TEAM_GAME_LOGS_COLUMNS
+        join_keys = ["gameId", "teamId"]
+        key_columns = ["gameId", "teamId"]
+
+    # Base box score columns, min is staged raw and truncated on merge
+    base_columns = {
+        col: ("FLOAT" if col == "min" else typ)
+        for col, typ in table_columns.items()
+        if col != "poss"
+    }
+    # Advanced box score columns, only need possessions
+    adv_columns = {col: table_columns[col] for col in join_keys + ["poss"]}
+
+    # Select base and advanced columns in table order
+    select_columns = []
+    for col in table_columns:
+        if col == "poss":
+            select_columns.append("a.poss")
+        elif col == "min" and entity == "team":
+            select_columns.append("TRUNC(b.min)")
+        else:
+            select_columns.append("b." + col)
+
+    # Stream rowSets into staging tables then merge in one transaction
+    with transaction(con) as cursor:
+        staged_rows = copy_rows_to_stage(
+            cursor,
+            "stage_" + table + "_base",
+            base_columns,
+            select_row_set_columns(*base_result_set, base_columns),
+            chunk_size,
+        )
+        copy_rows_to_stage(
+            cursor,
+            "stage_" + table + "_adv",
+            adv_columns,
+            select_row_set_columns(*adv_result_set, adv_columns),
+            chunk_size,
+        )
+        row_count = upsert_from_query(
+            cursor,
+            table,
+            list(table_columns),
+            "SELECT "
+            + ", ".join(select_columns)
+            + " FROM stage_"
+            + table
+            + "_base b INNER JOIN stage_"
+            + table
+            + "_adv a ON "
+            + " AND ".join(["b." + x + " = a." + x for x in join_keys]),
+            key_columns,
+            skip_unchanged=True,
+            staged_rows=staged_rows,
+        )
+
+    return row_count
+
+
+def load_nba_api_game_logs( #pylint: disable=too-many-arguments
+    con,
+    nba_header_data: dict,
+    entity: str,
+    date_from,
+    date_to,
+    chunk_size: int = 10000,
+):
+    """
+    Function to stream game logs for a date range into SQL with COPY
+    Args:
+    con (connection): connection to SQL database
+    nba_header_data (dict): headers for NBA API request
+    entity (str): one of 'player', 'team'
+    date_from (date): date from, range must be within one season
+    date_to (date): date to
+    chunk_size (int): rows buffered in memory per COPY
+    Returns:
+    row_count (int): number of rows inserted or updated
+    """
+    # Get raw result sets
+    adv_result_set = get_nba_api_result_set(
+        nba_header_data,
+        build_nba_game_log_url(entity, date_from, date_to, "Advanced"),
+        get_nba_api_ttl(date_to),
+    )
+    base_result_set = get_nba_api_result_set(
+        nba_header_data,
+        build_nba_game_log_url(entity, date_from, date_to),
+        get_nba_api_ttl(date_to),
+    )
+
+    return write_nba_api_game_logs(
+        con, entity, adv_result_set, base_result_set, chunk_size
+    )
+
+
+def backfill_nba_api_game_logs( #pylint: disable=too-many-arguments
+    con,
+    nba_header_data: dict,
+    date_from: str,
+    date_to: str,
+    window_days: int = 7,
+    chunk_size: int = 10000,
+):
+    """
+    Function to load team and player game logs for any date range
+    Args:
+    con (connection): connection to SQL database
+    nba_header_data (dict): headers for NBA API request
+    date_from (str): Date from, format 'YYYY-MM-DD'
+    date_to (str): Date to, format 'YYYY-MM-DD'
+    window_days (int): days fetched per request, bounds response size
+    chunk_size (int): rows buffered in memory per COPY
+    Returns:
+    row_counts (dict): entity -> number of rows inserted or changed
+    """
+    # Convert to date YYYY-MM-DD
+    date_from = pd.to_datetime(date_from).date()
+    date_to = pd.to_datetime(date_to).date()
+
+    row_counts = {"team": 0, "player": 0}
+    start_time = time.perf_counter()
+    for window_from, window_to in split_date_range(
+        date_from, date_to, window_days
+    ):
+        for entity in row_counts:
+            row_counts[entity] += load_nba_api_game_logs(
+                con,
+                nba_header_data,
+                entity,
+                window_from,
+                window_to,
+                chunk_size,
+            )
+
+        # Report throughput so far
+        elapsed = time.perf_counter() - start_time
+        print(
+            "Loaded game logs through "
+            + str(window_to)
+            + ": "
+            + str(row_counts["team"])
+            + " team rows, "
+            + str(row_counts["player"])
+            + " player rows ("
+            + str(round(sum(row_counts.values()) / elapsed))
+            + " rows/sec)"
+        )
+
+    return row_counts
+
+
+def get_game_log_high_water_mark(con):
+    """
+    Function to get the latest game date loaded for both team and player
+    game logs
+    Args:
+    con (connection): connection to SQL database
+    Returns:
+    high_water_mark (date): latest game date in both tables, None if either
+        has no games in nba_api_events
+    """
+    with con.cursor() as cursor:
+        # gameEt is stored as Eastern wall clock time labelled UTC,
+        # so its UTC date is the game date
+        cursor.execute(
+            """
+            SELECT
+                LEAST(
                     (
-                        row["gameId"],
-                        row["playerId"],
-                        row["teamId"],
-                        row["wl"],
-                        row["min"],
-                        row["pts"],
-                        row["fgm"],
-                        row["fga"],
-                        row["fg3M"],
-                        row["fg3A"],
-                        row["ftm"],
-                        row["fta"],
-                        row["oreb"],
-                        row["dreb"],
-                        row["reb"],
-                        row["ast"],
-                        row["tov"],
-                        row["stl"],
-                        row["blk"],
-                        row["blka"],
-                        row["pf"],
-                        row["pfd"],
-                        row["poss"],
+                        SELECT MAX((e.gameEt AT TIME ZONE 'UTC')::date)
+                        FROM nba_api_team_game_logs g
+                        INNER JOIN nba_api_events e ON g.gameId = e.gameId
                     ),
-                )
-            print("Updated nba_api_player_game_logs")
+                    (
+                        SELECT MAX((e.gameEt AT TIME ZONE 'UTC')::date)
+                        FROM nba_api_player_game_logs g
+                        INNER JOIN nba_api_events e ON g.gameId = e.gameId
+                    )
+                ),
+                (SELECT COUNT(*) FROM nba_api_team_game_logs),
+                (SELECT COUNT(*) FROM nba_api_player_game_logs)
+            """
+        )
+        high_water_mark, team_count, player_count = cursor.fetchone()
 
-    except RuntimeError:
-        print("Error updating nba_api_player_game_logs")
+    # LEAST ignores nulls, an empty table means nothing is loaded
+    if team_count == 0 or player_count == 0:
+        return None
+
+    return high_water_mark
+
+
+def get_sync_game_log_dates(con, date_from: str = None, date_to: str = None):
+    """
+    Function to get the game log dates missing from the database
+    Args:
+    con (connection): connection to SQL database
+    date_from (str): Date from when nothing is loaded yet, format
+        'YYYY-MM-DD', default yesterday
+    date_to (str): Date to, format 'YYYY-MM-DD', default yesterday
+    Returns:
+    sync_dates (tuple): (date_from, date_to) to load, None if up to date
+    """
+    date_from, date_to = get_game_log_dates(date_from, date_to)
+
+    # Start from the last loaded game date itself, late stat corrections
+    # for that day are picked up and unchanged rows are skipped
+    high_water_mark = get_game_log_high_water_mark(con)
+    if high_water_mark is not None:
+        date_from = high_water_mark
+
+    if date_from > date_to:
+        print("Game logs up to date through " + str(high_water_mark))
+        return None
+
+    print("Syncing game logs from " + str(date_from) + " to " + str(date_to))
+
+    return date_from, date_to
+
+
+def sync_nba_api_game_logs( #pylint: disable=too-many-arguments
+    con,
+    nba_header_data: dict,
+    date_from: str = None,
+    date_to: str = None,
+    window_days: int = 7,
+    chunk_size: int = 10000,
+):
+    """
+    Function to load game logs from the last loaded game date through
+    date_to, so missed days are caught up on the next run
+    Args:
+    con (connection): connection to SQL database
+    nba_header_data (dict): headers for NBA API request
+    date_from (str): Date from when nothing is loaded yet, format
+        'YYYY-MM-DD', default yesterday
+    date_to (str): Date to, format 'YYYY-MM-DD', default yesterday
+    window_days (int): days fetched per request, bounds response size
+    chunk_size (int): rows buffered in memory per COPY
+    Returns:
+    row_counts (dict): entity -> number of rows inserted or changed
+    """
+    sync_dates = get_sync_game_log_dates(con, date_from, date_to)
+    if sync_dates is None:
+        return {"team": 0, "player": 0}
+    date_from, date_to = sync_dates
+
+    return backfill_nba_api_game_logs(
+        con,
+        nba_header_data,
+        date_from,
+        date_to,
+        window_days,
+        chunk_size,
+    )
@@ -0,0 +1,258 @@
+"""
+Functions to convert odds and remove the vig, vectorized over NumPy
+arrays so a whole slate or history is one call
+"""
+# Import packages
+import numpy as np
+import pandas as pd
+
+# Rough standard deviation, in points (goals/runs), of a game's margin
+# and total around the closing spread and total, used to price pushes
+# on whole-number lines. NFL margins cluster on key numbers, so its
+# pushes on 3 and 7 are underpriced
+RESULT_SD = {
+    "NBA": {"spread": 12.0, "total": 18.0},
+    "NFL": {"spread": 13.5, "total": 13.5},
+    "MLB": {"spread": 4.0, "total": 4.5},
+    "NHL": {"spread": 2.3, "total": 2.3},
+}
+
+# Vig removal method per market, see remove_vig()
+FAIR_ODDS_METHODS = {
+    "moneyline": "shin",
+    "spread": "multiplicative",
+    "total": "multiplicative",
+}
+
+# Columns add_fair_odds() adds, all FLOAT
+FAIR_ODDS_COLUMNS = [
+    "fairMoneyline",
+    "holdMoneyline",
+    "fairSpread",
+    "pushSpread",
+    "holdSpread",
+    "fairOver",
+    "pushTotal",
+    "holdTotal",
+]
+
+
+# Functions
+def american_to_decimal(odds):
+    """
+    Function to convert American odds to decimal odds
+    Args:
+    odds (array): American odds, e.g. -110, +150, NaN if missing
+    Returns:
+    decimal (array): decimal odds, NaN where odds are missing or 0
+    """
+    odds = np.asarray(odds, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        decimal = np.where(odds > 0, 1 + odds / 100, 1 - 100 / odds)
+
+    return np.where(odds == 0, np.nan, decimal)
+
+
+def decimal_to_american(decimal):
+    """
+    Function to convert decimal odds to American odds
+    Args:
+    decimal (array): decimal odds, e.g. 1.91, 2.5
+    Returns:
+    odds (array): American odds, NaN where decimal odds are <= 1
+    """
+    decimal = np.asarray(decimal, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        odds = np.where(
+            decimal >= 2, (decimal - 1) * 100, -100 / (decimal - 1)
+        )
+
+    return np.where(decimal > 1, odds, np.nan)
+
+
+def american_to_prob(odds):
+    """
+    Function to convert American odds to implied probability, vig
+    included
+    Args:
+    odds (array): American odds
+    Returns:
+    prob (array): implied probability
+    """
+    return 1 / american_to_decimal(odds)
+
+
+def prob_to_american(prob):
+    """
+    Function to convert a probability to American odds
+    Args:
+    prob (array): probability, between 0 and 1
+    Returns:
+    odds (array): American odds, NaN where prob is not in (0, 1)
+    """
+    prob = np.asarray(prob, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        odds = decimal_to_american(1 / prob)
+
+    return np.where((prob > 0) & (prob < 1), odds, np.nan)
+
+
+def get_hold(prob_a, prob_b):
+    """
+    Function to get the hold of two-way markets, the share of money
+    wagered the book keeps with balanced action
+    Args:
+    prob_a (array): implied probability of one side
+    prob_b (array): implied probability of the other side
+    Returns:
+    hold (array): 1 - 1 / overround, e.g. 0.0455 for -110/-110
+    """
+    return 1 - 1 / (np.asarray(prob_a) + np.asarray(prob_b))
+
+
+def remove_vig(prob_a, prob_b, method: str = "multiplicative"):
+    """
+    Function to remove the vig from two-way markets
+    Args:
+    prob_a (array): implied probability of one side
+    prob_b (array): implied probability of the other side
+    method (str): one of
+        'multiplicative' scales both sides by the overround,
+        'additive' takes half the overround off each side,
+        'shin' assumes a share z of insider money, which moves more of
+            the vig onto longshots. z has a closed form for two
+            outcomes, and for two outcomes gives the additive result
+    Returns:
+    fair_a (array): fair probability of one side
+    fair_b (array): fair probability of the other side
+    """
+    prob_a = np.asarray(prob_a, dtype=np.float64)
+    prob_b = np.asarray(prob_b, dtype=np.float64)
+    overround = prob_a + prob_b
+
+    if method == "multiplicative":
+        return prob_a / overround, prob_b / overround
+
+    if method == "additive":
+        return (
+            prob_a - (overround - 1) / 2,
+            prob_b - (overround - 1) / 2,
+        )
+
+    if method == "shin":
+        # Closed form of z for two outcomes
+        diff = (prob_a - prob_b) ** 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = ((overround - 1) * (diff - overround)) / (
+                overround * (diff - 1)
+            )
+        fair = [
+            (np.sqrt(z**2 + 4 * (1 - z) * x**2 / overround) - z)
+            / (2 * (1 - z))
+            for x in (prob_a, prob_b)
+        ]
+        return fair[0], fair[1]
+
+    raise ValueError("Unknown vig removal method " + method)
+
+
+def get_push_prob(line, result_sd: float):
+    """
+    Function to get the probability a spread or total pushes, with the
+    result normally distributed around the line
+    Args:
+    line (array): spread or total line, e.g. -3.5, 221
+    result_sd (float): standard deviation of the result around the line
+    Returns:
+    push_prob (array): 0 for half-point lines, NaN where line is missing
+    """
+    line = np.asarray(line, dtype=np.float64)
+
+    # Density at the line, times the width (1) of a whole-number result
+    push_prob = np.where(
+        line == np.round(line), 1 / (result_sd * np.sqrt(2 * np.pi)), 0.0
+    )
+
+    return np.where(np.isnan(line), np.nan, push_prob)
+
+
+def adjust_for_push(fair_prob, push_prob):
+    """
+    Function to turn a fair probability conditional on no push into the
+    probability of winning outright
+    Args:
+    fair_prob (array): fair probability once pushes are refunded
+    push_prob (array): probability of a push
+    Returns:
+    win_prob (array): fair_prob * (1 - push_prob)
+    """
+    return np.asarray(fair_prob) * (1 - np.asarray(push_prob))
+
+
+def get_other_side(event_ids, values):
+    """
+    Function to get the other side's value of each two-row event
+    Args:
+    event_ids (Series): event id of each row
+    values (Series): value of each row
+    Returns:
+    other (array): other row's value, NaN unless the event has two rows
+        with values
+    """
+    groups = values.groupby(event_ids)
+    count = groups.transform("count").to_numpy()
+    other = groups.transform("sum").to_numpy() - values.to_numpy()
+
+    return np.where(count == 2, other, np.nan)
+
+
+def add_fair_odds(team_odds_df, league: str = "NBA"):
+    """
+    Function to add fair probabilities, holds and push probabilities to
+    wide team odds, home and away rows are paired on eventId
+    Args:
+    team_odds_df (df): one row per event and team type, from
+        create_nba_team_odds_wide_df()
+    league (str): key of RESULT_SD, sets push probabilities
+    Returns:
+    team_odds_df (df): with FAIR_ODDS_COLUMNS added
+    """
+    team_odds_df = team_odds_df.copy()
+    event_ids = team_odds_df["eventId"]
+
+    # Moneyline and spread, each row against the other team's row
+    for market, odds_col in (
+        ("moneyline", "oddsMoneyline"),
+        ("spread", "oddsSpread"),
+    ):
+        prob = pd.Series(
+            american_to_prob(team_odds_df[odds_col]), index=team_odds_df.index
+        )
+        other_prob = get_other_side(event_ids, prob)
+        fair, _ = remove_vig(prob, other_prob, FAIR_ODDS_METHODS[market])
+        team_odds_df["hold" + market.title()] = get_hold(prob, other_prob)
+        team_odds_df["fair" + market.title()] = fair
+
+    # Spread cover probability, pushes refunded
+    team_odds_df["pushSpread"] = get_push_prob(
+        team_odds_df["spreadLine"], RESULT_SD[league]["spread"]
+    )
+    team_odds_df["fairSpread"] = adjust_for_push(
+        team_odds_df["fairSpread"], team_odds_df["pushSpread"]
+    )
+
+    # Total, over against under on the same row
+    over_prob = american_to_prob(team_odds_df["oddsOver"])
+    under_prob = american_to_prob(team_odds_df["oddsUnder"])
+    fair_over, _ = remove_vig(
+        over_prob, under_prob, FAIR_ODDS_METHODS["total"]
+    )
+    team_odds_df["holdTotal"] = get_hold(over_prob, under_prob)
+    team_odds_df["pushTotal"] = get_push_prob(
+        team_odds_df["totalPointsLine"], RESULT_SD[league]["total"]
+    )
+    team_odds_df["fairOver"] = adjust_for_push(
+        fair_over, team_odds_df["pushTotal"]
+    )
+
+    return team_odds_df
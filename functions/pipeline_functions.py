@@ -0,0 +1,438 @@
+"""
+Functions to run ingestion stages concurrently as a DAG
+"""
+# Import packages
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+import pandas as pd
+from functions.analytics_functions import refresh_nba_beat_rate_analytics
+from functions.archive_functions import (
+    archive_dk_stage,
+    archive_game_logs,
+    archive_nba_events_stage,
+)
+from functions.book_functions import (
+    BOOK_ADAPTERS,
+    scan_book_odds,
+    update_book_odds,
+)
+from functions.db_functions import run_db_stage
+from functions.event_map_functions import resolve_nba_event_map
+from functions.metrics_functions import record_stage, stage_context
+from functions.dk_api_functions import DK_LEAGUES, update_team_odds
+from functions.dk_props_functions import (
+    DK_NBA_ALT_LINE_MARKETS,
+    DK_NBA_PROP_MARKETS,
+    get_alt_line_offers,
+    get_prop_offers,
+    update_nba_props,
+)
+from functions.nba_api_functions import (
+    get_nba_api_game_log_result_sets,
+    get_nba_games,
+    get_sync_game_log_dates,
+    update_nba_api_data,
+    write_nba_api_game_logs,
+)
+
+
+# Functions
+def run_timed(func, args, name: str = None):
+    """
+    Function to run a stage and time it, on a worker thread
+    Args:
+    func (function): stage function
+    args (list): results of the stage's dependencies
+    name (str): stage name, labels the metrics the stage records
+    Returns:
+    result: stage result, None if it raised
+    error (Exception): exception raised by the stage, None if it succeeded
+    start_time (float): perf_counter() when the stage started
+    end_time (float): perf_counter() when the stage ended
+    """
+    start_time = time.perf_counter()
+    try:
+        with stage_context(name):
+            return func(*args), None, start_time, time.perf_counter()
+    except Exception as error: #pylint: disable=broad-exception-caught
+        return None, error, start_time, time.perf_counter()
+
+
+def run_pipeline( #pylint: disable=too-many-locals, too-many-branches
+    stages: dict, max_workers: int = None
+):
+    """
+    Function to run stages in a thread pool, starting each stage as soon
+    as its dependencies complete
+    Args:
+    stages (dict): stage name -> (func, list of dependency names), func is
+        called with the results of its dependencies in order
+    max_workers (int): max stages run at once, default all
+    Returns:
+    results (dict): stage name -> result of completed stages
+    timings (df): stage, status, start, end and seconds per stage
+    """
+    # Fail fast on typos in dependency names
+    for name, (_, dependencies) in stages.items():
+        unknown = [x for x in dependencies if x not in stages]
+        if unknown:
+            raise ValueError(
+                name + " depends on unknown stages " + str(unknown)
+            )
+
+    pipeline_start = time.perf_counter()
+    remaining = dict(stages)
+    results = {}
+    timings = []
+    failed = set()
+
+    def add_timing(name, status, start_time=None, end_time=None):
+        record_stage(
+            name,
+            status,
+            None if start_time is None else end_time - start_time,
+        )
+
+        # Times are seconds from pipeline start
+        timings.append(
+            {
+                "stage": name,
+                "status": status,
+                "start": None
+                if start_time is None
+                else round(start_time - pipeline_start, 3),
+                "end": None
+                if end_time is None
+                else round(end_time - pipeline_start, 3),
+                "seconds": None
+                if start_time is None
+                else round(end_time - start_time, 3),
+            }
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(stages)) as executor:
+        pending = {}
+        while True:
+            # Skip stages downstream of a failure, repeat until no more
+            # stages are skipped so skips cascade
+            skipped = True
+            while skipped:
+                skipped = False
+                for name, (_, dependencies) in list(remaining.items()):
+                    if any(x in failed for x in dependencies):
+                        print("Skipping " + name + ", a dependency failed")
+                        add_timing(name, "skipped")
+                        failed.add(name)
+                        del remaining[name]
+                        skipped = True
+
+            # Submit every stage whose dependencies are done
+            for name, (func, dependencies) in list(remaining.items()):
+                if all(x in results for x in dependencies):
+                    future = executor.submit(
+                        run_timed,
+                        func,
+                        [results[x] for x in dependencies],
+                        name,
+                    )
+                    pending[future] = name
+                    del remaining[name]
+
+            if not pending:
+                break
+
+            # Record stages as they complete, then submit their dependents
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                result, error, start_time, end_time = future.result()
+                if error is None:
+                    results[name] = result
+                    add_timing(name, "done", start_time, end_time)
+                    print(
+                        "Finished "
+                        + name
+                        + " in "
+                        + str(round(end_time - start_time, 3))
+                        + "s"
+                    )
+                else:
+                    failed.add(name)
+                    add_timing(name, "failed", start_time, end_time)
+                    print("Failed " + name + ": " + repr(error))
+
+    # Stages left over depend on each other
+    if remaining:
+        raise ValueError("Dependency cycle between " + str(list(remaining)))
+
+    timings = pd.DataFrame(timings)
+    print(
+        "Pipeline finished in "
+        + str(round(time.perf_counter() - pipeline_start, 3))
+        + "s, "
+        + str(round(timings["seconds"].sum(), 3))
+        + "s of stage time"
+    )
+
+    return results, timings
+
+
+def write_dk_stage(*dk_parses):
+    """
+    Function to write every league's parsed odds on a pooled connection
+    Args:
+    *dk_parses (tuple): result of parse_league_team_odds() per league, in
+        DK_LEAGUES order
+    """
+    run_db_stage(update_team_odds, dict(zip(DK_LEAGUES, dk_parses)))
+
+
+def write_books_stage(book_leagues: list, *book_parses):
+    """
+    Function to write every book's odds to book_team_odds on a pooled
+    connection
+    Args:
+    book_leagues (list): (book, league) of each parse, in order
+    *book_parses (tuple): result of BookAdapter.parse() per book and
+        league
+    Returns:
+    book_odds_df (df): rows written, from create_book_odds_df()
+    """
+    book_league_odds = {}
+    for (book, league), book_parse in zip(book_leagues, book_parses):
+        book_league_odds.setdefault(book, {})[league] = book_parse
+
+    return run_db_stage(update_book_odds, book_league_odds)
+
+
+def scan_books_stage(book_odds_df):
+    """
+    Function to scan the books' odds for the best prices, arbitrage and
+    middles
+    Args:
+    book_odds_df (df): result of write_books_stage()
+    Returns:
+    scan (dict): result of scan_book_odds()
+    """
+    scan = scan_book_odds(book_odds_df)
+    print(
+        "Found "
+        + str(len(scan["arbitrage"]))
+        + " arbitrage and "
+        + str(len(scan["middles"]))
+        + " middles across "
+        + str(book_odds_df["bookSlug"].nunique())
+        + " books"
+    )
+
+    return scan
+
+
+def write_dk_props_stage(nba_team_game_lines_result, *subcategory_offers):
+    """
+    Function to write player props and alternate lines on a pooled
+    connection
+    Args:
+    nba_team_game_lines_result (tuple): result of get_team_game_lines()
+        for the NBA
+    *subcategory_offers (tuple): result of get_prop_offers() per market,
+        in DK_NBA_PROP_MARKETS order, then of get_alt_line_offers() per
+        market, in DK_NBA_ALT_LINE_MARKETS order
+    Returns:
+    row_counts (dict): table -> number of rows inserted or changed
+    """
+    nba_team_game_lines, nba_game_df, _ = nba_team_game_lines_result
+    prop_count = len(DK_NBA_PROP_MARKETS)
+
+    return run_db_stage(
+        update_nba_props,
+        dict(zip(DK_NBA_PROP_MARKETS, subcategory_offers[:prop_count])),
+        nba_team_game_lines,
+        nba_game_df,
+        alt_line_offers=dict(
+            zip(DK_NBA_ALT_LINE_MARKETS, subcategory_offers[prop_count:])
+        ),
+    )
+
+
+def fetch_game_logs_stage(
+    nba_header_data: dict, entity: str, measure_type: str, sync_dates
+):
+    """
+    Function to fetch game log result sets for the dates to sync
+    Args:
+    nba_header_data (dict): headers for NBA API request
+    entity (str): one of 'player', 'team'
+    measure_type (str): one of 'Advanced', '' (Base)
+    sync_dates (tuple): result of get_sync_game_log_dates()
+    Returns:
+    result_sets (list): (headers, rowSet) per window, empty if up to date
+    """
+    if sync_dates is None:
+        return []
+
+    return get_nba_api_game_log_result_sets(
+        nba_header_data, entity, measure_type, *sync_dates
+    )
+
+
+def write_game_logs_stage(entity: str, adv_result_sets, base_result_sets):
+    """
+    Function to write fetched game log result sets on a pooled connection
+    Args:
+    entity (str): one of 'player', 'team'
+    adv_result_sets (list): result sets with MeasureType=Advanced
+    base_result_sets (list): result sets with MeasureType=Base
+    Returns:
+    row_count (int): number of rows inserted or changed
+    """
+    # One transaction per window, same as backfill_nba_api_game_logs()
+    return sum(
+        run_db_stage(write_nba_api_game_logs, entity, adv, base)
+        for adv, base in zip(adv_result_sets, base_result_sets)
+    )
+
+
+def resolve_event_map_stage(*_):
+    """
+    Function to map DK NBA events to NBA API games on a pooled
+    connection, once both sides' events are written
+    Returns:
+    row_count (int): number of mappings inserted or changed
+    """
+    return run_db_stage(resolve_nba_event_map)
+
+
+def refresh_analytics_stage(*_):
+    """
+    Function to refresh beat rate analytics on a pooled connection, once
+    the odds, events and game logs it reads are written
+    Returns:
+    row_counts (dict): table -> number of rows inserted or changed
+    """
+    return run_db_stage(refresh_nba_beat_rate_analytics)
+
+
+def get_ingest_stages(nba_header_data: dict, archive=False):
+    """
+    Function to build the DraftKings + NBA API ingestion DAG
+    Args:
+    nba_header_data (dict): headers for NBA API request
+    archive (bool): also archive parsed DataFrames to Parquet, needs
+        configure_archive()
+    Returns:
+    stages (dict): stages for run_pipeline()
+    """
+    stages = {
+        # DraftKings API, one batched write for every league
+        "dk_write": (
+            write_dk_stage,
+            ["dk_parse_" + x.lower() for x in DK_LEAGUES],
+        ),
+        # NBA API, today's schedule
+        "nba_scoreboard": (partial(get_nba_games, nba_header_data), []),
+        "nba_events_write": (
+            partial(run_db_stage, update_nba_api_data),
+            ["nba_scoreboard"],
+        ),
+        # NBA API, game logs since the last loaded game date
+        "nba_sync_dates": (partial(run_db_stage, get_sync_game_log_dates), []),
+    }
+
+    # One fetch per DraftKings eventgroup
+    draftkings = BOOK_ADAPTERS["draftkings"]
+    for league in DK_LEAGUES:
+        stages["dk_fetch_" + league.lower()] = (
+            partial(draftkings.fetch, league),
+            [],
+        )
+        stages["dk_parse_" + league.lower()] = (
+            partial(draftkings.parse, league),
+            ["dk_fetch_" + league.lower()],
+        )
+
+    # Every book's odds per game, DraftKings' from its parse stages and
+    # one fetch and parse per league of other books, then scanned
+    book_leagues = [("draftkings", x) for x in DK_LEAGUES]
+    for book, adapter in BOOK_ADAPTERS.items():
+        if book == "draftkings":
+            continue
+        for league in adapter.leagues:
+            stages["book_" + book + "_" + league.lower()] = (
+                partial(adapter.get_team_odds, league),
+                [],
+            )
+            book_leagues.append((book, league))
+    stages["book_write"] = (
+        partial(write_books_stage, book_leagues),
+        [
+            "dk_parse_" + league.lower()
+            if book == "draftkings"
+            else "book_" + book + "_" + league.lower()
+            for book, league in book_leagues
+        ],
+    )
+    stages["book_scan"] = (scan_books_stage, ["book_write"])
+
+    # One fetch per player prop and alternate line market, written with
+    # the NBA main lines
+    for market in DK_NBA_PROP_MARKETS:
+        stages["dk_props_fetch_" + market] = (
+            partial(get_prop_offers, market),
+            [],
+        )
+    for market in DK_NBA_ALT_LINE_MARKETS:
+        stages["dk_alt_lines_fetch_" + market.lower()] = (
+            partial(get_alt_line_offers, market),
+            [],
+        )
+    stages["dk_props_write"] = (
+        write_dk_props_stage,
+        ["dk_fetch_nba"]
+        + ["dk_props_fetch_" + x for x in DK_NBA_PROP_MARKETS]
+        + ["dk_alt_lines_fetch_" + x.lower() for x in DK_NBA_ALT_LINE_MARKETS],
+    )
+
+    # One fetch per endpoint, one write per entity
+    for entity in ("team", "player"):
+        for measure_type in ("Advanced", ""):
+            stages[entity + "_logs_" + (measure_type or "Base").lower()] = (
+                partial(
+                    fetch_game_logs_stage, nba_header_data, entity, measure_type
+                ),
+                ["nba_sync_dates"],
+            )
+        stages[entity + "_logs_write"] = (
+            partial(write_game_logs_stage, entity),
+            [entity + "_logs_advanced", entity + "_logs_base"],
+        )
+
+    # DK event -> NBA game map, then outcomes and beat rates of games
+    # completed since the last refresh
+    stages["nba_event_map"] = (
+        resolve_event_map_stage,
+        ["dk_write", "nba_events_write"],
+    )
+    stages["analytics_refresh"] = (
+        refresh_analytics_stage,
+        ["nba_event_map", "team_logs_write"],
+    )
+
+    # Parquet archive, alongside the writes
+    if archive:
+        stages["dk_archive"] = (
+            archive_dk_stage,
+            ["dk_parse_" + x.lower() for x in DK_LEAGUES],
+        )
+        stages["nba_events_archive"] = (
+            archive_nba_events_stage,
+            ["nba_scoreboard"],
+        )
+        for entity in ("team", "player"):
+            stages[entity + "_logs_archive"] = (
+                partial(archive_game_logs, entity),
+                [entity + "_logs_advanced", entity + "_logs_base"],
+            )
+
+    return stages
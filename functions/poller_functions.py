@@ -0,0 +1,334 @@
+"""
+Functions to poll DraftKings odds and record line movement
+"""
+# Import packages
+import hashlib
+import json
+import time
+import pandas as pd
+from functions.db_functions import bulk_insert, run_db_stage, transaction
+from functions.extract_functions import extract_query
+from functions.metrics_functions import record_stage, stage_context
+from functions.dk_api_functions import (
+    DK_NBA_TEAM_LINE_COLUMNS,
+    DK_NBA_TEAM_ODDS_COLUMNS,
+    create_nba_team_odds_wide_df,
+    fix_team_slugs,
+    get_nba_team_game_lines,
+    parse_nba_team_odds,
+    to_eastern_wall_clock,
+    write_team_odds,
+)
+
+# Staging column types for dk_nba_team_odds_history, the snapshot's
+# columns plus capture time
+DK_NBA_TEAM_ODDS_HISTORY_COLUMNS = {
+    "eventId": "INT",
+    "teamType": "VARCHAR(4)",
+    "capturedAt": "TIMESTAMP WITH TIME ZONE",
+    **DK_NBA_TEAM_ODDS_COLUMNS,
+}
+
+# Latest history row per team row of events starting on or after a time
+DK_NBA_TEAM_LAST_LINES_QUERY = (
+    """
+    SELECT DISTINCT ON (h.eventId, h.teamType)
+        h.eventId AS "eventId",
+        h.teamType AS "teamType",
+"""
+    + ",\n".join(
+        ["        h." + x + ' AS "' + x + '"' for x in DK_NBA_TEAM_LINE_COLUMNS]
+    )
+    + """
+    FROM dk_nba_team_odds_history h
+    INNER JOIN dk_events e ON e.eventId = h.eventId
+    WHERE e.startDate >= %s
+    ORDER BY h.eventId, h.teamType, h.capturedAt DESC
+"""
+)
+
+# (minutes to the next tip-off, seconds between polls), first match wins
+POLL_INTERVALS = ((30, 5), (120, 15), (360, 60))
+
+# Seconds between polls when no game starts within POLL_INTERVALS
+IDLE_POLL_INTERVAL = 300
+
+
+# Functions
+def hash_event_offers(nba_team_game_lines):
+    """
+    Function to hash the odds of every event's offers
+    Args:
+    nba_team_game_lines (df): nba_team_game_lines from get_nba_team_game_lines()
+    Returns:
+    offer_hashes (dict): eventId -> hash of the event's offers
+    """
+    offer_hashes = {}
+    for event_offers in nba_team_game_lines["offerSubcategory"]["offers"]:
+        # Live/empty events have no offers
+        if not event_offers:
+            continue
+
+        # Only hash the fields that are stored, so changes to offer ids or
+        # display flags don't count as line movement
+        offer_key = [
+            [
+                offer.get("label"),
+                [
+                    [x.get("label"), x.get("oddsAmerican"), x.get("line")]
+                    for x in offer.get("outcomes", [])
+                ],
+            ]
+            for offer in event_offers
+        ]
+        offer_hashes[int(event_offers[0]["eventId"])] = hashlib.blake2b(
+            json.dumps(offer_key).encode(), digest_size=16
+        ).digest()
+
+    return offer_hashes
+
+
+def get_changed_event_ids(offer_hashes: dict, last_offer_hashes: dict):
+    """
+    Function to get the events whose offers changed since the last poll
+    Args:
+    offer_hashes (dict): hashes from hash_event_offers() for this poll
+    last_offer_hashes (dict): hashes from the last written poll
+    Returns:
+    changed_event_ids (set): eventIds that are new or changed
+    """
+    return {
+        event_id
+        for event_id, offer_hash in offer_hashes.items()
+        if last_offer_hashes.get(event_id) != offer_hash
+    }
+
+
+def get_team_lines(nba_team_odds_df):
+    """
+    Function to get the lines of each team row, comparable across polls
+    Args:
+    nba_team_odds_df (df): eventId, teamType and DK_NBA_TEAM_LINE_COLUMNS
+    Returns:
+    team_lines (dict): (eventId, teamType) -> tuple of lines, None where
+        missing
+    """
+    lines = nba_team_odds_df[DK_NBA_TEAM_LINE_COLUMNS].astype(object)
+    lines = lines.where(lines.notna(), None)
+
+    return {
+        (int(event_id), team_type): tuple(row)
+        for event_id, team_type, row in zip(
+            nba_team_odds_df["eventId"],
+            nba_team_odds_df["teamType"],
+            lines.itertuples(index=False, name=None),
+        )
+    }
+
+
+def get_last_team_lines(con, now=None):
+    """
+    Function to get the last appended lines of each team row of events
+    that haven't started, so a restarted poller doesn't append them again
+    Args:
+    con (connection): connection to SQL database
+    now (Timestamp): current time, default now
+    Returns:
+    team_lines (dict): result of get_team_lines()
+    """
+    # startDate is Eastern wall clock time labelled UTC, with a day of
+    # slack for games that started but are still listed
+    starts_from = to_eastern_wall_clock(
+        now or pd.Timestamp.now(tz="UTC")
+    ) - pd.Timedelta(days=1)
+
+    return get_team_lines(
+        extract_query(con, DK_NBA_TEAM_LAST_LINES_QUERY, (starts_from,))
+    )
+
+
+def get_poll_interval(nba_game_df, now=None):
+    """
+    Function to get the seconds to wait before the next poll, shorter as
+    the next tip-off approaches
+    Args:
+    nba_game_df (df): nba_game_df from get_nba_team_game_lines()
+    now (Timestamp): current time, default now
+    Returns:
+    poll_interval (int): seconds to wait
+    """
+    # No upcoming games -> poll slowly
+    if len(nba_game_df) == 0:
+        return IDLE_POLL_INTERVAL
+
+    # startDate is Eastern wall clock time from get_nba_team_game_lines(),
+    # so convert now the same way before comparing
+    now = to_eastern_wall_clock(now or pd.Timestamp.now(tz="UTC"))
+    minutes_to_tip = (
+        nba_game_df["startDate"].min() - now
+    ).total_seconds() / 60
+
+    for max_minutes, poll_interval in POLL_INTERVALS:
+        if minutes_to_tip <= max_minutes:
+            return poll_interval
+
+    return IDLE_POLL_INTERVAL
+
+
+def poll_nba_team_odds_once( #pylint: disable=too-many-locals
+    con, last_offer_hashes: dict, last_team_lines: dict = None
+):
+    """
+    Function to poll NBA team odds once, upserting the latest snapshot
+    and appending team rows whose lines changed to
+    dk_nba_team_odds_history
+    Args:
+    con (connection): connection to SQL database, in autocommit mode
+    last_offer_hashes (dict): hashes from the last poll, updated in place
+    last_team_lines (dict): lines last appended per team row, from
+        get_last_team_lines(), updated in place. None appends every row
+        of changed events
+    Returns:
+    nba_game_df (df): nba_game_df from get_nba_team_game_lines()
+    changed_count (int): number of team rows appended to history
+    """
+    if last_team_lines is None:
+        last_team_lines = {}
+
+    # Always revalidate, the poll interval already limits requests
+    nba_team_game_lines, nba_game_df, offer_length = get_nba_team_game_lines(
+        ttl=0
+    )
+
+    # No games -> forget hashes so memory doesn't grow across days
+    if offer_length == 0:
+        last_offer_hashes.clear()
+        last_team_lines.clear()
+        return nba_game_df, 0
+
+    # Only parse events whose offers changed
+    capture_time = pd.Timestamp.now(tz="UTC")
+    offer_hashes = hash_event_offers(nba_team_game_lines)
+    changed_event_ids = get_changed_event_ids(offer_hashes, last_offer_hashes)
+    team_lines = {}
+    changed_count = 0
+
+    if changed_event_ids:
+        changed_game_lines = {
+            "offerSubcategory": {
+                "offers": [
+                    x
+                    for x in nba_team_game_lines["offerSubcategory"]["offers"]
+                    if x and int(x[0]["eventId"]) in changed_event_ids
+                ]
+            }
+        }
+        nba_team_odds_df = create_nba_team_odds_wide_df(
+            nba_game_df, parse_nba_team_odds(changed_game_lines)
+        )
+        nba_team_odds_df["capturedAt"] = capture_time
+
+        # Only team rows whose lines moved since they were last appended,
+        # e.g. an away price moving doesn't append the home row
+        team_lines = get_team_lines(nba_team_odds_df)
+        changed_rows = [
+            last_team_lines.get(key) != lines
+            for key, lines in team_lines.items()
+        ]
+        changed_count = sum(changed_rows)
+
+        # Slugs are looked up before the transaction, the lookup uses
+        # the same connection
+        fixed_game_df = fix_team_slugs(con, nba_game_df)
+
+        # Snapshot and history are written together, so history never
+        # has a line the snapshot doesn't
+        with transaction(con) as cursor:
+            write_team_odds(
+                cursor,
+                fixed_game_df,
+                {"dk_nba_team_odds": nba_team_odds_df},
+            )
+            if changed_count:
+                bulk_insert(
+                    cursor,
+                    "dk_nba_team_odds_history",
+                    nba_team_odds_df[changed_rows],
+                    DK_NBA_TEAM_ODDS_HISTORY_COLUMNS,
+                )
+
+    # Remember hashes and lines only after the write succeeded, so a
+    # failed poll is retried. Events no longer listed are dropped.
+    last_offer_hashes.clear()
+    last_offer_hashes.update(offer_hashes)
+    listed_team_lines = {
+        key: lines
+        for key, lines in {**last_team_lines, **team_lines}.items()
+        if key[0] in offer_hashes
+    }
+    last_team_lines.clear()
+    last_team_lines.update(listed_team_lines)
+
+    return nba_game_df, changed_count
+
+
+def run_odds_poller(max_polls=None, min_interval=None, pool=None):
+    """
+    Function to poll NBA team odds until interrupted
+    Args:
+    max_polls (int): stop after this many polls, default never
+    min_interval (float): fixed seconds between polls, default from
+        get_poll_interval()
+    pool (ThreadedConnectionPool): pool to use, default DB_POOL
+    """
+    # Lines already in history, so a restart only appends lines that
+    # moved while it was down
+    last_offer_hashes = {}
+    last_team_lines = run_db_stage(get_last_team_lines, pool=pool)
+    poll_count = 0
+    while max_polls is None or poll_count < max_polls:
+        start_time = time.perf_counter()
+        poll_count += 1
+
+        try:
+            # Pooled connection, so a dropped connection is replaced
+            with stage_context("odds_poll"):
+                nba_game_df, changed_count = run_db_stage(
+                    poll_nba_team_odds_once,
+                    last_offer_hashes,
+                    last_team_lines,
+                    retries=1,
+                    pool=pool,
+                )
+            record_stage(
+                "odds_poll", "done", time.perf_counter() - start_time
+            )
+            poll_interval = get_poll_interval(nba_game_df)
+            print(
+                "Poll "
+                + str(poll_count)
+                + ": "
+                + str(changed_count)
+                + " of "
+                + str(len(last_team_lines))
+                + " team lines changed in "
+                + str(round(time.perf_counter() - start_time, 3))
+                + "s"
+            )
+
+        except Exception as error: #pylint: disable=broad-exception-caught
+            # Keep polling through API/DB errors, retry on the tightest tier
+            print("Poll " + str(poll_count) + " failed: " + repr(error))
+            record_stage(
+                "odds_poll", "failed", time.perf_counter() - start_time
+            )
+            poll_interval = POLL_INTERVALS[0][1]
+
+        if min_interval is not None:
+            poll_interval = min_interval
+
+        # Sleep for the rest of the interval
+        if max_polls is None or poll_count < max_polls:
+            time.sleep(
+                max(0, poll_interval - (time.perf_counter() - start_time))
+            )
@@ -7,91 +7,68 @@ and updates the SQL database.
 import os
 import warnings
 # from dotenv import load_dotenv
-import psycopg2
-import pandas as pd
 
-# from functions.nba_api_functions import (
-#     get_nba_api_player_game_logs,
-#     get_nba_api_team_game_logs,
-#     get_nba_games,
-#     update_nba_api_data,
-# )
-from functions.dk_api_functions import (
-    get_nba_team_game_lines,
-    create_nba_team_odds_df,
-    update_nba_team_odds,
-)
+from functions.archive_functions import configure_archive
+from functions.db_functions import configure_db_pool
+from functions.http_functions import configure_response_cache
+from functions.metrics_functions import export_metrics, finish_run, start_run
+from functions.nba_api_functions import NBA_HEADER_DATA
+from functions.pipeline_functions import get_ingest_stages, run_pipeline
 
 warnings.filterwarnings("ignore")
 
 # Load environment variables
 # load_dotenv()
 
-# Set up SQL connection
-# Connect to DB
-# con = psycopg2.connect(os.environ["DATABASE_URL"])
-con = psycopg2.connect(
-   database="nba_odds", user='postgres', password='password',
-   host='127.0.0.1', port= '5432'
-)
+# Set up SQL connection pool from DATABASE_URL,
+# each stage checks out its own connection and transaction
+configure_db_pool()
+##
 
-# Create cursor
-cursor = con.cursor()
+# Cache API responses on disk,
+# RESPONSE_CACHE_OFFLINE=1 reprocesses from the cache without the network
+configure_response_cache(
+    os.environ.get("RESPONSE_CACHE_DIR", ".cache/http"),
+    offline=os.environ.get("RESPONSE_CACHE_OFFLINE") == "1",
+)
 
-# Auto commit
-con.autocommit = True
-##
+# Archive parsed DataFrames to Parquet for analysis when ARCHIVE_DIR is set
+archive_dir = os.environ.get("ARCHIVE_DIR")
+if archive_dir:
+    configure_archive(archive_dir)
 
 # Assign nba_header_data
-nba_header_data = {
-    "Connection": "keep-alive",
-    "Accept": "application/json, text/plain, */*",
-    "x-nba-stats-token": "true",
-    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_6) \
-        AppleWebKit/537.36 (KHTML, like Gecko) Chrome/79.0.3945.130 \
-            Safari/537.36",
-    "x-nba-stats-origin": "stats",
-    "Sec-Fetch-Site": "same-origin",
-    "Sec-Fetch-Mode": "cors",
-    "Referer": "https://stats.nba.com/",
-    "Accept-Encoding": "gzip, deflate, br",
-    "Accept-Language": "en-US,en;q=0.9",
-}
+nba_header_data = NBA_HEADER_DATA
 
 # --- INGEST DATA --- #
 
-# DraftKings API
-# Game df and team game lines
-nba_team_game_lines, nba_game_df, offer_length = get_nba_team_game_lines()
-
-# If offer length is 0, then there are no games today
-if offer_length > 0:
-
-    # Team Odds
-    nba_team_odds_df = pd.concat(
-        [
-            create_nba_team_odds_df(nba_team_game_lines, game)
-            for game in range(offer_length)
-        ],
-        axis=0,
-    )
-
-    # Update in SQL
-    update_nba_team_odds(cursor, nba_game_df, nba_team_odds_df, con)
-else:
-    print("No games today")
+# DraftKings and NBA API stages run concurrently, each write starts as
+# soon as the fetches it needs complete
+start_run()
+results, stage_timings = run_pipeline(
+    get_ingest_stages(nba_header_data, archive=bool(archive_dir))
+)
 
-# NBA API
-# Get today's schedule
-# nba_games_today = get_nba_games(nba_header_data)
+# Per stage timing
+print(stage_timings.to_string(index=False))
 
-# # get team game logs
-# nba_api_team_game_logs = get_nba_api_team_game_logs(nba_header_data)
+# --- METRICS --- #
 
-# # get player game logs
-# nba_api_player_game_logs = get_nba_api_player_game_logs(nba_header_data)
+# JSON run summary of latencies, bytes, rows and errors per stage
+run_summary = finish_run(
+    os.environ.get("INGEST_RUN_SUMMARY", ".cache/ingest_run_summary.json")
+)
+print(
+    "Run "
+    + run_summary["status"]
+    + " in "
+    + str(run_summary["seconds"])
+    + "s, failed stages: "
+    + str(run_summary["failed_stages"])
+)
 
-# # Update Data
-# update_nba_api_data(
-#     cursor, nba_games_today, nba_api_team_game_logs, nba_api_player_game_logs
-# )
+# Prometheus metrics for the node_exporter textfile collector
+# (METRICS_TEXTFILE) and/or a Pushgateway (METRICS_PUSHGATEWAY)
+export_metrics(
+    os.environ.get("METRICS_TEXTFILE"), os.environ.get("METRICS_PUSHGATEWAY")
+)
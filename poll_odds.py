@@ -0,0 +1,53 @@
+# --- SET UP --- #
+"""
+This script polls DraftKings NBA team odds until interrupted, keeping
+dk_nba_team_odds current and appending line movement to
+dk_nba_team_odds_history.
+
+Usage:
+    python poll_odds.py
+    python poll_odds.py --interval 5
+    python poll_odds.py --metrics-port 9108
+"""
+# Load libraries
+import argparse
+import warnings
+
+from functions.db_functions import configure_db_pool
+from functions.metrics_functions import start_metrics_server
+from functions.poller_functions import run_odds_poller
+
+warnings.filterwarnings("ignore")
+
+# Parse args
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument(
+    "--interval",
+    type=float,
+    default=None,
+    help="Fixed seconds between polls, default tightens near tip-off",
+)
+parser.add_argument("--max-polls", type=int, default=None)
+parser.add_argument(
+    "--metrics-port",
+    type=int,
+    default=None,
+    help="Serve Prometheus metrics on this port",
+)
+args = parser.parse_args()
+
+# Set up SQL connection pool from DATABASE_URL
+db_pool = configure_db_pool(maxconn=1)
+##
+
+# Expose poll latencies, requests and rows written for scraping
+if args.metrics_port is not None:
+    start_metrics_server(args.metrics_port)
+
+# --- POLL ODDS --- #
+try:
+    run_odds_poller(max_polls=args.max_polls, min_interval=args.interval)
+except KeyboardInterrupt:
+    print("Stopped polling")
+finally:
+    db_pool.closeall()